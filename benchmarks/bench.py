@@ -0,0 +1,200 @@
+# benchmarks/bench.py
+"""
+分阶段基准测试
+
+对每组语料分别计时 detect_encoding、读取解码、merge_lines、clean_text、
+章节切分、build_epub 以及端到端的 convert_txt，每个阶段取多次运行中的最短
+耗时。结果存为 JSON，可与基准结果对比，变慢超过阈值的阶段记为回归。
+
+用法::
+
+    # 默认语料，写出结果
+    python -m benchmarks.bench --output bench.json
+
+    # 指定语料：语言-编码-大小[-noisy]，noisy 表示折行 + 广告 + 乱码
+    python -m benchmarks.bench --case zh-gbk-10MB-noisy --case en-utf-8-100MB
+
+    # 与基准对比，有回归时退出码为 1
+    python -m benchmarks.bench --baseline bench.json --threshold 0.1
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple
+
+from utils import __version__
+from utils.txt_reader import detect_encoding, decode_bytes, merge_lines, clean_text, split_chapters
+from utils.epub_builder import build_epub
+from utils.converter import convert_txt
+from benchmarks.corpus import ENCODINGS, LANGS, corpus_name, generate_novel, parse_size, size_label
+
+DEFAULT_CASES = (
+    'zh-utf-8-1MB',
+    'zh-gbk-1MB-noisy',
+    'zh-gb2312-1MB',
+    'zh-big5-1MB-noisy',
+    'en-utf-8-1MB-noisy',
+)
+
+STAGES = ('detect_encoding', 'decode', 'merge_lines', 'clean_text', 'split_chapters', 'build_epub', 'end_to_end')
+
+# 短于此值的差异视为噪声，不记为回归
+MIN_DELTA = 0.005
+
+
+class Case(NamedTuple):
+    lang: str
+    encoding: str
+    size: int
+    noisy: bool
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Case':
+        parts = spec.split('-')
+        noisy = parts[-1] == 'noisy'
+        if noisy:
+            parts = parts[:-1]
+        if len(parts) < 3:
+            raise ValueError(f"语料格式应为 语言-编码-大小[-noisy]: {spec}")
+        lang, encoding, size = parts[0], '-'.join(parts[1:-1]), parts[-1]
+        if lang not in LANGS or encoding not in ENCODINGS:
+            raise ValueError(f"不支持的语料: {spec}（语言 {LANGS}，编码 {ENCODINGS}）")
+        return cls(lang, encoding, parse_size(size), noisy)
+
+    @property
+    def name(self) -> str:
+        return f"{self.lang}-{self.encoding}-{size_label(self.size)}{'-noisy' if self.noisy else ''}"
+
+
+def ensure_corpus(case: Case, corpus_dir: Path) -> Path:
+    """语料按参数命名缓存在 corpus_dir，已存在就直接复用"""
+    path = corpus_dir / corpus_name(case.size, case.lang, case.encoding, case.noisy)
+    if not path.is_file():
+        generate_novel(path, case.size, lang=case.lang, encoding=case.encoding,
+                       wrap=case.noisy, ads=case.noisy, garbage=case.noisy)
+    return path
+
+
+def _timed(func: Callable, *args, **kwargs):
+    gc.collect()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_case(path: Path, repeat: int, work_dir: Path) -> dict:
+    """分阶段跑 `repeat` 遍，每个阶段取最短耗时"""
+    best: Dict[str, float] = {}
+    chapters = []
+    for _ in range(repeat):
+        timings = {}
+        _, timings['detect_encoding'] = _timed(detect_encoding, path)
+        text, timings['decode'] = _timed(lambda: decode_bytes(path.read_bytes()))
+        text, timings['merge_lines'] = _timed(merge_lines, text)
+        text, timings['clean_text'] = _timed(clean_text, text)
+        chapters, timings['split_chapters'] = _timed(split_chapters, text, split_include_title=True)
+        del text
+        _, timings['build_epub'] = _timed(build_epub, path.stem, "基准测试", chapters, work_dir / 'staged.epub')
+        _, timings['end_to_end'] = _timed(convert_txt, path, work_dir / 'e2e.epub')
+        for stage, seconds in timings.items():
+            best[stage] = min(best.get(stage, seconds), seconds)
+
+    size = path.stat().st_size
+    return {
+        'bytes': size,
+        'chapters': len(chapters),
+        'stages': {stage: round(best[stage], 6) for stage in STAGES},
+        'mb_per_s': round(size / 1024 / 1024 / best['end_to_end'], 2),
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[tuple]:
+    """逐阶段对比，返回 (语料, 阶段, 基准耗时, 当前耗时, 变化比例, 是否回归)"""
+    rows = []
+    for name, case in current['cases'].items():
+        base_case = baseline.get('cases', {}).get(name)
+        if base_case is None:
+            continue
+        for stage in STAGES:
+            base = base_case['stages'].get(stage)
+            cur = case['stages'].get(stage)
+            if base is None or cur is None:
+                continue
+            change = cur / base - 1 if base > 0 else 0.0
+            regressed = change > threshold and cur - base > MIN_DELTA
+            rows.append((name, stage, base, cur, change, regressed))
+    return rows
+
+
+def print_results(results: dict) -> None:
+    header = f"{'语料':<24}" + "".join(f"{stage:>16}" for stage in STAGES) + f"{'MB/s':>10}"
+    print(header)
+    for name, case in results['cases'].items():
+        print(f"{name:<24}" + "".join(f"{case['stages'][stage]:>16.4f}" for stage in STAGES)
+              + f"{case['mb_per_s']:>10.2f}")
+
+
+def print_comparison(rows: List[tuple]) -> None:
+    print(f"\n{'语料':<24}{'阶段':<18}{'基准':>10}{'当前':>10}{'变化':>10}")
+    for name, stage, base, cur, change, regressed in rows:
+        flag = "  ← 回归" if regressed else ""
+        print(f"{name:<24}{stage:<18}{base:>10.4f}{cur:>10.4f}{change:>+10.1%}{flag}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="txt2epub 分阶段基准测试",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--case', action='append', dest='cases',
+                        help=f"语料：语言-编码-大小[-noisy]，可重复；默认 {', '.join(DEFAULT_CASES)}")
+    parser.add_argument('--corpus-dir', type=Path, default=Path(tempfile.gettempdir()) / 'txt2epub-corpus',
+                        help="语料缓存目录")
+    parser.add_argument('--repeat', type=int, default=3, help="每组语料运行次数，取最短耗时")
+    parser.add_argument('--output', type=Path, help="结果写入该 JSON 文件")
+    parser.add_argument('--baseline', type=Path, help="与该 JSON 基准对比")
+    parser.add_argument('--threshold', type=float, default=0.10, help="变慢超过该比例记为回归")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    cases = [Case.parse(spec) for spec in (args.cases or DEFAULT_CASES)]
+
+    results = {
+        'meta': {
+            'version': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'repeat': args.repeat,
+        },
+        'cases': {},
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for case in cases:
+            path = ensure_corpus(case, args.corpus_dir)
+            print(f"运行 {case.name} ({path.stat().st_size / 1024 / 1024:.1f} MB)……", file=sys.stderr)
+            results['cases'][case.name] = run_case(path, args.repeat, Path(work_dir))
+
+    print_results(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+        rows = compare(results, baseline, args.threshold)
+        print_comparison(rows)
+        regressions = sum(row[-1] for row in rows)
+        if regressions:
+            print(f"\n{regressions} 个阶段变慢超过 {args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/compression.py
+"""
+压缩档位基准
+
+用合成语料的章节直接生成 EPUB（不含读取、净化），对比各压缩档位（见
+`utils.epub_writer.COMPRESSION_PROFILES`）的生成耗时、吞吐量、文件大小，
+以及解压全部成员的耗时（阅读器打开各章的开销）。可附带一张随机字节的
+"封面"，模拟压不动的成员。
+
+用法::
+
+    python -m benchmarks.compression --size 20MB
+    python -m benchmarks.compression --size 20MB --lang en --jobs 4 --cover 512KB
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import List, Tuple
+
+from benchmarks.corpus import LANGS, NovelGenerator, parse_size
+from utils.epub_builder import build_epub
+from utils.epub_writer import COMPRESSION_PROFILES
+
+
+def make_chapters(size: int, lang: str) -> List[Tuple[str, str]]:
+    chapters = []
+    total = 0
+    for text in NovelGenerator(lang).chapters():
+        title, _, body = text.partition('\n')
+        chapters.append((title.strip(), body.strip()))
+        total += len(text.encode('utf-8'))
+        if total >= size:
+            return chapters
+
+
+def _read_all(path: Path) -> float:
+    gc.collect()
+    start = time.perf_counter()
+    with zipfile.ZipFile(path) as zf:
+        for name in zf.namelist():
+            zf.read(name)
+    return time.perf_counter() - start
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="txt2epub 压缩档位基准",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--size', default='20MB', help="正文大小")
+    parser.add_argument('--lang', choices=LANGS, default='zh')
+    parser.add_argument('--jobs', type=int, default=1, help="生成、压缩章节的进程数")
+    parser.add_argument('--cover', default='0', help="随机字节封面的大小，0 为不带封面")
+    parser.add_argument('--repeat', type=int, default=3, help="每个档位运行次数，取最短耗时")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    chapters = make_chapters(parse_size(args.size), args.lang)
+    mb = sum(len(body.encode('utf-8')) for _, body in chapters) / (1024 * 1024)
+    print(f"{len(chapters)} 章，正文 {mb:.1f}MB，{args.jobs} 个进程")
+    print(f"{'档位':>8}{'生成':>12}{'吞吐量':>14}{'EPUB 大小':>14}{'压缩率':>10}{'解压全部':>12}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        cover = None
+        cover_size = parse_size(args.cover)
+        if cover_size:
+            cover = Path(work_dir) / 'cover.jpg'
+            cover.write_bytes(os.urandom(cover_size))
+        for name in COMPRESSION_PROFILES:
+            path = Path(work_dir) / f"{name}.epub"
+            best = None
+            for _ in range(args.repeat):
+                gc.collect()
+                start = time.perf_counter()
+                build_epub("压缩基准", "基准测试", chapters, path, cover, workers=args.jobs, compression=name)
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            size = path.stat().st_size / (1024 * 1024)
+            print(f"{name:>8}{best * 1000:>10.0f}ms{mb / best:>10.0f}MB/s{size:>12.2f}MB"
+                  f"{size / mb:>10.1%}{_read_all(path) * 1000:>10.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# benchmarks/corpus.py
+"""
+确定性的合成小说语料生成器
+
+同样的参数（含 seed）总是生成逐字节相同的文件，便于不同机器、不同版本
+之间对比基准测试结果。按章节边生成边编码写盘，生成 1 GB 的文件也只占
+很少的内存。
+
+用法::
+
+    python -m benchmarks.corpus out.txt --size 10MB --lang zh --encoding gbk --wrap --ads --garbage
+"""
+import argparse
+import itertools
+import random
+from pathlib import Path
+from typing import Iterator, List
+
+# 常用汉字：简体取 GB2312 一级字，繁体取 Big5 常用字；生成时再按目标编码过滤一遍
+_ZH_SIMPLIFIED = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行"
+    "学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前"
+    "外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军"
+    "很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别"
+    "她手角期根论运农指几九区强放决西被干做必战先回则任取据处理世车风云剑气月光门师兄弟走笑声眼前身影心中却"
+)
+_ZH_TRADITIONAL = (
+    "的一是在不了有和人這中大為上個國我以要他時來用們生到作地於出就分對成會可主發年動同工也能下過子說產種面而方後多定行"
+    "學法所民得經十三之進著等部度家電力裡如水化高自二理起小物現實加量都兩體制機當使點從業本去把性好應開它合還因由其些然前"
+    "外天政四日那社義事平形相全表間樣與關各重新線內數正心反你明看原又麼利比或但質氣第向道命此變條只沒結解問意建月公無系軍"
+    "很情者最立代想已通並提直題黨程展五果料象員革位入常文總次品式活設及管特件長求老頭基資邊流路級少圖山統接知較將組見計別"
+    "她手角期根論運農指幾九區強放決西被幹做必戰先回則任取據處理世車風雲劍氣月光門師兄弟走笑聲眼前身影心中卻"
+)
+_EN_WORDS = (
+    "the of and to in he was that it his her with as had for she on at by but not they from be were which you this "
+    "have all one said there would their been so if when an into no out what more up could them than some very time "
+    "only other then now man over such little old before down great did any about well should much must made way back "
+    "know who night long through door light hand eyes room house face found thought shadow sword river city king road "
+    "silence morning winter voice letter window stranger garden battle mountain forest secret promise"
+).split()
+
+_ZH_DIGITS = "零一二三四五六七八九"
+
+# 与默认净化规则对应的广告行
+_ZH_ADS = (
+    "本书由{site}整理，更多好书请访问txt小说电子书下载",
+    "天才一秒记住本站地址：{site}，精彩小说无弹窗免费阅读！",
+    "请记住本书首发域名：{site}。第一时间更新",
+    "电脑站：{site} 手机站：m.{site} 最新最快",
+    "【推荐下，{site}追书真的好用",
+)
+_SITES = ("www.xiaoshuo.com", "book.example.net", "txt.sample.org", "read.demo.cc")
+
+# 常见乱码方块与私有区字符
+_GARBAGE = "□\ue000\ue5e5\uf8f5"
+
+LANGS = ('zh', 'en')
+ENCODINGS = ('utf-8', 'gbk', 'gb2312', 'big5')
+HEADING_STYLES = ('plain', 'mixed')
+
+
+def parse_size(text: str) -> int:
+    """解析 `1MB`、`500KB`、`1GB` 这样的大小"""
+    text = text.strip().upper()
+    for suffix, factor in (('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024), ('B', 1)):
+        if text.endswith(suffix):
+            return int(float(text[:-len(suffix)]) * factor)
+    return int(text)
+
+
+def zh_number(n: int) -> str:
+    """把正整数写成中文数字，如 1234 → 一千二百三十四"""
+    if n < 10:
+        return _ZH_DIGITS[n]
+    units = ((10000, "万"), (1000, "千"), (100, "百"), (10, "十"))
+    out = []
+    zero = False
+    for value, unit in units:
+        d, n = divmod(n, value)
+        if d:
+            if zero:
+                out.append("零")
+            out.append(zh_number(d) if value == 10000 else _ZH_DIGITS[d])
+            out.append(unit)
+            zero = False
+        elif out:
+            zero = True
+    if n:
+        if zero:
+            out.append("零")
+        out.append(_ZH_DIGITS[n])
+    text = "".join(out)
+    return text[1:] if text.startswith("一十") else text
+
+
+def roman(n: int) -> str:
+    table = ((1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+             (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I"))
+    out = []
+    for value, sym in table:
+        d, n = divmod(n, value)
+        out.append(sym * d)
+    return "".join(out)
+
+
+def _encodable(chars: str, encoding: str) -> List[str]:
+    result = []
+    for c in chars:
+        try:
+            c.encode(encoding)
+        except UnicodeEncodeError:
+            continue
+        result.append(c)
+    return result
+
+
+class NovelGenerator:
+    """
+    按章节产出小说文本
+
+    :param lang: 'zh' 或 'en'
+    :param encoding: 目标编码，决定可用的字符（Big5 用繁体，其余用简体）
+    :param wrap: 把段落硬折成 30~40 字一行，模拟需要 `merge_lines` 的文本
+    :param ads: 在段落之间插入广告行（简体广告，目标编码表示不了的跳过）
+    :param garbage: 在正文中插入乱码方块和私有区字符（目标编码能表示的部分）
+    :param headings: 'plain' 只用"第N章"/"Chapter N"；'mixed' 混用多种标题写法并插入卷标题
+    """
+
+    def __init__(self, lang: str = 'zh', encoding: str = 'utf-8', *, wrap: bool = False, ads: bool = False,
+                 garbage: bool = False, headings: str = 'mixed', seed: int = 0):
+        if lang not in LANGS:
+            raise ValueError(f"不支持的语言: {lang}")
+        if headings not in HEADING_STYLES:
+            raise ValueError(f"不支持的标题风格: {headings}")
+        self.lang = lang
+        self.encoding = encoding
+        self.wrap = wrap
+        self.ads = ads
+        self.headings = headings
+        self.rng = random.Random(seed)
+        self.traditional = encoding.lower().replace('-', '') == 'big5'
+        self.chars = _encodable(_ZH_TRADITIONAL if self.traditional else _ZH_SIMPLIFIED, encoding)
+        self.garbage = _encodable(_GARBAGE, encoding) if garbage else []
+        # 广告用简体写成，目标编码表示不了（如 Big5）的不插入
+        self.ad_lines = [ad for ad in _ZH_ADS if len(_encodable(ad.format(site=''), encoding)) == len(ad.format(site=''))]
+
+    def front_matter(self) -> str:
+        """书名、作者等开头内容（第一个标题之前的部分）"""
+        if self.lang == 'en':
+            return "A Synthetic Novel\nby Benchmark\n\n"
+        return "合成測試小說\n作者：基準測試\n\n" if self.traditional else "合成测试小说\n作者：基准测试\n\n"
+
+    def chapters(self) -> Iterator[str]:
+        """无限产出章节文本（含标题行，以换行结尾）"""
+        if self.headings == 'mixed':
+            yield ("楔子\n" if self.lang == 'zh' else "Prologue\n") + self._body(self.rng.randint(5, 15))
+        n = 0
+        while True:
+            n += 1
+            if self.headings == 'mixed' and n % 50 == 1:
+                volume = n // 50 + 1
+                yield (f"第{zh_number(volume)}卷 {self._title()}\n" if self.lang == 'zh'
+                       else f"Book {volume}\n")
+            yield self._heading(n) + "\n" + self._body(self.rng.randint(20, 60))
+
+    def _heading(self, n: int) -> str:
+        title = self._title()
+        if self.lang == 'en':
+            if self.headings == 'plain':
+                return f"Chapter {n} {title}"
+            return self.rng.choice((f"Chapter {n}: {title}", f"CHAPTER {roman(n)}", f"Chapter {n}",
+                                    f"Part {n} - {title}"))
+        if self.headings == 'plain':
+            return f"第{n}章 {title}"
+        # 繁体的"節"不在章节正则里，Big5 语料只用"章"、"回"
+        section = "章" if self.traditional else "节"
+        return self.rng.choice((f"第{n}章 {title}", f"第{zh_number(n)}章 {title}", f"第{zh_number(n)}回 {title}",
+                                f"  第{n}章　{title}", f"第{n}{section} {title}"))
+
+    def _title(self) -> str:
+        if self.lang == 'en':
+            return " ".join(self.rng.choice(_EN_WORDS).capitalize() for _ in range(self.rng.randint(2, 4)))
+        return "".join(self.rng.choices(self.chars, k=self.rng.randint(2, 6)))
+
+    def _body(self, paragraphs: int) -> str:
+        lines = []
+        for _ in range(paragraphs):
+            para = self._paragraph()
+            if self.wrap:
+                width = self.rng.randint(30, 40) if self.lang == 'zh' else self.rng.randint(60, 80)
+                lines.extend(para[i:i + width] for i in range(0, len(para), width))
+            else:
+                lines.append(para)
+            if self.ads and self.ad_lines and self.rng.random() < 0.05:
+                lines.append(self.rng.choice(self.ad_lines).format(site=self.rng.choice(_SITES)))
+            if self.rng.random() < 0.3:
+                lines.append("")
+        return "\n".join(lines) + "\n"
+
+    def _paragraph(self) -> str:
+        rng = self.rng
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            if self.lang == 'en':
+                words = [rng.choice(_EN_WORDS) for _ in range(rng.randint(6, 18))]
+                sentence = " ".join(words).capitalize() + rng.choice(".!?")
+            else:
+                clauses = ["".join(rng.choices(self.chars, k=rng.randint(4, 12))) for _ in range(rng.randint(1, 3))]
+                sentence = "，".join(clauses) + rng.choice("。。。！？")
+                if rng.random() < 0.15:
+                    sentence = "“" + sentence + "”"
+            if self.garbage and rng.random() < 0.05:
+                pos = rng.randint(0, len(sentence))
+                sentence = sentence[:pos] + rng.choice(self.garbage) + sentence[pos:]
+            sentences.append(sentence)
+        if self.lang == 'en':
+            return " ".join(sentences)
+        return "　　" + "".join(sentences)
+
+
+def generate_novel(
+        path: Path,
+        size: int,
+        *,
+        lang: str = 'zh',
+        encoding: str = 'utf-8',
+        wrap: bool = False,
+        ads: bool = False,
+        garbage: bool = False,
+        headings: str = 'mixed',
+        seed: int = 0,
+) -> int:
+    """生成约 `size` 字节（按整章截止，略超出）的小说写入 `path`，返回实际字节数"""
+    generator = NovelGenerator(lang, encoding, wrap=wrap, ads=ads, garbage=garbage, headings=headings, seed=seed)
+    written = 0
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        for chunk in itertools.chain([generator.front_matter()], generator.chapters()):
+            data = chunk.encode(encoding)
+            f.write(data)
+            written += len(data)
+            if written >= size:
+                break
+    return written
+
+
+def size_label(size: int) -> str:
+    """1048576 → 1MB，用于文件名和结果里的语料名"""
+    for unit, factor in (('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024)):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return f"{size}B"
+
+
+def corpus_name(size: int, lang: str, encoding: str, noisy: bool, seed: int = 0) -> str:
+    """语料文件名，包含全部生成参数，便于缓存复用"""
+    return f"{lang}-{encoding}-{size_label(size)}{'-noisy' if noisy else ''}-s{seed}.txt"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="生成确定性的合成小说语料")
+    parser.add_argument('output', type=Path, help="输出 TXT 路径")
+    parser.add_argument('--size', default='1MB', help="目标大小，如 1MB、100MB、1GB")
+    parser.add_argument('--lang', choices=LANGS, default='zh')
+    parser.add_argument('--encoding', choices=ENCODINGS, default='utf-8')
+    parser.add_argument('--wrap', action='store_true', help="硬折行")
+    parser.add_argument('--ads', action='store_true', help="插入广告行")
+    parser.add_argument('--garbage', action='store_true', help="插入乱码与私有区字符")
+    parser.add_argument('--headings', choices=HEADING_STYLES, default='mixed', help="章节标题风格")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    written = generate_novel(args.output, parse_size(args.size), lang=args.lang, encoding=args.encoding,
+                             wrap=args.wrap, ads=args.ads, garbage=args.garbage, headings=args.headings,
+                             seed=args.seed)
+    print(f"{args.output}: {written} 字节")
+
+
+if __name__ == "__main__":
+    main()
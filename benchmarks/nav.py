@@ -0,0 +1,98 @@
+# benchmarks/nav.py
+"""
+目录解析基准
+
+阅读器每次打开书都要解析导航页（nav.xhtml）和 NCX。这里用极短的正文
+生成只有目录有分量的 EPUB，分别按一层目录和分层目录（见
+`utils.toc.build_toc`）写出，对比两个目录文件的大小、完整解析的耗时，
+以及第一层的条目数（阅读器打开目录时要展示的数量）。
+
+用法::
+
+    python -m benchmarks.nav --chapters 1000 5000 20000
+    python -m benchmarks.nav --chapters 5000 --volume-every 400   # 每 400 章一个"第X卷"
+"""
+import argparse
+import gc
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import List
+from xml.etree import ElementTree
+
+from utils.epub_writer import StreamingEpubWriter
+from utils.toc import TOC_GROUP_SIZE
+
+_XHTML = '{http://www.w3.org/1999/xhtml}'
+_NCX = '{http://www.daisy.org/z3986/2005/ncx/}'
+
+
+def make_titles(count: int, volume_every: int = 0) -> List[str]:
+    titles = []
+    for idx in range(1, count + 1):
+        if volume_every and idx % volume_every == 1:
+            titles.append(f"第{idx // volume_every + 1}卷 风云再起")
+        titles.append(f"第{idx}章 标题{idx}")
+    return titles
+
+
+def write_book(path: Path, titles: List[str], toc_group_size: int) -> None:
+    with StreamingEpubWriter(path, "目录基准", "基准测试", toc_group_size=toc_group_size) as writer:
+        for title in titles:
+            writer.add_chapter(title, "正文。")
+
+
+def _best_parse(data: bytes, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        ElementTree.fromstring(data)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def measure(path: Path, repeat: int) -> dict:
+    with zipfile.ZipFile(path) as zf:
+        nav = zf.read('EPUB/nav.xhtml')
+        ncx = zf.read('EPUB/toc.ncx')
+    top_ol = ElementTree.fromstring(nav).find(f'.//{_XHTML}nav/{_XHTML}ol')
+    nav_map = ElementTree.fromstring(ncx).find(f'{_NCX}navMap')
+    return {
+        'nav_bytes': len(nav),
+        'ncx_bytes': len(ncx),
+        'nav_parse': _best_parse(nav, repeat),
+        'ncx_parse': _best_parse(ncx, repeat),
+        'top_level': len(top_ol),
+        'ncx_top_level': len(nav_map),
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="txt2epub 目录解析基准",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--chapters', type=int, nargs='+', default=[1000, 5000, 20000], help="章节数，可给多个")
+    parser.add_argument('--volume-every', type=int, default=0, help="每这么多章插入一个卷标题，0 为没有卷")
+    parser.add_argument('--group-size', type=int, default=TOC_GROUP_SIZE, help="分层目录每组的章节数")
+    parser.add_argument('--repeat', type=int, default=5, help="每个文件解析次数，取最短耗时")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    print(f"{'章节数':>8}{'目录':>6}{'nav 大小':>12}{'NCX 大小':>12}{'nav 解析':>12}{'NCX 解析':>12}{'第一层':>8}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for count in args.chapters:
+            titles = make_titles(count, args.volume_every)
+            for label, group_size in (('一层', 0), ('分层', args.group_size)):
+                path = Path(work_dir) / f"{count}-{label}.epub"
+                write_book(path, titles, group_size)
+                row = measure(path, args.repeat)
+                print(f"{count:>8}{label:>6}{row['nav_bytes'] / 1024:>10.1f}KB{row['ncx_bytes'] / 1024:>10.1f}KB"
+                      f"{row['nav_parse'] * 1000:>10.2f}ms{row['ncx_parse'] * 1000:>10.2f}ms{row['top_level']:>8}")
+
+
+if __name__ == "__main__":
+    main()
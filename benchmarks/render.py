@@ -0,0 +1,111 @@
+# benchmarks/render.py
+"""
+章节渲染基准
+
+用合成语料拼出几 MB 的超长章节（每隔若干段插入一行含 `<`、`&` 的文字），
+对比几种把正文变成 XHTML 段落的写法：耗时、吞吐量，以及结果能否按 XML
+解析（不合法的标记阅读器只能交给容错的 HTML 解析器修补，甚至拒绝打开）。
+`--special-every 0` 时为不需要转义的纯文本。
+
+* 替换链：ebooklib 后端原来的 `<p>` + 换行替换成 `<p>`，段落不闭合、不转义
+* 逐行转义：stream 后端原来的逐行 `html.escape` 再拼接
+* 整章渲染：`utils.epub_writer.render_chapter_body`
+
+用法::
+
+    python -m benchmarks.render --size 1MB 4MB 16MB
+    python -m benchmarks.render --size 4MB --lang en --special-every 0
+"""
+import argparse
+import gc
+import time
+from html import escape
+from typing import Callable, List, Tuple
+from xml.etree import ElementTree
+
+from benchmarks.corpus import LANGS, NovelGenerator, parse_size
+from utils.epub_writer import render_chapter_body
+
+TITLE = "第1章 超长的一章"
+
+_SPECIAL_LINES = {
+    'zh': "若 a < b && b > c，则 <a> 与 &amp; 都应原样显示",
+    'en': "If a < b && b > c, then <a> and &amp; must show up as typed",
+}
+
+
+def make_body(size: int, lang: str, special_every: int = 200) -> str:
+    """拼出约 `size` 字节（UTF-8）的章节正文，每 `special_every` 段插入一行需要转义的文字（0 为不插入）"""
+    generator = NovelGenerator(lang)
+    lines: List[str] = []
+    total = 0
+    for chapter in generator.chapters():
+        for line in chapter.split('\n')[1:]:
+            if special_every and len(lines) % special_every == special_every - 1:
+                line = _SPECIAL_LINES[lang]
+            lines.append(line)
+            total += len(line.encode('utf-8')) + 1
+        if total >= size:
+            return '\n'.join(lines)
+
+
+def replace_chain(title: str, body: str) -> str:
+    return f"<p>{body.replace('　　', '').replace(chr(10), '<p>')}</p>"
+
+
+def per_line_escape(title: str, body: str) -> str:
+    return (f'<h2>{escape(title, quote=False)}</h2>'
+            + ''.join(f'<p>{escape(line, quote=False)}</p>' for line in body.replace('　　', '').split('\n')))
+
+
+RENDERERS: List[Tuple[str, Callable[[str, str], str]]] = [
+    ('替换链', replace_chain),
+    ('逐行转义', per_line_escape),
+    ('整章渲染', render_chapter_body),
+]
+
+
+def _best(func: Callable, *args, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def _well_formed(document: str) -> bool:
+    try:
+        ElementTree.fromstring(document)
+    except ElementTree.ParseError:
+        return False
+    return True
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="txt2epub 章节渲染基准",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--size', nargs='+', default=['1MB', '4MB', '16MB'], help="章节正文大小，可给多个")
+    parser.add_argument('--lang', choices=LANGS, default='zh')
+    parser.add_argument('--special-every', type=int, default=200,
+                        help="每这么多段插入一行含 < & > 的文字，0 为纯文本")
+    parser.add_argument('--repeat', type=int, default=5, help="每种写法的运行次数，取最短耗时")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    print(f"{'正文大小':>10}{'写法':>10}{'耗时':>12}{'吞吐量':>14}{'合法 XML':>10}")
+    for size_text in args.size:
+        body = make_body(parse_size(size_text), args.lang, args.special_every)
+        mb = len(body.encode('utf-8')) / (1024 * 1024)
+        for label, render in RENDERERS:
+            seconds = _best(render, TITLE, body, repeat=args.repeat)
+            valid = '是' if _well_formed(f'<body>{render(TITLE, body)}</body>') else '否'
+            print(f"{mb:>8.1f}MB{label:>10}{seconds * 1000:>10.1f}ms{mb / seconds:>10.0f}MB/s{valid:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""批量模式的任务收集与跳过判断"""
+import json
+import os
+from pathlib import Path
+
+from utils.batch import collect_jobs, is_up_to_date, run_batch
+
+
+def _last_two_parts(path):
+    return '/'.join(Path(path).parts[-2:])
+
+
+def test_colliding_outputs_are_reported_as_failures(tmp_path):
+    for name in ('a/book.txt', 'b/book.txt', 'a/other.txt'):
+        path = tmp_path / 'in' / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("第1章 开始\n正文。\n", encoding='utf-8')
+    out = tmp_path / 'out'
+    jobs = collect_jobs([str(tmp_path / 'in' / '*' / '*.txt')], out)
+    report = tmp_path / 'report.jsonl'
+
+    assert run_batch(jobs, workers=1, report_path=report) == 2
+    records = {_last_two_parts(rec['input']): rec
+               for rec in map(json.loads, report.read_text(encoding='utf-8').splitlines())}
+    assert records['a/book.txt']['status'] == records['b/book.txt']['status'] == 'failed'
+    assert records['a/other.txt']['status'] == 'ok'
+    assert not (out / 'book.epub').exists()
+
+
+def test_up_to_date_checks_volumes(tmp_path):
+    txt = tmp_path / 'book.txt'
+    txt.write_text("正文", encoding='utf-8')
+    output = tmp_path / 'book.epub'
+    assert not is_up_to_date(txt, output, volumes=True)
+
+    volumes = [tmp_path / 'book.vol1.epub', tmp_path / 'book.vol2.epub']
+    for path in volumes:
+        path.write_bytes(b'')
+    mtime = txt.stat().st_mtime
+    os.utime(volumes[0], (mtime + 10, mtime + 10))
+    os.utime(volumes[1], (mtime - 10, mtime - 10))
+    assert not is_up_to_date(txt, output, volumes=True)
+    os.utime(volumes[1], (mtime + 10, mtime + 10))
+    assert is_up_to_date(txt, output, volumes=True)
+    assert not is_up_to_date(txt, output)
@@ -0,0 +1,29 @@
+"""模板行识别与删除"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from utils.boilerplate import BoilerplateLine, boilerplate_rule, normalize_line, _key_pattern
+from utils.text_cleaner import CleanRuleSet
+
+
+def _rule_set(*texts):
+    lines = [BoilerplateLine(text, _key_pattern(normalize_line(text)), 10) for text in texts]
+    return CleanRuleSet([boilerplate_rule(lines)])
+
+
+def test_rule_removes_whole_lines_only():
+    rule_set = _rule_set("请收藏本站：www.example.com 最新章节")
+    text = ("他走了。\n  请收藏本站：www.other.org   最新章节 \n"
+            "她说请收藏本站：www.example.com 最新章节就好。\n下一段。")
+    assert rule_set.clean(text) == "他走了。\n她说请收藏本站：www.example.com 最新章节就好。\n下一段。"
+
+
+def test_sketch_slots_do_not_depend_on_hash_seed():
+    code = "from utils.boilerplate import CountMinSketch; print(CountMinSketch()._slots('请记住本书首发域名'))"
+    root = Path(__file__).resolve().parent.parent
+    outputs = {subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                              cwd=root, env={**os.environ, 'PYTHONHASHSEED': seed}).stdout
+               for seed in ('1', '2')}
+    assert len(outputs) == 1
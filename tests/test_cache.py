@@ -0,0 +1,37 @@
+"""转换缓存"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.cache import ConversionCache
+
+
+def test_concurrent_store_of_same_key(tmp_path):
+    # 多个写入者同时存同一个键：各自写临时文件再改名，不互相踩踏
+    output = tmp_path / 'book.epub'
+    output.write_bytes(b'epub' * 1000)
+    cache = ConversionCache(tmp_path / 'cache')
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for future in [pool.submit(cache.store, 'ab' * 32, output, {'chapters': n}) for n in range(32)]:
+            future.result()
+
+    meta = cache.fetch('ab' * 32, tmp_path / 'out.epub')
+    assert meta is not None and meta['output_bytes'] == 4000
+    assert (tmp_path / 'out.epub').read_bytes() == output.read_bytes()
+    assert not list((tmp_path / 'cache').glob('*/*.tmp'))
+
+
+def test_fetch_copies_entry(tmp_path):
+    # 命中时复制：刷新条目的修改时间不影响输出，改写输出也不影响缓存
+    output = tmp_path / 'book.epub'
+    output.write_bytes(b'epub' * 1000)
+    cache = ConversionCache(tmp_path / 'cache')
+    cache.store('cd' * 32, output, {'chapters': 1})
+    target = tmp_path / 'out.epub'
+    assert cache.fetch('cd' * 32, target) is not None
+    os.utime(target, (0, 0))
+
+    assert cache.fetch('cd' * 32, tmp_path / 'again.epub') is not None
+    assert target.stat().st_mtime == 0
+    target.write_bytes(b'changed')
+    assert cache.fetch('cd' * 32, tmp_path / 'third.epub') is not None
+    assert (tmp_path / 'third.epub').read_bytes() == output.read_bytes()
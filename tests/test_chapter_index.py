@@ -0,0 +1,96 @@
+"""章节索引与流式解析的切分一致性"""
+import functools
+
+import pytest
+
+from benchmarks.corpus import generate_novel
+from utils import chapter_index, incremental
+from utils.chapter_index import ChapterIndex
+from utils.incremental import scan_headings
+from utils.txt_reader import DecodedSegment, iter_chapters
+
+
+def _check_against_iter_chapters(path, encoding):
+    expected = list(iter_chapters(path, encoding))
+    index = ChapterIndex.build(path, encoding)
+
+    assert index.titles == [title for title, _ in expected]
+    assert list(index.iter_chapters()) == expected
+    if expected:
+        assert index.read_chapter(len(expected) - 1) == expected[-1]
+
+    size = path.stat().st_size
+    headings = scan_headings(path, 0, encoding, [DecodedSegment(0, size, encoding)])
+    # "前言"和没有标题的整本书不对应标题行；开头净化后为空时第一章从 0 开始，其余章节与标题行一一对应
+    offsets = [entry.offset for entry in index][index.titles[:1] in (["前言"], [""]):]
+    assert len(headings) == len(offsets) and headings[1:] == offsets[1:]
+
+
+@pytest.mark.parametrize('lang', ['en', 'zh'])
+@pytest.mark.parametrize('seed', range(4))
+def test_index_matches_iter_chapters_with_ads(tmp_path, lang, seed):
+    path = tmp_path / 'book.txt'
+    generate_novel(path, 200_000, lang=lang, wrap=True, ads=True, garbage=True, seed=seed)
+    _check_against_iter_chapters(path, 'utf-8')
+
+
+def test_ad_line_before_uppercase_heading(tmp_path):
+    # 广告行与 "CHAPTER III" 合并成一行，净化后从标题开始
+    path = tmp_path / 'book.txt'
+    path.write_text(
+        "CHAPTER I\nIt was late.\n"
+        "CHAPTER II\nHe left the house!\n"
+        "本书由某网站整理txt小说电子书下载\n"
+        "CHAPTER III\nThe road was long.\n",
+        encoding='utf-8')
+    _check_against_iter_chapters(path, 'utf-8')
+    assert len(ChapterIndex.build(path, 'utf-8')) == 3
+
+
+def test_ad_line_spanning_blocks(tmp_path, monkeypatch):
+    # 决定合并的行落在上一块时同样要跳过净化后为空的行
+    head = "CHAPTER I\nHe left the house!\n本书由某网站整理txt小说电子书下载\n"
+    path = tmp_path / 'book.txt'
+    path.write_text(head + "CHAPTER II\nThe road was long.\n", encoding='utf-8')
+    # 第一块恰好在广告行之后结束
+    blocks = functools.partial(chapter_index.iter_line_blocks, block_size=len(head.encode('utf-8')))
+    monkeypatch.setattr(chapter_index, 'iter_line_blocks', blocks)
+    monkeypatch.setattr(incremental, 'iter_line_blocks', blocks)
+    _check_against_iter_chapters(path, 'utf-8')
+    assert len(ChapterIndex.build(path, 'utf-8')) == 2
+
+
+@pytest.mark.parametrize('text', [
+    "本书由某网站整理txt小说电子书下载\n第1章 开始\n正文。\n第2章 结束\n正文。\n",
+    "\n  \n本书由某网站整理txt小说电子书下载\n\n第1章 开始\n正文。\n",
+    "本书由某网站整理txt小说电子书下载\n",
+    "本书由某网站整理txt小说电子书下载\n\n□\n",
+])
+def test_prefix_removed_by_cleaning_is_not_a_preface(tmp_path, text):
+    # 开头只有会被净化删掉的内容时，与 iter_chapters 一样没有"前言"
+    path = tmp_path / 'book.txt'
+    path.write_text(text, encoding='utf-8')
+    assert [title for title, _ in iter_chapters(path, 'utf-8')] == ChapterIndex.build(path, 'utf-8').titles
+    _check_against_iter_chapters(path, 'utf-8')
+
+
+@pytest.mark.parametrize('text', [
+    "第1章 开始\n正文。\n□CHAPTER V\n\n\n\n正文第二章 风",
+    "本书由某网站txt小说电子书下载Prologue\nchapter 6 x",
+])
+def test_heading_merged_with_unterminated_last_line(tmp_path, text):
+    # 合并到没有换行符的最后一行时，按合并后的整行判断是否仍是标题
+    path = tmp_path / 'book.txt'
+    path.write_text(text, encoding='utf-8')
+    _check_against_iter_chapters(path, 'utf-8')
+
+
+def test_heading_merge_spanning_blocks(tmp_path, monkeypatch):
+    # 标题行的续行落在下一块时，先补全整行再判断
+    head = "CHAPTER I\nHe left the house!\n□CHAPTER II\n"
+    path = tmp_path / 'book.txt'
+    path.write_text(head + "\n\n正文第二章 风\nThe road was long.\n", encoding='utf-8')
+    blocks = functools.partial(chapter_index.iter_line_blocks, block_size=len(head.encode('utf-8')))
+    monkeypatch.setattr(chapter_index, 'iter_line_blocks', blocks)
+    monkeypatch.setattr(incremental, 'iter_line_blocks', blocks)
+    _check_against_iter_chapters(path, 'utf-8')
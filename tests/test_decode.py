@@ -0,0 +1,73 @@
+"""混合编码文件的分段解码"""
+import random
+
+import pytest
+
+from benchmarks.corpus import NovelGenerator
+from utils.txt_reader import decode_bytes, iter_chapters, read_txt
+
+
+def _novel_text(size: int, encoding: str = 'gbk', seed: int = 0) -> str:
+    """约 `size` 个字符、目标编码能表示的小说文本（以换行结尾）"""
+    parts, n = [], 0
+    for chapter in NovelGenerator('zh', encoding, seed=seed).chapters():
+        parts.append(chapter)
+        n += len(chapter)
+        if n >= size:
+            return ''.join(parts)
+
+
+def _split_lines(text: str, rng: random.Random, low: int, high: int):
+    """把文本按行切成长度在 [low, high) 字符左右的几段"""
+    pos = 0
+    while pos < len(text):
+        end = text.find('\n', pos + rng.randint(low, high)) + 1 or len(text)
+        yield text[pos:end]
+        pos = end
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_alternating_gbk_and_utf8_segments(seed):
+    # 旧编码不能越过边界把其后的 UTF-8 解成乱码
+    rng = random.Random(seed)
+    text = _novel_text(1_200_000, seed=seed)
+    segments = list(_split_lines(text, rng, 50_000, 270_000))
+    raw = b''.join(seg.encode('gbk' if i % 2 == 0 else 'utf-8') for i, seg in enumerate(segments))
+
+    report = []
+    assert decode_bytes(raw, report) == text
+    assert [seg.encoding != 'utf-8' for seg in report] == [i % 2 == 0 for i in range(len(segments))]
+    assert report[-1].end == len(raw)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_short_gbk_run_before_utf8(seed):
+    # 只有一两 KB 的 GBK：检测不能把后面的 UTF-8 算进来
+    rng = random.Random(seed)
+    text = _novel_text(30_000, seed=seed)
+    lines = text.splitlines(keepends=True)
+    start = rng.randrange(len(lines) // 2)
+    gbk = ''.join(lines[start:start + rng.randint(2, 20)])
+    utf8 = ''.join(lines[start + 20:])
+    assert decode_bytes(gbk.encode('gbk') + utf8.encode('utf-8')) == gbk + utf8
+
+
+def test_big5_then_utf8():
+    text = _novel_text(200_000, 'big5', seed=1)
+    half = text.find('\n', len(text) // 2) + 1
+    report = []
+    assert decode_bytes(text[:half].encode('big5') + text[half:].encode('utf-8'), report) == text
+    assert [seg.encoding for seg in report] == ['big5', 'utf-8']
+
+
+def test_iter_chapters_on_mixed_file(tmp_path):
+    rng = random.Random(0)
+    text = _novel_text(600_000)
+    raw = b''.join(seg.encode('gbk' if i % 2 else 'utf-8')
+                   for i, seg in enumerate(_split_lines(text, rng, 20_000, 120_000)))
+    path = tmp_path / 'mixed.txt'
+    path.write_bytes(raw)
+    expected = tmp_path / 'expected.txt'
+    expected.write_text(text, encoding='utf-8')
+
+    assert list(iter_chapters(path)) == read_txt(expected, 'utf-8', split_include_title=True)
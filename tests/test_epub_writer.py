@@ -0,0 +1,28 @@
+"""章节 XHTML 渲染"""
+import zipfile
+import xml.etree.ElementTree as ET
+
+from utils.epub_writer import StreamingEpubWriter, escape_text, render_chapter_xhtml
+
+
+def test_escape_text_drops_xml_illegal_characters():
+    assert escape_text("a\x1ab\x08c\x00<d>&\te\n\r") == "abc&lt;d&gt;&amp;\te\n\r"
+
+
+def test_chapter_with_control_characters_is_well_formed():
+    xhtml = render_chapter_xhtml("第1章 开始\x08", "　　正文\x1a\n第二段\x0c")
+    root = ET.fromstring(xhtml.encode('utf-8'))
+    ns = {'x': 'http://www.w3.org/1999/xhtml'}
+    assert [p.text for p in root.iterfind('.//x:p', ns)] == ["正文", "第二段"]
+    assert root.find('.//x:h2', ns).text == "第1章 开始"
+
+
+def test_streaming_writer_output_is_well_formed(tmp_path):
+    path = tmp_path / 'book.epub'
+    with StreamingEpubWriter(path, "书名\x1a", "作者") as writer:
+        writer.add_chapter("第1章 开始\x1a", "正文\x1a")
+        writer.add_chapter("第2章 结束", "正文")
+    with zipfile.ZipFile(path) as zf:
+        for name in zf.namelist():
+            if name.endswith(('.xhtml', '.opf', '.ncx')):
+                ET.fromstring(zf.read(name))
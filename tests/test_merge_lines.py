@@ -0,0 +1,130 @@
+"""`merge_lines` 与改写前的实现逐字节一致"""
+import random
+import re
+
+import pytest
+
+from benchmarks.corpus import generate_novel
+from utils.txt_reader import _LineMerger, merge_lines
+
+
+def reference_merge_lines(text):
+    """改写前（逐行正则、字符串反复拼接）的 merge_lines，原样保留作对照"""
+    # 定义中英文标点符号集合
+    punctuation = r'[。！？.?!…」*”)）]'
+
+    # 定义章节标题模式
+    chapter_pattern = r"^\s*(?P<title>(?:第([零〇一二三四五六七八九十百千万\d]+|[IVXLCM]+)\s*[章节回卷部篇]|(?:Chapter|Section|Part|Book)\s+([IVXLCM]+|\d+)|(?:Prologue|Epilogue|Introduction|Preface|Foreword|Afterword|Appendix|Interlude|Prelude|Conclusion|Summary|Postscript)\b|序[章言]|前[言章]|引[言子]|楔子|尾声|后记|终章)[^\n]{0,50})"
+
+    # 将文本按行分割
+    lines = text.splitlines()
+    merged_lines = []
+    i = 0
+    n = len(lines)
+
+    while i < n:
+        current_line = lines[i].rstrip()  # 移除行尾空白字符
+
+        # 如果当前行是章节标题，单独保留
+        if re.match(chapter_pattern, current_line):
+            if merged_lines and merged_lines[-1]:  # 如果前一行不为空，添加一个空行
+                merged_lines.append("")
+            merged_lines.append(current_line)
+            merged_lines.append("")  # 章节标题后添加空行
+            i += 1
+            continue
+
+        # 如果是第一行
+        if len(merged_lines) == 0:
+            merged_lines.append(current_line)
+            i += 1
+            continue
+
+        # 检查前一行是否以标点符号结尾
+        previous_line = merged_lines[-1].rstrip()
+        previous_ends_with_punctuation = re.search(punctuation + r'\s*$', previous_line) is not None
+
+        # 如果前一行不以标点符号结尾，且当前行不为空，合并两行
+        if not previous_ends_with_punctuation and current_line:
+            # 但不要合并章节标题
+            if not re.match(chapter_pattern, current_line):
+                merged_lines[-1] += current_line
+                i += 1
+                continue
+
+        # 如果是空行，直接保留
+        if not current_line:
+            # 只有当前一行以标点结尾时才添加空行
+            if previous_ends_with_punctuation or not merged_lines[-1]:
+                merged_lines.append(current_line)
+            i += 1
+            continue
+        else:
+            merged_lines.append(current_line)
+            i += 1
+
+    # 重新构建文本，保留原有段落结构
+    return '\n'.join(merged_lines)
+
+
+# 随机拼出的行：标题、各种句末标点、空白、空行和换行符都要覆盖到
+_FRAGMENTS = (
+    "第1章 开始", "  第十二章　风起", "第三回", "第IV卷 远行", "Chapter 7", "CHAPTER II", "Part 3 - End",
+    "Prologue", "序章", "楔子", "尾声", "后记", "第", "章", "Chapter", "Chapters 3",
+    "正文", "他说", "走了。", "真的吗？", "好！", "The end.", "why?", "no!", "wait…", "「对」", "“是”",
+    "(括号)", "（全角）", "*", "a", "。", " ", "\t", "　　", "",
+)
+_NEWLINES = ("\n", "\n", "\n", "\r\n", "\r", "\n\n", " ")
+
+
+def _random_text(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(0, 60)):
+        line = "".join(rng.choice(_FRAGMENTS) for _ in range(rng.randint(0, 3)))
+        if rng.random() < 0.2:
+            line += rng.choice(" \t　")
+        parts.append(line + rng.choice(_NEWLINES))
+    text = "".join(parts)
+    return text if rng.random() < 0.8 else text.rstrip("\n")
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_reference_on_random_text(seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        text = _random_text(rng)
+        assert merge_lines(text) == reference_merge_lines(text)
+
+
+@pytest.mark.parametrize('options', [
+    dict(lang='zh'),
+    dict(lang='zh', wrap=True, ads=True, garbage=True),
+    dict(lang='zh', encoding='big5', wrap=True),
+    dict(lang='en'),
+    dict(lang='en', wrap=True, ads=True),
+])
+def test_matches_reference_on_corpus(tmp_path, options):
+    path = tmp_path / 'book.txt'
+    encoding = options.get('encoding', 'utf-8')
+    generate_novel(path, 300_000, **options)
+    text = path.read_text(encoding)
+    assert merge_lines(text) == reference_merge_lines(text)
+    crlf = text.replace("\n", "\r\n")
+    assert merge_lines(crlf) == reference_merge_lines(crlf)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_streaming_blocks_do_not_change_result(seed):
+    # 按任意位置分块送入，结果与整体合并相同
+    rng = random.Random(seed)
+    text = "".join(_random_text(rng) for _ in range(20))
+    lines = text.splitlines()
+    merger = _LineMerger()
+    merged = []
+    pos = 0
+    while pos < len(lines):
+        step = rng.randint(0, 7)
+        merged += merger.feed(lines[pos:pos + step])
+        pos += step
+    merged += merger.flush()
+    assert "\n".join(merged) == reference_merge_lines(text)
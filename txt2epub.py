@@ -1,27 +1,112 @@
 # txt2epub.py
 import argparse
+import re
 import sys
+from contextlib import nullcontext
 from pathlib import Path
+from typing import List
 
 from utils.logger import setup_logger
-from utils.txt_reader import read_txt, detect_encoding
-from utils.epub_builder import build_epub
+from utils.text_cleaner import get_rule_set
+from utils.txt_reader import CHAPTER_REGEX, chapter_pattern
+from utils.epub_builder import BACKENDS, VolumeSplit
+from utils.epub_writer import COMPRESSION_PROFILES
+from utils.cover import COVER_MAX_SIZE
+from utils.toc import TOC_GROUP_SIZE
+from utils.spine import SpinePacking
+from utils.converter import convert_txt, detect_chapter_regex
+from utils.batch import collect_jobs, run_batch
+from utils.cache import ConversionCache, DEFAULT_CACHE_SIZE
+from utils.profiler import Profiler
+from utils.chapter_index import ChapterIndex
 
 log = setup_logger(__name__)
 
+
+def parse_cover_size(text: str) -> tuple[int, int] | None:
+    """封面分辨率上限：宽x高，0 表示原样嵌入"""
+    if text.strip() == '0':
+        return None
+    try:
+        width, height = (int(part) for part in text.lower().replace('×', 'x').split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"应为 宽x高（如 1600x2560）或 0: {text}") from None
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"宽和高须为正数: {text}")
+    return width, height
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="TXT → EPUB 转换工具（可打包为 .exe）",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument('input', type=Path, help="输入 TXT 文件路径")
-    parser.add_argument('output', type=Path, nargs='?', help="输出 EPUB 文件路径，默认同名 .epub")
+    parser.add_argument('input', help="输入 TXT 文件路径；批量模式下可为目录、通配符或 @清单文件")
+    parser.add_argument('output', type=Path, nargs='?',
+                        help="输出 EPUB 文件路径，默认同名 .epub；批量模式下为输出目录，默认写在 TXT 旁边")
     parser.add_argument('-t', '--title', help="EPUB 标题（默认文件名）")
     parser.add_argument('-a', '--author', default="作者未知", help="作者")
     parser.add_argument('-c', '--cover', type=Path, help="封面图片（JPG/PNG）")
+    parser.add_argument('--cover-size', type=parse_cover_size, default='x'.join(map(str, COVER_MAX_SIZE)),
+                        metavar='宽x高',
+                        help="封面缩小到这个分辨率以内并转为 JPEG（结果缓存在 --cache-dir 下的 covers 中，"
+                             "--no-cache 时不缓存）；0 为原样嵌入")
     parser.add_argument('-e', '--encoding', help="手动指定源文件编码 (如: utf-8, gbk, gb2312, big5)")
     parser.add_argument('-d', '--debug', action='store_true', help="调试模式，输出 DEBUG 级日志")
     parser.add_argument('--no-clean', action='store_true', help="禁用文本净化功能")
+    parser.add_argument('--strip-boilerplate', action='store_true',
+                        help="先扫描全文，删除在很多章节中重复出现的行（网站页脚、广告语等），并列出删除的内容")
+    parser.add_argument('--backend', choices=BACKENDS, default='stream',
+                        help="EPUB 生成后端：stream 边读边写、内存平稳；ebooklib 为参考实现")
+    parser.add_argument('--compression', choices=list(COMPRESSION_PROFILES), default='default',
+                        help="压缩档位：store 不压缩、最快；fast 低压缩级别，适合批量夜间任务；max 体积最小，适合归档（仅 stream 后端）")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="并行进程数：大文件按章节切成多段并行解析，章节并行生成、压缩（仅 stream 后端）")
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help="增量重建：复用上次输出中未变的章节，只解析新增、修改的部分（仅 stream 后端）")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="略去与前面某一章完全相同或仅有少量改动的重复章节，并列出略去的章节")
+    parser.add_argument('--toc-group-size', type=int, default=TOC_GROUP_SIZE,
+                        help="章节很多时目录分成两层：按卷分组，没有卷标题时每这么多章一组；0 为始终一层")
+    parser.add_argument('-l', '--list-chapters', action='store_true',
+                        help="只列出识别到的章节目录并检查章节序号，不生成 EPUB（索引缓存在 TXT 旁的 .chapters.idx）")
+
+    chapters = parser.add_argument_group("章节识别")
+    chapters.add_argument('--chapter-regex',
+                          help="章节标题正则，须含 (?P<title>...) 组；按 IGNORECASE、VERBOSE、MULTILINE 编译")
+    chapters.add_argument('--detect-chapters', action='store_true',
+                          help="采样识别章节标题格式（如【001】、001.、卷一 第3话），并输出可用于 --chapter-regex 的正则")
+
+    cache = parser.add_argument_group("转换缓存")
+    cache.add_argument('--no-cache', action='store_true', help="不读写转换缓存，总是重新生成")
+    cache.add_argument('--cache-dir', type=Path, help="缓存目录（默认 TXT2EPUB_CACHE_DIR 或用户缓存目录下的 txt2epub）")
+    cache.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+                       help="缓存容量上限（MB），超出时淘汰最久未用的条目")
+
+    volumes = parser.add_argument_group("分卷")
+    volumes.add_argument('--split-volumes', action='store_true',
+                         help="遇到\"第X卷\"\"第X部\"等卷标题时另起一册，输出 书名.vol01.epub、书名.vol02.epub……")
+    volumes.add_argument('--max-chapters', type=int, default=0, help="每册最多的章节数，0 为不限")
+    volumes.add_argument('--max-size', type=float, default=0, help="每册 EPUB 的大致上限（MB），0 为不限")
+
+    spine = parser.add_argument_group("章节文件")
+    spine.add_argument('--pack-size', type=int, default=0,
+                       help="把相邻的短章节合并成约这么大（KB）的 XHTML 文件，目录仍指向各章开头；0 为每章一个文件")
+    spine.add_argument('--max-file-size', type=int, default=0,
+                       help="单个 XHTML 文件的上限（KB），更长的章节在段落处拆开；0 为不拆")
+
+    profile = parser.add_argument_group("性能分析")
+    profile.add_argument('--profile', type=Path, nargs='?', const=True,
+                         help="统计各阶段耗时、吞吐量与内存峰值，输出表格并写入 JSON（默认 <输出>.profile.json）")
+    profile.add_argument('--profile-stage',
+                         help="对该阶段（如 clean_text、compress；all 为整个过程）运行 cProfile，"
+                              "写入 <输出>.<阶段>.pstats；隐含 --profile")
+
+    batch = parser.add_argument_group("批量模式")
+    batch.add_argument('-b', '--batch', action='store_true', help="批量转换目录、通配符或清单中的所有 TXT")
+    batch.add_argument('-w', '--workers', type=int, help="同时转换的文件数，默认 CPU 核数")
+    batch.add_argument('--report', type=Path, help="逐文件结果写入该 JSON Lines 报告")
+    batch.add_argument('--skip-up-to-date', action='store_true', help="跳过输出比输入新的文件")
 
     return parser.parse_args()
 
@@ -30,43 +115,171 @@ def main() -> None:
     args = parse_args()
     if args.debug:
         log.setLevel('DEBUG')
+        # 调试模式下逐条统计净化规则的命中次数
+        get_rule_set().profile = True
 
-    if not args.input.is_file():
-        log.error("输入文件不存在: %s", args.input)
+    if args.chapter_regex and args.detect_chapters:
+        log.error("--chapter-regex 与 --detect-chapters 不能同时使用")
         sys.exit(1)
+    if args.chapter_regex:
+        try:
+            valid = 'title' in chapter_pattern(args.chapter_regex).groupindex
+        except re.error as e:
+            log.error("章节正则无效: %s", e)
+            sys.exit(1)
+        if not valid:
+            log.error("章节正则须包含 (?P<title>...) 组")
+            sys.exit(1)
+    chapter_regex = args.chapter_regex or CHAPTER_REGEX
+
+    cache = None if args.no_cache else ConversionCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    split = VolumeSplit(args.split_volumes, max(args.max_chapters, 0), max(int(args.max_size * 1024 * 1024), 0))
+    packing = SpinePacking(max(args.pack_size, 0) * 1024, max(args.max_file_size, 0) * 1024)
+
+    if args.batch:
+        if args.list_chapters:
+            log.error("批量模式不支持 --list-chapters")
+            sys.exit(1)
+        if args.profile or args.profile_stage:
+            log.error("批量模式不支持 --profile，请对单个文件分析")
+            sys.exit(1)
+        main_batch(args, cache, split, packing, chapter_regex)
+        return
+
+    input_path = Path(args.input)
+    if not input_path.is_file():
+        log.error("输入文件不存在: %s", input_path)
+        sys.exit(1)
+
+    if args.list_chapters:
+        list_chapters(input_path, args, chapter_regex)
+        return
+
+    # 调试模式下取回实际使用的净化规则集（含模板行规则）的统计
+    clean_stats = [] if args.debug and not args.no_clean else None
+    profiler = None
+    if args.profile or args.profile_stage:
+        profiler = Profiler(cprofile_stage=args.profile_stage)
+    try:
+        with profiler or nullcontext():
+            result = convert_txt(
+                input_path,
+                args.output,
+                title=args.title,
+                author=args.author,
+                cover_img=args.cover,
+                encoding=args.encoding,
+                chapter_regex=chapter_regex,
+                clean=not args.no_clean,
+                backend=args.backend,
+                workers=args.jobs,
+                cache=cache,
+                incremental=args.incremental,
+                split=split,
+                packing=packing,
+                compression=args.compression,
+                cover_max_size=args.cover_size,
+                detect_chapters=args.detect_chapters,
+                strip_boilerplate=args.strip_boilerplate,
+                dedupe=args.dedupe,
+                toc_group_size=max(args.toc_group_size, 0),
+                log=log,
+                clean_stats=clean_stats,
+            )
+    except ValueError as e:
+        log.error("%s", e)
+        sys.exit(1)
+
+    if clean_stats:
+        log_clean_stats(clean_stats, args.jobs)
+    if profiler is not None:
+        write_profile(profiler, args, Path(result['output']))
+    if len(result['volumes']) > 1:
+        log.info("共 %d 册:", len(result['volumes']))
+        for path in result['volumes']:
+            log.info("  %s", path)
+    log.info("完成: %s", result['output'])
 
-    # 读取文本
-    if args.encoding:
-        enc = args.encoding
-        log.info("使用指定编码: %s", enc)
-    else:
-        log.info("检测文件编码……")
-        enc, confidence = detect_encoding(args.input)
-        log.info("检测到的文件编码: %s (置信度: %.2f)", enc, confidence)
 
-    log.info("读取文本……")
-    # 如果用户禁用了文本净化功能，则传入空列表作为clean_rules参数
-    clean_rules = [] if args.no_clean else None
-    lines = read_txt(args.input, enc, split_include_title=True, clean_rules=clean_rules)
+def write_profile(profiler: Profiler, args: argparse.Namespace, output_path: Path) -> None:
+    """输出性能分析表格，写出 JSON 报告（以及指定阶段的 cProfile 结果）"""
+    log.info("各阶段性能统计:\n%s", profiler.format_table())
+    json_path = args.profile if isinstance(args.profile, Path) else \
+        output_path.with_name(output_path.name + '.profile.json')
+    profiler.write_json(json_path)
+    log.info("性能分析报告: %s", json_path)
+    if args.profile_stage:
+        if args.profile_stage != 'all' and args.profile_stage not in profiler.stats:
+            log.warning("阶段 %s 没有执行，可选: %s", args.profile_stage, ', '.join(profiler.stats))
+        pstats_path = output_path.with_name(f"{output_path.name}.{args.profile_stage}.pstats")
+        profiler.write_pstats(pstats_path)
+        log.info("cProfile 结果: %s（可用 python -m pstats 查看）", pstats_path)
 
-    if not lines:
-        log.error("文件为空或无法读取文本")
+
+def list_chapters(input_path: Path, args: argparse.Namespace, chapter_regex: str) -> None:
+    """按章节索引输出目录：序号、标题、字数、字节偏移；序号有问题的章节另行提示"""
+    if args.detect_chapters:
+        chapter_regex = detect_chapter_regex(input_path, args.encoding, chapter_regex, log)
+    try:
+        index = ChapterIndex.open(input_path, args.encoding, chapter_regex=chapter_regex,
+                                  clean_rules=[] if args.no_clean else None)
+    except ValueError as e:
+        log.error("%s", e)
         sys.exit(1)
+    for entry in index:
+        print(f"{entry.number:>6}  {entry.title}  （{entry.chars} 字，偏移 {entry.offset}）")
+    log.info("共 %d 章", len(index))
+    for number, title, problem in index.check_sequence():
+        log.warning("第 %d 项 %s：%s", number, title, problem)
+
 
-    # 生成 EPUB
-    title = args.title or args.input.stem
-    output_path = args.output or args.input.with_suffix('.epub')
+def main_batch(args: argparse.Namespace, cache: ConversionCache | None, split: VolumeSplit,
+               packing: SpinePacking, chapter_regex: str) -> None:
+    """批量模式：标题取各自文件名，其余选项对所有文件生效"""
+    jobs = collect_jobs([args.input], args.output)
+    if not jobs:
+        log.error("没有找到要转换的 TXT 文件")
+        sys.exit(1)
 
-    log.info("生成 EPUB…")
-    build_epub(
-        title=title,
+    failed = run_batch(
+        jobs,
+        workers=args.workers,
+        report_path=args.report,
+        skip_up_to_date=args.skip_up_to_date,
+        log=log,
         author=args.author,
-        chapters=lines,
-        output_path=output_path,
-        cover_img=args.cover
+        cover_img=args.cover,
+        encoding=args.encoding,
+        chapter_regex=chapter_regex,
+        detect_chapters=args.detect_chapters,
+        clean=not args.no_clean,
+        strip_boilerplate=args.strip_boilerplate,
+        dedupe=args.dedupe,
+        toc_group_size=max(args.toc_group_size, 0),
+        backend=args.backend,
+        chapter_workers=args.jobs,
+        cache=cache,
+        incremental=args.incremental,
+        split=split,
+        packing=packing,
+        compression=args.compression,
+        cover_max_size=args.cover_size,
     )
+    if failed:
+        log.error("%d 个文件转换失败", failed)
+        sys.exit(1)
+    log.info("批量转换完成")
+
 
-    log.info("完成: %s", output_path)
+def log_clean_stats(rows: List[dict], jobs: int) -> None:
+    """调试模式下输出每条净化规则的命中次数与所在扫描的耗时（`CleanRuleSet.stats` 的各行）"""
+    if jobs > 1:
+        log.debug("文本净化规则统计（-j %d 时净化主要在子进程中进行，以下只含主进程）:", jobs)
+    else:
+        log.debug("文本净化规则统计:")
+    for row in rows:
+        hits = "-" if row['hits'] is None else row['hits']
+        log.debug("  [%s] %-12s 命中 %-8s 扫描耗时 %.3fs", row['pass'], row['description'], hits, row['seconds'])
 
 
 if __name__ == "__main__":
@@ -1,7 +1,12 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import argparse
+import logging
+import queue
 import sys
+import threading
+import time
+from contextlib import nullcontext
 from pathlib import Path
 import os
 import ctypes
@@ -14,8 +19,10 @@ except Exception:
     pass
 
 from utils.logger import setup_logger
-from utils.txt_reader import read_txt, detect_encoding
-from utils.epub_builder import build_epub
+from utils.converter import ConversionCancelled, ConversionProgress, convert_txt
+from utils.cache import ConversionCache
+from utils.profiler import Profiler
+from utils.cover import PREVIEW_SIZE, cover_thumbnail
 
 # 尝试导入PIL用于图片处理
 try:
@@ -28,6 +35,16 @@ log = setup_logger(__name__)
 if not PIL_AVAILABLE:
     log.warning("未安装PIL库，封面预览功能将不可用")
 
+# 界面取出后台转换事件的间隔（毫秒）
+POLL_INTERVAL = 100
+
+# 进度栏显示的阶段名称（见 `utils.converter.ConversionProgress`）
+STAGE_LABELS = {
+    'detect': "识别章节格式",
+    'boilerplate': "扫描模板行",
+    'chapters': "读取并生成",
+}
+
 class Txt2EpubGUI:
     def __init__(self, root):
         self.root = root
@@ -57,6 +74,11 @@ class Txt2EpubGUI:
         self.encoding = tk.StringVar()
         self.debug_mode = tk.BooleanVar()
         self.disable_clean = tk.BooleanVar()  # 文本净化选项
+        self.disable_cache = tk.BooleanVar()  # 转换缓存选项
+        self.profile = tk.BooleanVar()  # 性能分析选项
+        self.detect_chapters = tk.BooleanVar()  # 自动识别章节格式
+        self.strip_boilerplate = tk.BooleanVar()  # 删除重复模板行
+        self.dedupe = tk.BooleanVar()  # 略去重复章节
         
         # 常见编码列表
         self.common_encodings = ['自动检测', 'UTF-8', 'GBK', 'GB2312', 'BIG5', 'UTF-16']
@@ -65,6 +87,13 @@ class Txt2EpubGUI:
         # 封面预览相关变量
         self.cover_image = None
         self.cover_photo = None
+
+        # 后台转换：工作线程把日志和进度放进队列，界面定时取出
+        self.events = queue.Queue()
+        self.worker = None
+        self.started = 0.0
+        self.cancel_event = threading.Event()
+        self.progress_status = tk.StringVar()
         
         self.create_widgets()
         self.configure_styles()
@@ -212,6 +241,23 @@ class Txt2EpubGUI:
         # 文本净化选项
         ttk.Checkbutton(options_frame, text="禁用文本净化", variable=self.disable_clean).grid(row=0, column=1, sticky=tk.W)
         
+        # 转换缓存选项
+        options_frame.columnconfigure(2, weight=1)
+        ttk.Checkbutton(options_frame, text="不使用缓存", variable=self.disable_cache).grid(row=0, column=2, sticky=tk.W)
+
+        # 性能分析选项
+        options_frame.columnconfigure(3, weight=1)
+        ttk.Checkbutton(options_frame, text="性能分析", variable=self.profile).grid(row=0, column=3, sticky=tk.W)
+
+        # 章节格式自动识别（如【001】、001.）
+        ttk.Checkbutton(options_frame, text="自动识别章节格式", variable=self.detect_chapters).grid(row=1, column=0, sticky=tk.W)
+
+        # 删除在很多章节中重复出现的行（网站页脚、广告语等）
+        ttk.Checkbutton(options_frame, text="删除重复模板行", variable=self.strip_boilerplate).grid(row=1, column=1, sticky=tk.W)
+
+        # 略去重复发布的章节
+        ttk.Checkbutton(options_frame, text="略去重复章节", variable=self.dedupe).grid(row=1, column=2, sticky=tk.W)
+        
         # 日志文本框
         ttk.Label(main_frame, text="处理日志:", style='Section.TLabel').grid(row=10, column=0, sticky=tk.W, pady=(20, 10))
         log_frame = ttk.Frame(main_frame)
@@ -224,10 +270,21 @@ class Txt2EpubGUI:
         self.log_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(1, 0), pady=1)
         log_scroll_y.grid(row=0, column=1, sticky=(tk.N, tk.S), padx=(0, 1), pady=1)
         
+        # 进度条：按读取源文件已到达的字节偏移占文件大小的比例显示
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.grid(row=12, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(10, 0))
+        progress_frame.columnconfigure(0, weight=1)
+        self.progress_bar = ttk.Progressbar(progress_frame, orient=tk.HORIZONTAL, mode='determinate', maximum=1.0)
+        self.progress_bar.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        ttk.Label(progress_frame, textvariable=self.progress_status).grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
+
         # 按钮框架
         button_frame = ttk.Frame(main_frame)
-        button_frame.grid(row=12, column=0, columnspan=3, pady=30)
-        ttk.Button(button_frame, text="开始转换", style='Action.TButton', command=self.convert).pack(side=tk.LEFT, padx=15)
+        button_frame.grid(row=13, column=0, columnspan=3, pady=30)
+        self.convert_button = ttk.Button(button_frame, text="开始转换", style='Action.TButton', command=self.convert)
+        self.convert_button.pack(side=tk.LEFT, padx=15)
+        self.cancel_button = ttk.Button(button_frame, text="取消转换", command=self.cancel, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=15)
         ttk.Button(button_frame, text="退出程序", command=self.root.quit).pack(side=tk.LEFT, padx=15)
         
         # 配置主框架的行权重
@@ -279,28 +336,15 @@ class Txt2EpubGUI:
             return
             
         try:
-            from PIL import Image, ImageTk
-            
             # 显示预览区域
             self.cover_preview_frame.grid()
             
-            # 打开并调整图片大小以适应预览区域
-            image = Image.open(image_path)
-            
-            # 计算合适的预览尺寸
-            max_width = 300
-            max_height = 200
-            
-            # 计算缩放比例
-            ratio = min(max_width/image.width, max_height/image.height)
-            new_width = int(image.width * ratio)
-            new_height = int(image.height * ratio)
-            
-            # 调整图片大小
-            resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            # 取缩小到预览区域大小的缩略图：按图片内容缓存在磁盘上，
+            # 再次选择同一张图时不再解码、缩放原图
+            thumbnail = cover_thumbnail(Path(image_path), PREVIEW_SIZE)
             
             # 转换为Tkinter可用的图片格式
-            self.cover_photo = ImageTk.PhotoImage(resized_image)
+            self.cover_photo = ImageTk.PhotoImage(thumbnail)
             
             # 更新预览标签
             self.cover_preview_label.configure(image=self.cover_photo)
@@ -312,76 +356,166 @@ class Txt2EpubGUI:
             self.cover_preview_frame.grid_remove()
             
     def log_message(self, message):
+        # 只在界面线程调用；重绘交给事件循环，不再每行强制刷新
         self.log_text.insert(tk.END, message + "\n")
         self.log_text.see(tk.END)
-        self.root.update_idletasks()
         
     def convert(self):
+        if self.worker is not None:
+            return
+        # 获取输入参数：Tk 变量只能在界面线程读取，先全部取出再交给工作线程
+        input_file = self.input_path.get()
+        if not input_file:
+            messagebox.showerror("错误", "请选择输入文件")
+            return
+
+        input_path = Path(input_file)
+        if not input_path.is_file():
+            messagebox.showerror("错误", f"输入文件不存在: {input_file}")
+            return
+
+        # 设置日志级别
+        if self.debug_mode.get():
+            log.setLevel('DEBUG')
+
+        self.log_message("=" * 50)
+        self.log_message("开始转换...")
+
+        # 使用用户选择的编码；自动检测时先尝试严格 UTF-8，失败时逐段检测编码
+        enc = None if self.selected_encoding.get() == '自动检测' else self.selected_encoding.get()
+
+        output_path = self.output_path.get() or str(input_path.with_suffix('.epub'))
+        output_path = Path(output_path)
+        options = dict(
+            title=self.title.get() or input_path.stem,
+            author=self.author.get(),
+            cover_img=Path(self.cover_path.get()) if self.cover_path.get() else None,
+            encoding=enc,
+            clean=not self.disable_clean.get(),
+            cache=None if self.disable_cache.get() else ConversionCache(),
+            detect_chapters=self.detect_chapters.get(),
+            strip_boilerplate=self.strip_boilerplate.get(),
+            dedupe=self.dedupe.get(),
+        )
+
+        self.cancel_event.clear()
+        self.progress_bar['value'] = 0
+        self.progress_status.set("准备中……")
+        self.convert_button.configure(state=tk.DISABLED)
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.started = time.perf_counter()
+        # 守护线程：转换途中退出程序时不等待
+        self.worker = threading.Thread(
+            target=self._run_conversion,
+            args=(input_path, output_path, options, self.profile.get()),
+            daemon=True,
+        )
+        self.worker.start()
+        self.root.after(POLL_INTERVAL, self.poll_events)
+
+    def cancel(self):
+        if self.worker is not None:
+            self.cancel_event.set()
+            self.cancel_button.configure(state=tk.DISABLED)
+            self.progress_status.set("正在取消，当前章节处理完后停止……")
+
+    def _run_conversion(self, input_path, output_path, options, profile):
+        """在工作线程中执行转换；日志、进度和结果都放进事件队列，不直接操作界面"""
+        # 转换过程中的日志同时显示在界面上
+        handler = _QueueHandler(self.events)
+        log.addHandler(handler)
+        profiler = Profiler() if profile else None
         try:
-            # 获取输入参数
-            input_file = self.input_path.get()
-            if not input_file:
-                messagebox.showerror("错误", "请选择输入文件")
-                return
-                
-            input_path = Path(input_file)
-            if not input_path.is_file():
-                messagebox.showerror("错误", f"输入文件不存在: {input_file}")
-                return
-                
-            # 设置日志级别
-            if self.debug_mode.get():
-                log.setLevel('DEBUG')
-                
-            # 检测编码
-            self.log_message("=" * 50)
-            self.log_message("开始转换...")
-            
-            # 使用用户选择的编码或自动检测
-            if self.selected_encoding.get() == '自动检测':
-                self.log_message("检测文件编码...")
-                enc, confidence = detect_encoding(input_path)
-                self.log_message(f"检测到的文件编码: {enc} (置信度: {confidence:.2f})")
-            elif self.selected_encoding.get():
-                enc = self.selected_encoding.get()
-                self.log_message(f"使用指定编码: {enc}")
-            else:
-                enc = self.encoding.get() or detect_encoding(input_path)[0]
-                self.log_message(f"文件编码: {enc}")
-            
-            # 读取文本
-            self.log_message("读取文本...")
-            # 如果用户禁用了文本净化功能，则传入空列表作为clean_rules参数
-            clean_rules = [] if self.disable_clean.get() else None
-            lines = read_txt(input_path, enc, split_include_title=True, clean_rules=clean_rules)
-            
-            if not lines:
-                self.log_message("文件为空或无法读取文本")
-                messagebox.showerror("错误", "文件为空或无法读取文本")
-                return
-                
-            # 生成 EPUB
-            title = self.title.get() or input_path.stem
-            output_path = self.output_path.get() or str(input_path.with_suffix('.epub'))
-            output_path = Path(output_path)
-            
-            self.log_message("生成 EPUB...")
-            cover_img = Path(self.cover_path.get()) if self.cover_path.get() else None
-            
-            build_epub(
-                title=title,
-                author=self.author.get(),
-                chapters=lines,
-                output_path=output_path,
-                cover_img=cover_img
-            )
-            
-            self.log_message(f"完成: {output_path}")
-            messagebox.showinfo("成功", f"EPUB文件已生成:{output_path}")
-            
+            with profiler or nullcontext():
+                convert_txt(
+                    input_path,
+                    output_path,
+                    log=log,
+                    progress=lambda p: self.events.put(('progress', p)),
+                    cancel=self.cancel_event,
+                    **options,
+                )
+        except ConversionCancelled:
+            self.events.put(('cancelled', None))
+            return
+        except ValueError as e:
+            self.events.put(('error', str(e)))
+            return
         except Exception as e:
-            self.log_message(f"转换过程中出错: {str(e)}")
-            messagebox.showerror("错误", f"转换过程中出错: {str(e)}")
+            self.events.put(('error', f"转换过程中出错: {str(e)}"))
+            return
+        finally:
+            log.removeHandler(handler)
+
+        if profiler is not None:
+            profile_path = output_path.with_name(output_path.name + '.profile.json')
+            profiler.write_json(profile_path)
+            self.events.put(('log', "各阶段性能统计:\n" + profiler.format_table()))
+            self.events.put(('log', f"性能分析报告: {profile_path}"))
+        self.events.put(('done', output_path))
+
+    def poll_events(self):
+        """取出工作线程积压的事件：日志逐条显示，进度只显示最新的一条"""
+        latest = None
+        finished = None
+        while True:
+            try:
+                kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'log':
+                self.log_message(payload)
+            elif kind == 'progress':
+                latest = payload
+            else:
+                finished = (kind, payload)
+        if latest is not None and not self.cancel_event.is_set():
+            self.show_progress(latest)
+        if finished is None:
+            self.root.after(POLL_INTERVAL, self.poll_events)
+            return
+
+        self.worker.join()
+        self.worker = None
+        self.convert_button.configure(state=tk.NORMAL)
+        self.cancel_button.configure(state=tk.DISABLED)
+        kind, payload = finished
+        if kind == 'done':
+            self.progress_bar['value'] = 1.0
+            self.progress_status.set(f"完成，用时 {time.perf_counter() - self.started:.1f} 秒")
+            self.log_message(f"完成: {payload}")
+            messagebox.showinfo("成功", f"EPUB文件已生成:{payload}")
+        elif kind == 'cancelled':
+            self.progress_status.set("已取消")
+            self.log_message("转换已取消")
+        else:
+            self.progress_status.set("转换失败")
+            self.log_message(payload)
+            messagebox.showerror("错误", payload)
+
+    def show_progress(self, progress: ConversionProgress):
+        if progress.stage != 'chapters':
+            self.progress_status.set(STAGE_LABELS[progress.stage] + "……")
+            return
+        mb = progress.read_bytes / (1024 * 1024)
+        total_mb = progress.input_bytes / (1024 * 1024)
+        seconds = max(time.perf_counter() - self.started, 1e-3)
+        # 读完文件后还要写目录、收尾，进度条在完成前停在接近满格处
+        self.progress_bar['value'] = min(progress.read_bytes / progress.input_bytes, 0.99) if progress.input_bytes else 0
+        self.progress_status.set(f"{STAGE_LABELS['chapters']}: {progress.chapters} 章，"
+                                 f"{mb:.1f} / {total_mb:.1f} MB，{mb / seconds:.1f} MB/s")
+
+
+class _QueueHandler(logging.Handler):
+    """把日志记录放进事件队列，由界面线程取出显示"""
+
+    def __init__(self, events: queue.Queue):
+        super().__init__()
+        self.events = events
+
+    def emit(self, record):
+        self.events.put(('log', record.getMessage()))
+
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,2 @@
+# utils/__init__.py
+__version__ = "0.1.0"
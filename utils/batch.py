@@ -0,0 +1,207 @@
+# utils/batch.py
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from utils.converter import convert_txt
+from utils.epub_builder import existing_volumes
+
+# 批量模式下每个输入的 (TXT 路径, EPUB 路径)
+Job = Tuple[Path, Path]
+
+
+def collect_jobs(specs: Iterable[str], output_dir: Path = None) -> List[Job]:
+    """把命令行给出的输入展开成转换任务
+
+    每个 spec 可以是：
+        * 目录        → 递归收集其中的 *.txt，输出保持相对目录结构
+        * 通配符      → 如 `books/*.txt`、`books/**/*.txt`
+        * @清单文件   → 每行一个路径或通配符，空行和 # 开头的行忽略
+        * 普通文件路径
+
+    output_dir 为空时 EPUB 写在 TXT 旁边；同一输入只转换一次。不同目录下
+    同名的文件可能对应同一个输出（见 `output_collisions`）
+    """
+    jobs: List[Job] = []
+    seen = set()
+    for base, path in _expand_specs(specs):
+        key = path.resolve()
+        if key in seen:
+            continue
+        seen.add(key)
+        if output_dir is None:
+            output_path = path.with_suffix('.epub')
+        elif base is not None:
+            output_path = output_dir / path.relative_to(base).with_suffix('.epub')
+        else:
+            output_path = output_dir / path.with_suffix('.epub').name
+        jobs.append((path, output_path))
+    return jobs
+
+
+def _expand_specs(specs: Iterable[str]) -> Iterable[Tuple[Path | None, Path]]:
+    """产出 (相对路径的基准目录, TXT 路径)；只有目录输入才有基准目录"""
+    for spec in specs:
+        spec = str(spec)
+        if spec.startswith('@'):
+            manifest = Path(spec[1:])
+            lines = manifest.read_text(encoding='utf-8-sig').splitlines()
+            entries = [ln.strip() for ln in lines if ln.strip() and not ln.lstrip().startswith('#')]
+            # 清单中的相对路径以清单所在目录为准
+            yield from _expand_specs(str(manifest.parent / e) if not Path(e).is_absolute() else e
+                                     for e in entries)
+        elif Path(spec).is_dir():
+            base = Path(spec)
+            for path in sorted(base.rglob('*')):
+                if path.is_file() and path.suffix.lower() == '.txt':
+                    yield base, path
+        elif glob.has_magic(spec):
+            for name in sorted(glob.glob(spec, recursive=True)):
+                if Path(name).is_file():
+                    yield None, Path(name)
+        else:
+            yield None, Path(spec)
+
+
+def output_collisions(jobs: List[Job]) -> Dict[Path, List[Path]]:
+    """输出路径相同的任务：{输出路径: [各个输入]}，只含多于一个输入的"""
+    by_output: Dict[str, List[Job]] = {}
+    for input_path, output_path in jobs:
+        key = os.path.normcase(os.path.abspath(output_path))
+        by_output.setdefault(key, []).append((input_path, output_path))
+    return {group[0][1]: [input_path for input_path, _ in group]
+            for group in by_output.values() if len(group) > 1}
+
+
+def is_up_to_date(input_path: Path, output_path: Path, volumes: bool = False) -> bool:
+    """
+    输出存在且修改时间不早于输入时视为最新；`volumes` 为 True 时看的是
+    分卷输出 book.volNN.epub，要有分册且每一册都不早于输入
+    """
+    try:
+        outputs = existing_volumes(output_path) if volumes else [output_path]
+        if not outputs:
+            return False
+        in_mtime = input_path.stat().st_mtime
+        return all(path.stat().st_mtime >= in_mtime for path in outputs)
+    except OSError:
+        return False
+
+
+def run_batch(
+        jobs: List[Job],
+        *,
+        workers: int = None,
+        chapter_workers: int = 1,
+        report_path: Path = None,
+        skip_up_to_date: bool = False,
+        log: logging.Logger = None,
+        **options,
+) -> int:
+    """在进程池里并发转换，逐个写出 JSON Lines 报告
+
+    每个工作进程只导入一次 ebooklib、charset_normalizer 等依赖，
+    之后连续处理多个文件。`chapter_workers` 是每个文件内部生成章节的进程数，
+    其余 `options` 原样传给 `convert_txt`。
+
+    输出路径相同的几个输入（不同目录下的同名文件写到同一个输出目录）互相
+    覆盖，无法判断该保留哪个，全部记为失败，不转换。
+
+    :return: 失败的文件数
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    options['workers'] = chapter_workers
+    cover_img = options.get('cover_img')
+    split = options.get('split')
+    volumes = split is not None and split.enabled
+    failed = 0
+
+    report = open(report_path, 'w', encoding='utf-8') if report_path else None
+    try:
+        collisions = output_collisions(jobs)
+        colliding = {input_path for inputs in collisions.values() for input_path in inputs}
+        for output_path, inputs in collisions.items():
+            for input_path in inputs:
+                others = ', '.join(str(other) for other in inputs if other != input_path)
+                failed += 1
+                _write_report(report, log, {
+                    'input': str(input_path), 'output': str(output_path), 'status': 'failed',
+                    'error': f"输出路径与 {others} 相同",
+                })
+
+        pending = []
+        for input_path, output_path in jobs:
+            if input_path in colliding:
+                continue
+            if skip_up_to_date and is_up_to_date(input_path, output_path, volumes) \
+                    and (cover_img is None or is_up_to_date(cover_img, output_path, volumes)):
+                _write_report(report, log, {
+                    'input': str(input_path), 'output': str(output_path), 'status': 'skipped',
+                })
+                continue
+            pending.append((input_path, output_path))
+
+        if log:
+            log.info("批量转换 %d 个文件（跳过 %d 个），进程数 %d",
+                     len(pending), len(jobs) - len(pending) - len(colliding),
+                     min(workers, len(pending)) if pending else 0)
+        if not pending:
+            return failed
+
+        if workers == 1:
+            results = (_convert_job(i, o, options) for i, o in pending)
+            for result in results:
+                failed += result['status'] == 'failed'
+                _write_report(report, log, result)
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+                futures = [pool.submit(_convert_job, i, o, options) for i, o in pending]
+                for future in as_completed(futures):
+                    result = future.result()
+                    failed += result['status'] == 'failed'
+                    _write_report(report, log, result)
+    finally:
+        if report:
+            report.close()
+    return failed
+
+
+def _convert_job(input_path: Path, output_path: Path, options: dict) -> dict:
+    """工作进程入口：转换一个文件，异常也转成报告记录，不让整批中断"""
+    start = time.perf_counter()
+    try:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        result = convert_txt(input_path, output_path, **options)
+    except Exception as e:
+        return {
+            'input': str(input_path),
+            'output': str(output_path),
+            'status': 'failed',
+            'seconds': round(time.perf_counter() - start, 3),
+            'error': f"{type(e).__name__}: {e}",
+        }
+
+    result['status'] = 'ok'
+    result['encodings'] = sorted({seg.encoding for seg in result.pop('decode_report')})
+    return result
+
+
+def _write_report(report, log: logging.Logger | None, result: dict) -> None:
+    if report:
+        report.write(json.dumps(result, ensure_ascii=False) + '\n')
+        report.flush()
+    if not log:
+        return
+    if result['status'] == 'ok':
+        log.info("完成 %s：%d 章，%.1f KB，%.2fs%s",
+                 result['input'], result['chapters'], result['output_bytes'] / 1024, result['seconds'],
+                 "（缓存）" if result['cached'] else "")
+    elif result['status'] == 'skipped':
+        log.info("跳过 %s：输出已是最新", result['input'])
+    else:
+        log.error("失败 %s：%s", result['input'], result['error'])
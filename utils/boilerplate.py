@@ -0,0 +1,169 @@
+# utils/boilerplate.py
+import hashlib
+import math
+import re
+from array import array
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from utils.txt_reader import CHAPTER_REGEX, _iter_text_blocks, chapter_pattern
+from utils.profiler import profiling, stage
+
+# 一行出现在不少于这个比例的章节中（且不少于 BOILERPLATE_MIN_CHAPTERS 章）时视为模板行
+BOILERPLATE_RATIO = 0.2
+BOILERPLATE_MIN_CHAPTERS = 5
+
+# 计数最小草图的尺寸：SKETCH_DEPTH 行 × SKETCH_WIDTH 个 32 位计数器（共 2MB），与文件大小无关
+SKETCH_WIDTH = 1 << 17
+SKETCH_DEPTH = 4
+
+# 最多跟踪的候选行数
+TOP_K = 256
+
+# 归一化后长度在这个范围内的行才参与统计：太短的（"……""嗯。"）常在正文里
+# 重复，太长的是正常段落
+_LINE_CHARS = (6, 200)
+
+# 归一化时把网址、数字换成占位符，"请记住本书首发域名：xxx.com"这类只有网址、
+# 数字不同的变体算作同一行
+_URL = re.compile(r'(?:https?://)?(?:[a-z0-9-]+\.)+[a-z]{2,}(?:/[^\s]*)?', re.IGNORECASE)
+_DIGITS = re.compile(r'\d+')
+_URL_MARK = '\x00'
+_DIGITS_MARK = '\x01'
+
+
+class BoilerplateLine(NamedTuple):
+    """一条重复出现的模板行"""
+    text: str       # 第一次见到的原文
+    pattern: str    # 删除它所用的正则片段（匹配各个变体）
+    chapters: int   # 估计出现的章节数（只会偏大）
+
+
+class CountMinSketch:
+    """
+    计数最小草图：`depth` 行计数器，每个键在每行对应一个计数器，估计值取
+    各行的最小值。采用保守更新（只增加等于最小值的计数器），估计值只会偏大，
+    偏差随计数器总数增加而减小；占用的内存固定
+    """
+
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH):
+        self.width = width
+        self._rows = [array('I', [0]) * width for _ in range(depth)]
+
+    def _slots(self, key: str) -> List[int]:
+        # 双重哈希：由一个 64 位哈希值派生出各行的下标。不用内置 hash()：
+        # 字符串哈希每个进程随机加盐，结果会随运行而变
+        h = int.from_bytes(hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(len(self._rows))]
+
+    def add(self, key: str) -> int:
+        """计数加一，返回新的估计值"""
+        slots = self._slots(key)
+        count = min(row[i] for row, i in zip(self._rows, slots)) + 1
+        for row, i in zip(self._rows, slots):
+            if row[i] < count:
+                row[i] = count
+        return count
+
+    def estimate(self, key: str) -> int:
+        return min(row[i] for row, i in zip(self._rows, self._slots(key)))
+
+
+def normalize_line(line: str) -> str:
+    """统计用的归一化：合并空白、转小写，网址、数字换成占位符"""
+    line = ' '.join(line.split()).lower()
+    return _DIGITS.sub(_DIGITS_MARK, _URL.sub(_URL_MARK, line))
+
+
+def scan_boilerplate(
+        file_path: Path,
+        encoding: Optional[str] = None,
+        *,
+        chapter_regex: str = CHAPTER_REGEX,
+        ratio: float = BOILERPLATE_RATIO,
+        min_chapters: int = BOILERPLATE_MIN_CHAPTERS,
+        top_k: int = TOP_K,
+) -> List[BoilerplateLine]:
+    """
+    扫描一遍全文，找出在很多章节里重复出现的行（网站页脚、"请记住本书首发
+    域名"的各种变体等），按出现的章节数从多到少返回
+
+    增量解码，按章节标题切分，统计的是合并之前的物理行：广告行往往不以标点
+    结尾，合并后会和下一段拼在一起，不再是独立的一行。每行归一化后在每章
+    只计一次。计数用 `CountMinSketch`，另外只保留估计值最大的约 `top_k` 个
+    候选，内存占用与文件大小无关。连续几行的模板块会逐行识别出来。
+    """
+    chapter_pat = chapter_pattern(chapter_regex)
+    sketch = CountMinSketch()
+    candidates: Dict[str, str] = {}  # 归一化的行 → 第一次见到的原文
+    min_chars, max_chars = _LINE_CHARS
+    chapters = 1
+    seen = set()  # 当前章节已计数的行
+
+    blocks = _iter_text_blocks(file_path, encoding, None)
+    try:
+        while True:
+            lines = next(blocks, None)
+            if lines is None:
+                break
+            with stage('boilerplate', sum(map(len, lines)) if profiling() else 0):
+                for line in lines:
+                    if len(line) > max_chars * 2:
+                        continue
+                    if chapter_pat.match(line):
+                        chapters += 1
+                        seen.clear()
+                        continue
+                    key = normalize_line(line)
+                    if not min_chars <= len(key) <= max_chars or key in seen:
+                        continue
+                    seen.add(key)
+                    if sketch.add(key) >= min_chapters:
+                        candidates.setdefault(key, line.strip())
+                        if len(candidates) > top_k * 2:
+                            candidates = _top(candidates, sketch, top_k)
+    finally:
+        blocks.close()
+
+    threshold = max(min_chapters, math.ceil(chapters * ratio))
+    found = []
+    for key, text in _top(candidates, sketch, top_k).items():
+        count = sketch.estimate(key)
+        if count >= threshold:
+            found.append(BoilerplateLine(text, _key_pattern(key), count))
+    found.sort(key=lambda b: -b.chapters)
+    return found
+
+
+def _top(candidates: Dict[str, str], sketch: CountMinSketch, k: int) -> Dict[str, str]:
+    """保留估计值最大的 k 个候选"""
+    ranked = sorted(candidates, key=sketch.estimate, reverse=True)[:k]
+    return {key: candidates[key] for key in ranked}
+
+
+def _key_pattern(key: str) -> str:
+    """由归一化的行生成正则片段：占位符还原为网址、数字的模式，空格匹配任意行内空白"""
+    parts = []
+    for ch in key:
+        if ch == _URL_MARK:
+            parts.append(_URL.pattern)
+        elif ch == _DIGITS_MARK:
+            parts.append(_DIGITS.pattern)
+        elif ch == ' ':
+            parts.append(r'[^\S\n]+')
+        else:
+            parts.append(re.escape(ch))
+    return ''.join(parts)
+
+
+def boilerplate_rule(lines: List[BoilerplateLine]) -> Tuple[str, str, str]:
+    """
+    把识别出的模板行合成一条净化规则（不区分大小写）
+
+    只删除整行都是模板行的行（连同行首尾的行内空白和换行符）：模板行的
+    片段也可能出现在正文句子里，不能在行中间删。净化发生在合并行之后，
+    已经和前后的正文拼成一行的模板行因此会保留下来
+    """
+    alternatives = '|'.join(f'(?:{line.pattern})' for line in lines)
+    return rf'(?im)^[^\S\n]*(?:{alternatives})[^\S\n]*$\n?', '', '重复模板行'
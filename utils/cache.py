@@ -0,0 +1,141 @@
+# utils/cache.py
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from utils import __version__
+
+# 默认缓存上限：2 GiB
+DEFAULT_CACHE_SIZE = 2 * 1024 * 1024 * 1024
+
+
+def default_cache_dir() -> Path:
+    """缓存目录：优先环境变量 TXT2EPUB_CACHE_DIR，其次系统的用户缓存目录"""
+    env = os.environ.get('TXT2EPUB_CACHE_DIR')
+    if env:
+        return Path(env)
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or Path.home() / 'AppData' / 'Local'
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'txt2epub'
+
+
+def file_digest(path: Path) -> str:
+    """文件内容的 SHA-256（分块读取，不整体载入内存）"""
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+class ConversionCache:
+    """
+    按内容寻址的转换结果缓存
+
+    键是输入文件字节、影响输出的全部选项（编码、章节正则、净化规则、标题、
+    作者、封面内容、后端）以及程序版本的 SHA-256。命中时把缓存的 EPUB
+    复制到输出路径，跳过读取、净化、生成全部步骤。不用硬链接：输出与条目
+    共用一个 inode 时，刷新条目的修改时间会改掉输出的修改时间（影响
+    --skip-up-to-date 等按修改时间的判断），原地改写输出也会改坏缓存。
+
+    每个条目是 `<键>.epub` 加一份记录章节数、编码等信息的 `<键>.json`。
+    命中会刷新条目的修改时间，超过 `max_bytes` 时按修改时间从旧到新淘汰（LRU）。
+    多个进程可以共用同一个缓存目录：写入先落临时文件再原子改名。
+    """
+
+    def __init__(self, cache_dir: Path = None, max_bytes: int = DEFAULT_CACHE_SIZE):
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def make_key(self, input_path: Path, options: dict, cover_img: Path = None) -> str:
+        """计算缓存键；`options` 须可 JSON 序列化，且只包含影响输出的选项"""
+        material = {
+            'version': __version__,
+            'input': file_digest(input_path),
+            'cover': file_digest(cover_img) if cover_img and Path(cover_img).is_file() else None,
+            'options': options,
+        }
+        blob = json.dumps(material, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        return hashlib.sha256(blob).hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.epub"
+
+    def fetch(self, key: str, output_path: Path) -> Optional[dict]:
+        """命中时把缓存的 EPUB 放到 `output_path` 并返回条目信息，否则返回 None"""
+        entry = self._entry(key)
+        try:
+            meta = json.loads(entry.with_suffix('.json').read_text(encoding='utf-8'))
+            if entry.stat().st_size != meta.get('output_bytes'):
+                return None
+            _copy(entry, Path(output_path))
+        except (OSError, ValueError):
+            return None
+        # 刷新访问时间，供 LRU 淘汰
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return meta
+
+    def store(self, key: str, output_path: Path, meta: dict) -> None:
+        """把刚生成的 EPUB 放进缓存，然后按容量上限淘汰旧条目"""
+        entry = self._entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        meta = dict(meta, output_bytes=Path(output_path).stat().st_size)
+
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(output_path, tmp)
+            os.replace(tmp, entry)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        fd, meta_tmp = tempfile.mkstemp(dir=entry.parent, suffix='.json.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(meta, ensure_ascii=False))
+            os.replace(meta_tmp, entry.with_suffix('.json'))
+        except BaseException:
+            Path(meta_tmp).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        """总大小超过上限时，从最久未用的条目开始删除"""
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob('*/*.epub'):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            path.unlink(missing_ok=True)
+            path.with_suffix('.json').unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+def _copy(src: Path, dst: Path) -> None:
+    """复制到同目录的临时文件再改名：目标是旧版本留下的硬链接时也不会改到缓存条目"""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    # 不用 mkstemp：它建出的文件权限为 0600，输出应与平常生成的一样按 umask
+    tmp = dst.with_name(f"{dst.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
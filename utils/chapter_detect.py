@@ -0,0 +1,205 @@
+# utils/chapter_detect.py
+import mmap
+import os
+import re
+import statistics
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+from utils.txt_reader import CHAPTER_REGEX, _aligned_window, chapter_pattern, decode_bytes
+from utils.chapter_index import _chinese_to_int, _roman_to_int, parse_chapter_number
+from utils.profiler import stage
+
+# 采样的窗口数与每个窗口的字节数：总量固定，耗时与文件大小无关
+DETECT_WINDOWS = 32
+DETECT_WINDOW_SIZE = 32 * 1024
+
+_NUM = r"(?P<num>[零〇一二两三四五六七八九十百千万\d]+)"
+
+# 标题内部的空白：不能跨行，否则 `_split_chapter` 在"标题 + 正文"上匹配时
+# 会把后面的短段落也当成标题
+_SP = r"[^\S\n]"
+
+# 候选的章节标题格式：(名称, 正则)。正则按 `CHAPTER_FLAGS`（含 VERBOSE）编译，
+# 不能写字面空格；除默认正则外都要求整行就是标题（不超过 40 个字符），
+# 以免把以数字开头的正文行当成标题。`num` 组为用来检查连续性的序号。
+CANDIDATE_PATTERNS: List[Tuple[str, str]] = [
+    ('default', CHAPTER_REGEX),
+    # 【001】、[第12章]、〖三〗
+    ('bracket', rf"^\s*(?P<title>[【\[〖［]{_SP}*(?:第{_SP}*)?{_NUM}{_SP}*[章节回话話集卷部篇]?{_SP}*[】\]〗］][^\n]{{0,40}}?){_SP}*$"),
+    # 第3话、第12集、卷一 第3话
+    ('episode', rf"^\s*(?P<title>(?:卷{_SP}*[零〇一二两三四五六七八九十百千万\d]+{_SP}*)?第{_SP}*{_NUM}{_SP}*"
+                rf"[话話集幕折场章节回卷部篇][^\n]{{0,40}}?){_SP}*$"),
+    # 001.、12、开端、3：标题
+    ('number_dot', rf"^\s*(?P<title>(?P<num>\d{{1,5}}){_SP}*[.、．:：](?!\d)[^\n]{{0,40}}?){_SP}*$"),
+    # 一、开端
+    ('cn_number_dot', rf"^\s*(?P<title>(?P<num>[零〇一二两三四五六七八九十百千]+){_SP}*[、.．][^\n]{{0,40}}?){_SP}*$"),
+    # 001、001 开端（整行只有序号和短标题）
+    ('number_only', rf"^\s*(?P<title>(?P<num>\d{{1,5}})(?:{_SP}+\S[^\n]{{0,40}}?)?){_SP}*$"),
+    # Ch.12、Chap 3、No.5、#7
+    ('short_chapter', rf"^\s*(?P<title>(?:Ch(?:ap(?:ter)?)?\.?|No\.|\#){_SP}*(?P<num>\d{{1,5}})\b[^\n]{{0,40}}?){_SP}*$"),
+    # IV. The Storm
+    ('roman_dot', rf"^\s*(?P<title>(?P<num>[IVXLC]{{1,7}}){_SP}*[.、．][^\n]{{0,40}}?){_SP}*$"),
+]
+
+# 平均每章字符数在这个范围内视为合理，超出时按比例扣分
+_PLAUSIBLE_CHAPTER_CHARS = (800, 60000)
+
+# 默认正则的得分不低于最高分的这个比例时，仍然选默认正则
+_DEFAULT_MARGIN = 0.9
+
+
+class PatternChoice(NamedTuple):
+    """一个候选格式的评分结果"""
+    name: str
+    regex: str
+    score: float              # 0 ~ 1
+    hits: int                 # 样本中匹配的行数
+    estimated_chapters: int   # 按样本密度估计的全书章节数
+    examples: List[str]       # 样本中的前几个标题
+
+
+def discover_chapter_pattern(
+        file_path: Path,
+        encoding: Optional[str] = None,
+        *,
+        windows: int = DETECT_WINDOWS,
+        window_size: int = DETECT_WINDOW_SIZE,
+) -> Optional[PatternChoice]:
+    """
+    采样识别章节标题格式，返回得分最高的候选；没有可信的候选时返回 None
+
+    只读取 `windows` 个均匀分布的窗口（共约 `windows * window_size` 字节），
+    耗时与文件大小无关。默认正则与最优候选得分接近时优先默认正则。
+    """
+    ranked = rank_chapter_patterns(file_path, encoding, windows=windows, window_size=window_size)
+    if not ranked:
+        return None
+    best = ranked[0]
+    for choice in ranked:
+        if choice.name == 'default' and choice.score >= best.score * _DEFAULT_MARGIN:
+            return choice
+    return best
+
+
+def rank_chapter_patterns(
+        file_path: Path,
+        encoding: Optional[str] = None,
+        *,
+        windows: int = DETECT_WINDOWS,
+        window_size: int = DETECT_WINDOW_SIZE,
+) -> List[PatternChoice]:
+    """
+    给 `CANDIDATE_PATTERNS` 逐一评分，按得分从高到低返回（样本中少于 3 处
+    匹配的候选不参与）
+
+    评分综合三项：平均章节长度是否合理（由样本中的匹配密度估计）、同一窗口
+    内相邻标题间距的规律程度（变异系数越小越好）、序号是否逐一递增（序号
+    回到 1 视为新的一卷）；另外要求匹配分散在各个窗口，而不是集中在某一处
+    （如目录）。
+    """
+    file_path = Path(file_path)
+    size = file_path.stat().st_size
+    samples, sampled_bytes = _sample_lines(file_path, encoding, windows, window_size)
+    sampled_chars = sum(len(line) + 1 for lines in samples for line in lines)
+    if not sampled_chars:
+        return []
+
+    results = []
+    with stage('detect_chapters', sampled_chars):
+        for name, regex in CANDIDATE_PATTERNS:
+            choice = _score(name, regex, samples, sampled_chars, size / max(sampled_bytes, 1), window_size)
+            if choice is not None:
+                results.append(choice)
+    results.sort(key=lambda c: -c.score)
+    return results
+
+
+def _sample_lines(file_path: Path, encoding: Optional[str], windows: int, window_size: int) -> Tuple[List[List[str]], int]:
+    """读取采样窗口并解码成行；小文件整体作为一个窗口。返回 (各窗口的行, 采样字节数)"""
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return [], 0
+        if size <= windows * window_size:
+            chunks = [f.read()]
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                step = (size - window_size) / (windows - 1)
+                chunks = [_aligned_window(mm, int(i * step), int(i * step) + window_size) for i in range(windows)]
+    samples = []
+    for chunk in chunks:
+        text = decode_bytes(chunk) if encoding is None else chunk.decode(encoding, 'replace')
+        samples.append([line.rstrip() for line in text.splitlines()])
+    return samples, sum(len(chunk) for chunk in chunks)
+
+
+def _score(
+        name: str,
+        regex: str,
+        samples: List[List[str]],
+        sampled_chars: int,
+        scale: float,
+        window_size: int,
+) -> Optional[PatternChoice]:
+    pattern = chapter_pattern(regex)
+    hits = []   # 每个窗口内的 (字符位置, 序号)
+    examples = []
+    for lines in samples:
+        pos = 0
+        window_hits = []
+        for line in lines:
+            m = pattern.match(line) if line else None
+            if m is not None:
+                window_hits.append((pos, _number(m)))
+                if len(examples) < 5:
+                    examples.append(m.group('title').strip())
+            pos += len(line) + 1
+        hits.append(window_hits)
+
+    total = sum(len(h) for h in hits)
+    if total < 3:
+        return None
+
+    # 平均章节长度
+    avg_chars = sampled_chars / total
+    low, high = _PLAUSIBLE_CHAPTER_CHARS
+    length_score = min(1.0, avg_chars / low) * min(1.0, high / avg_chars)
+
+    # 相邻标题间距的规律程度
+    gaps = [b[0] - a[0] for h in hits for a, b in zip(h, h[1:])]
+    if len(gaps) >= 2 and statistics.mean(gaps) > 0:
+        regularity = 1 / (1 + statistics.pstdev(gaps) / statistics.mean(gaps))
+    else:
+        regularity = 0.5
+
+    # 序号连续性：相邻两个序号递增 1~2，或回到 1（新的一卷）
+    pairs = [(a[1], b[1]) for h in hits for a, b in zip(h, h[1:]) if a[1] is not None and b[1] is not None]
+    if pairs:
+        monotonic = sum(0 < b - a <= 2 or b == 1 for a, b in pairs) / len(pairs)
+    elif any(n is not None for h in hits for _, n in h):
+        monotonic = 0.5
+    else:
+        monotonic = 0.3
+
+    # 匹配是否分散在各窗口：章节比窗口长时，预期只有部分窗口有标题
+    expected = len(hits) * min(1.0, window_size / avg_chars) if len(hits) > 1 else 1
+    spread = min(1.0, sum(1 for h in hits if h) / max(expected, 1))
+
+    score = length_score * (0.3 * regularity + 0.45 * monotonic + 0.25 * spread)
+    return PatternChoice(name, regex, round(score, 4), total, round(total * scale), examples)
+
+
+def _number(m: re.Match) -> Optional[int]:
+    """取出匹配中的序号；没有 `num` 组时按"第X章""Chapter N"解析标题"""
+    if 'num' not in m.re.groupindex:
+        parsed = parse_chapter_number(m.group('title').strip())
+        return parsed[1] if parsed else None
+    number = m.group('num')
+    if not number:
+        return None
+    if number.isdigit():
+        return int(number)
+    if number[0] in 'IVXLCivxlc':
+        return _roman_to_int(number.upper())
+    return _chinese_to_int(number)
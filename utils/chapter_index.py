@@ -0,0 +1,667 @@
+# utils/chapter_index.py
+import codecs
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from utils import __version__
+from utils.txt_reader import (CHAPTER_REGEX, DecodedSegment, HeadingMatcher, _MERGE_CHAPTER_PAT, _SENTENCE_END,
+                              _SegmentDecoder, _UNICODE_BOMS, chapter_pattern, iter_block_chapters,
+                              merge_heading_pattern, splits_on_newline)
+from utils.text_cleaner import CleanRuleSet, get_rule_set
+
+# 索引文件后缀：book.txt → book.txt.chapters.idx
+INDEX_SUFFIX = '.chapters.idx'
+INDEX_MAGIC = b'TXT2EPUB-IDX\x01'
+
+# 扫描标题行时每次解码的字节数
+SCAN_BLOCK_SIZE = 1024 * 1024
+
+# merge_lines 总会把匹配此正则（不带标志）的物理行单独成行；与 merge_lines 共用同一个编译结果
+HEADING_LINE_PAT = _MERGE_CHAPTER_PAT
+
+DIGEST_SIZE = 16
+
+
+def range_digest(data) -> str:
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest()
+
+
+def iter_line_blocks(mm, begin: int, end: int, block_size: int = SCAN_BLOCK_SIZE) -> Iterator[Tuple[int, int]]:
+    """把 [begin, end) 切成约 `block_size` 字节、都在换行之后结束的块，产出 (起点, 终点)"""
+    pos = begin
+    while pos < end:
+        cut = mm.rfind(b'\n', pos, min(pos + block_size, end)) + 1
+        if cut <= pos:
+            cut = mm.find(b'\n', pos, end) + 1 or end
+        yield pos, cut
+        pos = cut
+
+
+class HeadingScanner:
+    """
+    在按块解码的文本里查找会被 `iter_chapters` 当作章节开头的标题行
+
+    `iter_chapters` 在 `merge_lines` 合并后的行上匹配标题。匹配 `line_pat`
+    （见 `merge_heading_pattern`）的物理行总是单独成行；其余能被 `chapter_regex` 匹配的行
+    （如大写的 "CHAPTER II"）只有在合并后的行恰好从它开始时才算标题，
+    即它前面最后一个非空行是标题行、以句末标点结尾，或者它就是第一行。
+    前面的行会与它拼接、但单行净化后为空（如广告行）时，合并后的行净化后
+    仍从标题开始，跳过这些行继续往前判断。块与块之间记住上一块最后一个
+    起决定作用的非空行。合并后的行要与 `iter_chapters` 一样整行再匹配一次
+    （例如 "Prologue" 与下一行拼成 "Prologuechapter…" 就不再是标题）；拼到块
+    末尾还没结束时先扣下，下一块接着拼完再决定，文件末尾用 `finish()`
+    取出。按 '\n' 切行，其他换行符
+    （单独的 '\r'、'\u2028' 等）可能导致与 `iter_chapters` 不一致。
+
+    与 `iter_chapters` 一样按净化后的行判断标题（见 `HeadingMatcher`）：
+    原始文本上匹配不到、但含有净化规则会改写的内容的行（如 "□第6章"）
+    也是候选。
+    """
+
+    def __init__(self, chapter_pat: re.Pattern, line_pat=HEADING_LINE_PAT,
+                 clean_rules: list | CleanRuleSet = None):
+        self.chapter_pat = chapter_pat
+        self.line_pat = line_pat
+        self.rule_set = get_rule_set(clean_rules)
+        self.matcher = HeadingMatcher(chapter_pat, self.rule_set)
+        self.last_line: Optional[str] = None  # 之前最后一个非空行；None 表示还在文件开头
+        # 拼到块末尾还没结束的候选标题：[字节偏移, 合并行的片段, 从行首到当前块末尾的字符数]
+        self._held: Optional[list] = None
+
+    def scan(self, pieces: List[Tuple[int, str, str]]) -> Iterator[Tuple[int, int, str]]:
+        """
+        扫描一块完整的行。块可能由几段不同编码的字节组成，`pieces` 为
+        [(字节偏移, 编码, 以 surrogateescape 解码的文本)]，保证字符与字节一一
+        可逆；产出 (标题行的字节偏移, 标题行在整块文本中的字符位置, 标题行)。
+        从上一块扣下的标题在本块产出，字符位置为负数（相对本块开头）
+        """
+        text = ''.join(piece_text for _, _, piece_text in pieces)
+        cursor = _ByteCursor(pieces)
+        if self._held is not None:
+            byte_pos, parts, chars = self._held
+            if _merge_following(parts, text, 0, self.line_pat):
+                self._held = None
+                if self.matcher.match(''.join(parts)):
+                    yield byte_pos, -chars, ''.join(parts)
+            else:
+                self._held[2] += len(text)
+        # `^\s*` 可能跨过空行，标题所在行才是真正的行首
+        line_starts = {text.rfind('\n', 0, m.start('title')) + 1 for m in self.chapter_pat.finditer(text)}
+        line_starts.update(text.rfind('\n', 0, pos) + 1 for pos in self.rule_set.line_changes(text))
+        for line_start in sorted(line_starts):
+            line_end = text.find('\n', line_start)
+            line = text[line_start:line_end if line_end >= 0 else len(text)].rstrip()
+            if not self.matcher.match(line):
+                continue
+            if not self.line_pat.match(line):
+                if not self._starts_merged_line(text, line_start):
+                    continue
+                parts = [line]
+                if line_end >= 0 and not _merge_following(parts, text, line_end + 1, self.line_pat):
+                    self._held = [cursor.advance(line_start), parts, len(text) - line_start]
+                    continue
+                line = ''.join(parts)
+                if not self.matcher.match(line):
+                    continue
+            yield cursor.advance(line_start), line_start, line
+
+        prev = self._previous_line(text, len(text) + 1)
+        if prev is not None:
+            self.last_line = prev
+
+    def finish(self) -> Iterator[Tuple[int, int, str]]:
+        """
+        全部块扫描完后取出扣下的标题（如果仍是标题），产出项与 `scan()` 相同，
+        字符位置相对最后一块的末尾
+        """
+        if self._held is not None:
+            byte_pos, parts, chars = self._held
+            self._held = None
+            if self.matcher.match(''.join(parts)):
+                yield byte_pos, -chars, ''.join(parts)
+
+    def _starts_merged_line(self, text: str, line_start: int) -> bool:
+        prev = self._previous_line(text, line_start)
+        if prev is None:
+            prev = self.last_line
+        return prev is None or self._ends_merged_line(prev)
+
+    def _ends_merged_line(self, line: str) -> bool:
+        return bool(self.line_pat.match(line)) or line[-1] in _SENTENCE_END
+
+    def _previous_line(self, text: str, line_start: int) -> Optional[str]:
+        """
+        `line_start` 之前最后一个起决定作用的非空行：本身结束合并，或者单行
+        净化后不为空；本块内没有时返回 None
+        """
+        end = line_start
+        while end > 0:
+            start = text.rfind('\n', 0, end - 1) + 1
+            prev = text[start:end - 1].rstrip()
+            if prev and (self._ends_merged_line(prev) or self.rule_set.clean_line(prev).strip()):
+                return prev
+            end = start
+        return None
+
+
+class _ByteCursor:
+    """把单调递增的字符位置换算成字节偏移，每段文本只编码一遍"""
+
+    def __init__(self, pieces: List[Tuple[int, str, str]]):
+        self.pieces = pieces
+        self.i = 0            # 当前所在的段
+        self.piece_start = 0  # 当前段第一个字符在整块中的位置
+        self.char_pos = 0     # 已换算到的字符位置（相对当前段）
+        self.byte_pos = pieces[0][0] if pieces else 0
+
+    def advance(self, char_pos: int) -> int:
+        while self.i + 1 < len(self.pieces) and char_pos >= self.piece_start + len(self.pieces[self.i][2]):
+            self.piece_start += len(self.pieces[self.i][2])
+            self.i += 1
+            self.char_pos = 0
+            self.byte_pos = self.pieces[self.i][0]
+        _, codec, text = self.pieces[self.i]
+        local = char_pos - self.piece_start
+        self.byte_pos += len(text[self.char_pos:local].encode(codec, 'surrogateescape'))
+        self.char_pos = local
+        return self.byte_pos
+
+
+def _merge_following(parts: List[str], text: str, pos: int, line_pat=HEADING_LINE_PAT,
+                     limit: int = 200) -> bool:
+    """
+    `merge_lines` 会把不以句末标点结尾的行与后续非空行拼接，标题取自拼接后
+    的行；这里从 `text` 的 `pos` 起把后续行追加到 `parts`，拼出前 `limit`
+    个字符，足够取出标题。拼接已结束时返回 True，拼到文本末尾还可能继续时
+    返回 False
+    """
+    size = sum(map(len, parts))
+    while size < limit and parts[-1][-1] not in _SENTENCE_END:
+        if pos >= len(text):
+            return False
+        line_end = text.find('\n', pos)
+        line = text[pos:line_end if line_end >= 0 else len(text)].rstrip()
+        pos = line_end + 1 if line_end >= 0 else len(text)
+        if not line:
+            continue  # 前一行没有句末标点时，空行被跳过，继续拼接
+        if line_pat.match(line):
+            return True
+        parts.append(line)
+        size += len(line)
+    return True
+
+
+class ChapterEntry(NamedTuple):
+    """索引中的一章：源文件字节区间 [offset, offset + length)"""
+    number: int      # 从 0 开始的序号
+    title: str
+    offset: int
+    length: int
+    chars: int       # 区间解码后的字符数（含标题行），用于估计篇幅
+    digest: str      # 区间内容的 BLAKE2b 摘要
+
+
+class ChapterIndex:
+    """
+    TXT 的章节偏移索引：扫描一次文件，记下每章在源文件中的字节区间、标题、
+    字符数和内容摘要，存成紧凑的侧车文件（`book.txt.chapters.idx`）
+
+    偏移、长度、字符数存放在 `array` 中，摘要连续存放在一段 bytes 里，
+    百万章也只占几十 MB；之后列目录、取第 N 章、重新解析一段章节、检查
+    章节序号都按索引直接定位，不必重新解码整个文件::
+
+        index = ChapterIndex.open(txt_path)
+        for entry in index:
+            print(entry.number, entry.title)
+        title, body = index.read_chapter(42)
+
+    章节的切分与 `iter_chapters` 一致：每章从一个标题行开始，第一个标题
+    之前有内容时作为"前言"占第 0 章，全文没有标题时只有一章。只支持能按
+    b'\\n' 切行的编码，UTF-16/32 抛出 ValueError。
+    """
+
+    def __init__(
+            self,
+            source: Path,
+            offsets: array,
+            lengths: array,
+            chars: array,
+            digests: bytes,
+            titles: List[str],
+            segments: List[DecodedSegment],
+            options: dict,
+            source_stat: Tuple[int, int],
+    ):
+        self.source = Path(source)
+        self.offsets = offsets
+        self.lengths = lengths
+        self.chars = chars
+        self.digests = digests
+        self.titles = titles
+        self.segments = segments
+        self.options = options
+        self.source_stat = source_stat
+        self._rule_set: Optional[CleanRuleSet] = None
+
+    # ------------------------------------------------------------ 构建与读写
+
+    @classmethod
+    def open(
+            cls,
+            file_path: Path,
+            encoding: Optional[str] = None,
+            *,
+            chapter_regex: str = CHAPTER_REGEX,
+            clean_rules: list | CleanRuleSet = None,
+            save: bool = True,
+    ) -> 'ChapterIndex':
+        """读取侧车索引；索引缺失、过期或选项不同时重新扫描（`save` 时写回）"""
+        file_path = Path(file_path)
+        options = _options(encoding, chapter_regex, clean_rules)
+        try:
+            index = cls.load(index_path(file_path))
+        except (OSError, ValueError):
+            index = None
+        if index is not None and index.options == options and index.is_fresh():
+            return index
+        index = cls.build(file_path, encoding, chapter_regex=chapter_regex, clean_rules=clean_rules)
+        if save:
+            try:
+                index.save()
+            except OSError:
+                # 写不进去（如只读目录）不影响使用
+                pass
+        return index
+
+    @classmethod
+    def build(
+            cls,
+            file_path: Path,
+            encoding: Optional[str] = None,
+            *,
+            chapter_regex: str = CHAPTER_REGEX,
+            clean_rules: list | CleanRuleSet = None,
+    ) -> 'ChapterIndex':
+        """
+        扫描文件建立索引
+
+        按块读取：未指定编码时用与 `iter_chapters` 相同的分段解码器得到各字节
+        区间的编码，再以 surrogateescape 在块内定位标题行并换算回字节偏移；
+        每章的摘要直接对 mmap 上的字节区间计算。
+        """
+        file_path = Path(file_path)
+        chapter_pat = chapter_pattern(chapter_regex)
+        rule_set = get_rule_set(clean_rules)
+
+        heading_offsets = array('Q')
+        chars = array('Q')
+        titles: List[str] = []
+        segments: List[DecodedSegment] = []
+
+        with open(file_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            if size == 0:
+                return cls(file_path, array('Q'), array('Q'), array('Q'), b'', [], [],
+                           _options(encoding, chapter_regex, clean_rules), (size, st.st_mtime_ns))
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                begin = 0
+                codec = encoding
+                if encoding is None:
+                    for bom, bom_encoding in _UNICODE_BOMS:
+                        if mm[:len(bom)] == bom:
+                            codec = bom_encoding
+                            break
+                    else:
+                        if mm[:3] == codecs.BOM_UTF8:
+                            begin = 3
+                if codec is not None and not splits_on_newline(codec):
+                    raise ValueError(f"编码 {codec} 不能按行建立章节索引")
+                if codec is not None:
+                    segments.append(DecodedSegment(0, size, codec))
+                decoder = _SegmentDecoder(segments) if codec is None else None
+
+                scanner = HeadingScanner(chapter_pat, merge_heading_pattern(chapter_regex), rule_set)
+                current_chars = 0
+                blocks = iter_line_blocks(mm, begin, size)
+                while True:
+                    block = next(blocks, None)
+                    if block is None:
+                        # 留到最后才确认的标题，字符位置相对最后一块的末尾
+                        found, block_chars = scanner.finish(), 0
+                    else:
+                        pos, cut = block
+                        if decoder is not None:
+                            decoder.decode(mm[pos:cut], pos)
+                            pieces = [(max(seg.start, pos), seg.encoding) for seg in _tail_segments(segments, pos)]
+                            ends = [start for start, _ in pieces[1:]] + [cut]
+                        else:
+                            pieces, ends = [(pos, codec)], [cut]
+                        pieces = [(start, piece_codec, mm[start:end].decode(piece_codec, 'surrogateescape'))
+                                  for (start, piece_codec), end in zip(pieces, ends)]
+                        found, block_chars = scanner.scan(pieces), sum(len(text) for _, _, text in pieces)
+                    last = 0
+                    for byte_pos, char_pos, line in found:
+                        current_chars += char_pos - last
+                        if heading_offsets:
+                            chars.append(current_chars)
+                        current_chars = 0
+                        last = char_pos
+                        heading_offsets.append(byte_pos)
+                        titles.append(_heading_title(line, chapter_pat, rule_set))
+                    current_chars += block_chars - last
+                    if block is None:
+                        break
+                if heading_offsets:
+                    chars.append(current_chars)
+                # 第一个标题之前是否有净化后不为空的内容
+                first = heading_offsets[0] if heading_offsets else size
+                prefix_has_text = first > begin and _prefix_has_text(mm, segments, begin, first, rule_set)
+
+                # 第一个标题之前的内容作为"前言"（全文没有标题时即为整本书）
+                offsets = heading_offsets
+                if not heading_offsets and not prefix_has_text:
+                    # 全文净化后为空，与 iter_chapters 一样没有章节
+                    offsets, titles, chars = array('Q'), [], array('Q')
+                elif not heading_offsets or (heading_offsets[0] > 0 and prefix_has_text):
+                    offsets = array('Q', [0]) + heading_offsets
+                    titles.insert(0, "前言" if heading_offsets else "")
+                    chars.insert(0, _prefix_chars(mm, segments, heading_offsets[0] if heading_offsets else size))
+                elif heading_offsets[0] > 0:
+                    # 开头净化后为空（空白、广告行等），并入第一章
+                    offsets = array('Q', heading_offsets)
+                    offsets[0] = 0
+
+                lengths = array('Q', (b - a for a, b in zip(offsets, [*offsets[1:], size])))
+                digests = b''.join(hashlib.blake2b(mm[a:a + n], digest_size=DIGEST_SIZE).digest()
+                                   for a, n in zip(offsets, lengths))
+
+        return cls(file_path, offsets, lengths, chars, digests, titles, segments,
+                   _options(encoding, chapter_regex, clean_rules), (size, st.st_mtime_ns))
+
+    def save(self, path: Optional[Path] = None) -> Path:
+        """
+        写出二进制索引：魔数、JSON 头（版本、源文件大小与修改时间、选项、编码
+        区间、章节数）、三个 uint64 数组、摘要、以换行分隔的 UTF-8 标题
+        """
+        path = Path(path) if path else index_path(self.source)
+        header = json.dumps({
+            'version': __version__,
+            'byteorder': sys.byteorder,
+            'source': list(self.source_stat),
+            'options': self.options,
+            'segments': [list(seg) for seg in self.segments],
+            'count': len(self),
+        }, ensure_ascii=False).encode('utf-8')
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(INDEX_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            self.offsets.tofile(f)
+            self.lengths.tofile(f)
+            self.chars.tofile(f)
+            f.write(self.digests)
+            f.write('\n'.join(self.titles).encode('utf-8'))
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path: Path, source: Optional[Path] = None) -> 'ChapterIndex':
+        """读取索引文件；格式或版本不对时抛出 ValueError"""
+        path = Path(path)
+        data = path.read_bytes()
+        if not data.startswith(INDEX_MAGIC):
+            raise ValueError(f"不是章节索引文件: {path}")
+        pos = len(INDEX_MAGIC)
+        (header_len,) = struct.unpack_from('<I', data, pos)
+        pos += 4
+        header = json.loads(data[pos:pos + header_len].decode('utf-8'))
+        pos += header_len
+        if header.get('version') != __version__:
+            raise ValueError("索引版本不同")
+        count = header['count']
+
+        arrays = []
+        for _ in range(3):
+            arr = array('Q')
+            arr.frombytes(data[pos:pos + count * arr.itemsize])
+            if header['byteorder'] != sys.byteorder:
+                arr.byteswap()
+            pos += count * arr.itemsize
+            arrays.append(arr)
+        digests = data[pos:pos + count * DIGEST_SIZE]
+        pos += count * DIGEST_SIZE
+        titles = data[pos:].decode('utf-8').split('\n') if count else []
+        if len(titles) != count or len(digests) != count * DIGEST_SIZE:
+            raise ValueError(f"章节索引文件损坏: {path}")
+
+        if source is None:
+            source = path.with_name(path.name[:-len(INDEX_SUFFIX)]) if path.name.endswith(INDEX_SUFFIX) else path
+        return cls(source, *arrays, digests, titles,
+                   [DecodedSegment(*seg) for seg in header['segments']],
+                   header['options'], tuple(header['source']))
+
+    def is_fresh(self) -> bool:
+        """源文件的大小和修改时间是否与建立索引时一致"""
+        try:
+            st = self.source.stat()
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime_ns) == tuple(self.source_stat)
+
+    # ------------------------------------------------------------ 查询
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> ChapterEntry:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"章节序号超出范围: {i}")
+        return ChapterEntry(i, self.titles[i], self.offsets[i], self.lengths[i], self.chars[i],
+                            self.digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE].hex())
+
+    def __iter__(self) -> Iterator[ChapterEntry]:
+        return (self[i] for i in range(len(self)))
+
+    def read_bytes(self, start: int, stop: Optional[int] = None) -> bytes:
+        """取出第 start 到 stop - 1 章的原始字节"""
+        stop = len(self) if stop is None else stop
+        if not 0 <= start < stop <= len(self):
+            raise IndexError(f"章节范围超出索引: {start}-{stop}")
+        begin = self.offsets[start]
+        end = self.offsets[stop - 1] + self.lengths[stop - 1]
+        with open(self.source, 'rb') as f:
+            f.seek(begin)
+            return f.read(end - begin)
+
+    def read_text(self, start: int, stop: Optional[int] = None) -> str:
+        """按建立索引时各字节区间的编码解码第 start 到 stop - 1 章"""
+        stop = len(self) if stop is None else stop
+        raw = self.read_bytes(start, stop)
+        base = self.offsets[start]
+        end = base + len(raw)
+        return ''.join(
+            raw[max(seg.start, base) - base:min(seg.end, end) - base].decode(seg.encoding, 'replace')
+            for seg in _segments_in(self.segments, base, end)
+        )
+
+    def iter_chapters(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+        """
+        重新解析第 start 到 stop - 1 章，产出 `(title, body)`，与完整转换时的
+        结果一致；净化规则与章节正则取自建立索引时的选项（全文净化后为空、
+        没有章节时不产出任何内容）
+        """
+        if not len(self):
+            return
+        text = self.read_text(start, stop)
+        if self._rule_set is None:
+            self._rule_set = get_rule_set(self.options['clean_rules'])
+        chapters = iter_block_chapters([text.splitlines()], chapter_regex=self.options['chapter_regex'],
+                                       clean_rules=self._rule_set)
+        if start == 0 and self.titles[0] == "前言":
+            # 单独解析前言时区间里没有标题，会以 ("", 正文) 产出
+            title, body = next(chapters, ("", ""))
+            yield "前言" if title == "" else title, body
+        yield from chapters
+
+    def read_chapter(self, i: int) -> Tuple[str, str]:
+        """取出第 i 章的 `(title, body)`"""
+        if i < 0:
+            i += len(self)
+        chapters = list(self.iter_chapters(i, i + 1))
+        if not chapters:
+            return self.titles[i], ""
+        return chapters[0]
+
+    def check_sequence(self) -> List[Tuple[int, str, str]]:
+        """
+        检查标题中的章节序号，返回 (章节序号, 标题, 问题) 列表：重复、跳号、倒序
+
+        序号按单位（章、卷、Chapter……）分别检查；从 1 重新开始视为新的一卷，
+        不算问题。标题里没有序号的章节跳过。
+        """
+        problems = []
+        last = {}
+        for i, title in enumerate(self.titles):
+            parsed = parse_chapter_number(title)
+            if parsed is None:
+                continue
+            unit, number = parsed
+            prev = last.get(unit)
+            last[unit] = number
+            if prev is None or number == prev + 1 or number == 1:
+                continue
+            if number == prev:
+                problems.append((i, title, f"序号重复（{number}）"))
+            elif number > prev:
+                problems.append((i, title, f"跳号：{prev} 之后是 {number}"))
+            else:
+                problems.append((i, title, f"倒序：{prev} 之后是 {number}"))
+        return problems
+
+
+def index_path(file_path: Path) -> Path:
+    file_path = Path(file_path)
+    return file_path.with_name(file_path.name + INDEX_SUFFIX)
+
+
+def _options(encoding: Optional[str], chapter_regex: str, clean_rules) -> dict:
+    # 经过一次 JSON 往返，与从索引文件读回的选项可以直接比较
+    return json.loads(json.dumps({
+        'encoding': encoding,
+        'chapter_regex': chapter_regex,
+        'clean_rules': get_rule_set(clean_rules).rules,
+    }, ensure_ascii=False))
+
+
+def _segments_in(segments: List[DecodedSegment], start: int, end: int) -> List[DecodedSegment]:
+    """与 [start, end) 相交的编码区间"""
+    return [seg for seg in segments if seg.start < end and seg.end > start]
+
+
+def _has_text(texts: Iterable[str], rule_set: CleanRuleSet) -> bool:
+    """
+    这些文本净化后是否还有内容：与 `iter_chapters` 一样，只有广告行等会被
+    净化删掉的内容时不算（逐行用 `CleanRuleSet.clean_line` 判断）
+    """
+    return any(rule_set.clean_line(line).strip() for text in texts for line in text.splitlines())
+
+
+def _prefix_has_text(mm, segments: List[DecodedSegment], begin: int, end: int, rule_set: CleanRuleSet) -> bool:
+    """[begin, end) 净化后是否还有内容；逐块解码，遇到第一处内容即返回"""
+    for pos, cut in iter_line_blocks(mm, begin, end):
+        for seg in _segments_in(segments, pos, cut):
+            if _has_text([mm[max(seg.start, pos):min(seg.end, cut)].decode(seg.encoding, 'surrogateescape')],
+                         rule_set):
+                return True
+    return False
+
+
+def _tail_segments(segments: List[DecodedSegment], start: int) -> List[DecodedSegment]:
+    """解码报告末尾与 `start` 之后相交的编码区间（报告按偏移递增追加）"""
+    i = len(segments)
+    while i > 0 and segments[i - 1].end > start:
+        i -= 1
+    return segments[i:]
+
+
+def _prefix_chars(mm, segments: List[DecodedSegment], end: int) -> int:
+    return sum(len(mm[seg.start:min(seg.end, end)].decode(seg.encoding, 'surrogateescape'))
+               for seg in _segments_in(segments, 0, end))
+
+
+def _heading_title(line: str, chapter_pat: re.Pattern, rule_set: CleanRuleSet) -> str:
+    """与 `iter_chapters` 一样先净化标题行再取标题；净化改写了标题时用原始行"""
+    line = _SURROGATES.sub('\ufffd', line)  # 无法解码的字节与 errors="replace" 一样显示为 �
+    m = (chapter_pat.match(rule_set.clean(line)) or chapter_pat.match(line)
+         or chapter_pat.match(rule_set.clean_line(line)))
+    return m.group('title').strip()
+
+
+_SURROGATES = re.compile('[\udc80-\udcff]')
+
+
+# ------------------------------------------------------------ 章节序号
+
+_CN_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4,
+              '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+_CN_UNITS = {'十': 10, '百': 100, '千': 1000}
+_ROMAN = {'I': 1, 'V': 5, 'X': 10, 'L': 50, 'C': 100, 'D': 500, 'M': 1000}
+
+_NUMBER_PATS = (
+    re.compile(r'第\s*([零〇一二两三四五六七八九十百千万\d]+|[IVXLCM]+)\s*([章节回卷部篇])'),
+    re.compile(r'(Chapter|Section|Part|Book)\s+([IVXLCM]+|\d+)\b', re.IGNORECASE),
+)
+
+
+def parse_chapter_number(title: str) -> Optional[Tuple[str, int]]:
+    """从标题中取出 (单位, 序号)，如 "第十二章 …" → ('章', 12)；没有序号时返回 None"""
+    m = _NUMBER_PATS[0].match(title)
+    if m:
+        number, unit = m.groups()
+    else:
+        m = _NUMBER_PATS[1].match(title)
+        if not m:
+            return None
+        unit, number = m.group(1).capitalize(), m.group(2)
+    if number.isdigit():
+        return unit, int(number)
+    if number[0] in _ROMAN:
+        return unit, _roman_to_int(number.upper())
+    return unit, _chinese_to_int(number)
+
+
+def _chinese_to_int(text: str) -> int:
+    """中文数字转整数，支持"十二""一百零五""三千二百万"这类写法"""
+    total = section = digit = 0
+    for c in text:
+        if c.isdigit():
+            digit = digit * 10 + int(c)
+        elif c in _CN_DIGITS:
+            digit = _CN_DIGITS[c]
+        elif c in _CN_UNITS:
+            section += (digit or 1) * _CN_UNITS[c]
+            digit = 0
+        elif c == '万':
+            total += (section + digit) * 10000
+            section = digit = 0
+    return total + section + digit
+
+
+def _roman_to_int(text: str) -> int:
+    total = 0
+    for c, nxt in zip(text, [*text[1:], None]):
+        value = _ROMAN[c]
+        total += -value if nxt is not None and _ROMAN[nxt] > value else value
+    return total
@@ -0,0 +1,445 @@
+# utils/converter.py
+import itertools
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from utils.txt_reader import CHAPTER_REGEX, DecodedSegment, _record_segment, iter_chapters
+from utils.text_cleaner import CleanRuleSet, get_rule_set
+from utils.boilerplate import BoilerplateLine, boilerplate_rule, scan_boilerplate
+from utils.epub_builder import VolumeSplit, build_epub
+from utils.epub_writer import MARKUP_VERSION, compression_profile
+from utils.cover import COVER_MAX_SIZE, cover_cache_dir
+from utils.toc import TOC_GROUP_SIZE
+from utils.spine import SpinePacking
+from utils.cache import ConversionCache
+from utils.dedupe import Duplicate, dedupe_chapters
+from utils.chapter_detect import discover_chapter_pattern
+from utils.profiler import stage
+from utils.incremental import (RebuildPlan, chapter_ranges, drop_sidecar, iter_reused_chapters,
+                               plan_rebuild, save_sidecar, scan_headings)
+
+_NULL_LOG = logging.getLogger(__name__)
+_NULL_LOG.addHandler(logging.NullHandler())
+_NULL_LOG.propagate = False
+
+
+class ConversionProgress(NamedTuple):
+    """
+    转换进度，每进入一个阶段、每处理完一章报告一次
+
+    stage:       当前阶段：detect（识别章节格式）、boilerplate（扫描模板行）、
+                 chapters（逐章读取、生成 EPUB）
+    chapters:    本次已处理的章节数（增量重建复用的章节不计）
+    read_bytes:  源文件中已读到的字节偏移（读取略超前于已处理的章节；增量重建时
+                 从续读位置算起），与 input_bytes 之比即读取进度
+    input_bytes: 源文件大小
+    """
+    stage: str
+    chapters: int
+    read_bytes: int
+    input_bytes: int
+
+
+class ConversionCancelled(Exception):
+    """转换被取消；临时文件已删除，原有的输出不受影响"""
+
+
+def convert_txt(
+        input_path: Path,
+        output_path: Path = None,
+        *,
+        title: str = None,
+        author: str = "作者未知",
+        cover_img: Path = None,
+        encoding: str = None,
+        chapter_regex: str = CHAPTER_REGEX,
+        clean: bool = True,
+        backend: str = 'stream',
+        workers: int = 1,
+        cache: ConversionCache = None,
+        incremental: bool = False,
+        split: VolumeSplit = None,
+        detect_chapters: bool = False,
+        strip_boilerplate: bool = False,
+        dedupe: bool = False,
+        toc_group_size: int = TOC_GROUP_SIZE,
+        packing: SpinePacking = None,
+        compression: str = 'default',
+        cover_max_size: Optional[Tuple[int, int]] = COVER_MAX_SIZE,
+        log: logging.Logger = None,
+        progress: Callable[[ConversionProgress], None] = None,
+        cancel: threading.Event = None,
+        clean_stats: Optional[list] = None,
+) -> dict:
+    """
+    单个 TXT → EPUB 的完整流程，命令行、批量模式共用
+
+    :param encoding: 源文件编码，None 时自动逐段检测
+    :param clean: 是否执行文本净化
+    :param cache: 转换结果缓存，处理过的封面也放在它的目录下；None 时都不缓存
+    :param incremental: 增量重建：借助输出旁的侧车文件，复用上一次未变章节的
+                        压缩数据，只解析变化之后的部分（仅 stream 后端）
+    :param split: 分卷规则，启用时输出 book.vol01.epub、book.vol02.epub……
+                  （仅 stream 后端，不使用缓存，不能与增量重建同时使用）
+    :param detect_chapters: 采样识别章节标题格式（见 `utils.chapter_detect`），
+                            识别成功时代替 `chapter_regex`
+    :param strip_boilerplate: 先扫描一遍全文，删除在很多章节中重复出现的行
+                              （见 `utils.boilerplate`），仅在 `clean` 时生效
+    :param dedupe: 略去与前面某一章完全相同或近似重复的章节（见 `utils.dedupe`），
+                   不能与增量重建同时使用
+    :param toc_group_size: 章节很多时目录按卷或每这么多章分成两层，0 为始终一层
+    :param packing: 合并短章节、拆分长章节的 XHTML 文件大小（见 `utils.spine`），
+                    仅 stream 后端，不能与增量重建同时使用
+    :param compression: 压缩档位 store / fast / default / max（仅 stream 后端）
+    :param cover_max_size: 封面缩小到这个分辨率（宽, 高）以内并转为 JPEG，None 时原样嵌入
+    :param log: 输出进度的 Logger，None 时不输出
+    :param progress: 进度回调（见 `ConversionProgress`），在执行转换的线程中调用
+    :param cancel: 置位后在下一个阶段或下一章之前停止，抛出 `ConversionCancelled`
+    :param clean_stats: 传入列表时，生成结束后追加实际使用的净化规则集（含模板行
+                        规则）的逐条统计（见 `CleanRuleSet.stats`）；只含主进程中
+                        的净化，`workers` 大于 1 时子进程里的不计入；命中缓存时不追加
+    :return: 转换结果，含输出路径、章节数、输入输出字节数、耗时、解码报告
+             以及是否命中缓存；分卷时 'volumes' 为各册路径，'output' 为第一册；
+             自动识别章节格式时 'chapter_regex' 为实际使用的正则；删除重复
+             模板行时 'boilerplate' 为删除的各行及其出现的章节数；去重时
+             'duplicates' 为略去的章节
+    :raises ValueError: 文件为空或无法读取文本
+    :raises ConversionCancelled: `cancel` 已置位
+    """
+    log = log or _NULL_LOG
+    input_path = Path(input_path)
+    output_path = Path(output_path) if output_path else input_path.with_suffix('.epub')
+    start = time.perf_counter()
+    title = title or input_path.stem
+    clean_rules = None if clean else []
+    strip_boilerplate = strip_boilerplate and clean
+    split = split if split is not None and split.enabled else None
+    if split and incremental:
+        raise ValueError("分卷输出不能与增量重建同时使用")
+    if split and backend != 'stream':
+        raise ValueError("分卷输出仅支持 stream 后端")
+    if dedupe and incremental:
+        # 增量重建按字节区间与章节一一对应复用旧章节，略去章节后对应不上
+        raise ValueError("章节去重不能与增量重建同时使用")
+    packing = packing if packing is not None and packing.enabled else None
+    if packing and incremental:
+        # 同上：增量重建要求章节文件与章节一一对应
+        raise ValueError("合并、拆分章节文件不能与增量重建同时使用")
+    if packing and backend != 'stream':
+        raise ValueError("合并、拆分章节文件仅支持 stream 后端")
+    compression_profile(compression)
+    if compression != 'default' and backend != 'stream':
+        raise ValueError("压缩档位仅支持 stream 后端")
+
+    input_bytes = input_path.stat().st_size
+    report = _ProgressReport(progress, cancel, input_bytes)
+
+    if detect_chapters:
+        report.stage('detect')
+        chapter_regex = detect_chapter_regex(input_path, encoding, chapter_regex, log)
+
+    cache_key = None
+    # 缓存条目只对应单个 EPUB，分卷时不使用缓存
+    if cache is not None and split is None:
+        with stage('cache', input_bytes):
+            # 只有影响输出内容的选项参与计算缓存键，进程数等不参与
+            cache_key = cache.make_key(input_path, {
+                'encoding': encoding,
+                'chapter_regex': chapter_regex,
+                'clean_rules': get_rule_set(clean_rules).rules,
+                # 模板行由文件内容决定，文件已参与缓存键，这里只记开关
+                'strip_boilerplate': strip_boilerplate,
+                'dedupe': dedupe,
+                'toc_group_size': toc_group_size,
+                'packing': list(packing) if packing else None,
+                'markup': MARKUP_VERSION,
+                'compression': compression,
+                'cover_max_size': list(cover_max_size) if cover_max_size else None,
+                'title': title,
+                'author': author,
+                'backend': backend,
+            }, cover_img)
+            meta = cache.fetch(cache_key, output_path)
+        if meta is not None:
+            log.info("命中转换缓存，跳过生成")
+            decode_report = [DecodedSegment(*seg) for seg in meta['decode_report']]
+            log_decode_report(decode_report, log)
+            result = _result(input_path, [output_path], meta['chapters'], start, decode_report, cached=True)
+            if detect_chapters:
+                result['chapter_regex'] = chapter_regex
+            if strip_boilerplate:
+                result['boilerplate'] = meta.get('boilerplate', [])
+            if dedupe:
+                result['duplicates'] = meta.get('duplicates', [])
+            return result
+
+    boilerplate = []
+    if strip_boilerplate:
+        report.stage('boilerplate')
+        boilerplate = find_boilerplate(input_path, encoding, chapter_regex, log)
+        if boilerplate:
+            # 放在默认规则之前，趁行内空白、广告片段还没被改写时删除；
+            # 是否逐条计数沿用默认规则集的设置
+            default_rules = get_rule_set(None)
+            clean_rules = CleanRuleSet([boilerplate_rule(boilerplate), *default_rules.rules],
+                                       profile=default_rules.profile)
+
+    plan = None
+    chapter_options = None
+    if incremental:
+        if backend != 'stream':
+            raise ValueError("增量重建仅支持 stream 后端")
+        # 只有影响章节内容的选项才决定旧章节能否复用
+        chapter_options = {
+            'encoding': encoding,
+            'chapter_regex': chapter_regex,
+            'clean_rules': get_rule_set(clean_rules).rules,
+            'markup': MARKUP_VERSION,
+            # 复用的章节原样拷贝压缩数据，压缩档位不同时不能复用
+            'compression': compression,
+        }
+        with stage('incremental'):
+            plan = plan_rebuild(input_path, output_path, chapter_options)
+    resume = plan.resume if plan else 0
+
+    if encoding:
+        log.info("使用指定编码: %s", encoding)
+    else:
+        # 先尝试严格 UTF-8，失败时逐段检测编码，混合编码的文件也能正确解码
+        log.info("自动检测文件编码……")
+
+    if plan:
+        log.info("增量重建：复用前 %d 章，从第 %d 字节起重新解析",
+                 sum(len(r.titles) for r in plan.reused), resume)
+    report.stage('chapters')
+    log.info("读取文本……")
+    # 逐章流式读取，内存占用只与最大的章节有关
+    decode_report = []
+    chapters = iter_chapters(input_path, encoding, chapter_regex=chapter_regex,
+                             clean_rules=clean_rules, decode_report=decode_report, start=resume,
+                             workers=workers, read_progress=report.read if progress else None)
+    first = next(chapters, None)
+    if first is None and plan is None:
+        raise ValueError("文件为空或无法读取文本")
+
+    chapters = itertools.chain([first] if first else [], chapters)
+    duplicates = []
+    if dedupe:
+        chapters = dedupe_chapters(chapters, duplicates)
+    tally = _ChapterTally(chapters, report)
+    reused_titles = [t for r in plan.reused for t in r.titles] if plan else []
+    log.info("生成 EPUB…")
+    # 先写到临时文件再替换：增量重建要边读旧 EPUB 边写新的；旧版本留下的
+    # 输出也可能是指向缓存条目的硬链接，替换而不是原地改写，缓存内容不受影响
+    part_path = output_path.with_name(output_path.name + '.part')
+    try:
+        volumes = build_epub(
+            title=title,
+            author=author,
+            chapters=tally,
+            # 分卷时各册自行先写临时文件
+            output_path=output_path if split else part_path,
+            cover_img=cover_img,
+            backend=backend,
+            workers=workers,
+            reused_chapters=iter_reused_chapters(output_path, plan.reused) if plan else (),
+            split=split,
+            toc_group_size=toc_group_size,
+            packing=packing,
+            compression=compression,
+            cover_max_size=cover_max_size,
+            # --no-cache 时封面也不缓存
+            cover_cache_dir=cover_cache_dir(cache.cache_dir) if cache is not None else None,
+        )
+        if split is None:
+            os.replace(part_path, output_path)
+            volumes = [output_path]
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+    if plan:
+        # 与解码器一样把相邻、编码相同的区间合并，否则每次增量重建都会多出一段
+        segments: List[DecodedSegment] = []
+        for seg in itertools.chain(plan.segments, decode_report):
+            _record_segment(segments, *seg)
+        decode_report = segments
+    log_decode_report(decode_report, log)
+    log_duplicates(duplicates, log)
+    if clean_stats is not None and clean:
+        clean_stats.extend(get_rule_set(clean_rules).stats())
+    chapter_count = len(reused_titles) + len(tally.titles)
+
+    if incremental:
+        with stage('incremental'):
+            _update_sidecar(input_path, output_path, encoding, chapter_regex, chapter_options,
+                            plan, tally.titles, decode_report, log)
+
+    if cache_key is not None:
+        try:
+            with stage('cache'):
+                cache.store(cache_key, output_path, {
+                    'chapters': chapter_count,
+                    'decode_report': [list(seg) for seg in decode_report],
+                    'boilerplate': _boilerplate_report(boilerplate),
+                    'duplicates': _duplicates_report(duplicates),
+                })
+        except OSError as e:
+            # 缓存写不进去不影响本次转换
+            log.warning("写入转换缓存失败: %s", e)
+    result = _result(input_path, volumes, chapter_count, start, decode_report, cached=False)
+    if detect_chapters:
+        result['chapter_regex'] = chapter_regex
+    if strip_boilerplate:
+        result['boilerplate'] = _boilerplate_report(boilerplate)
+    if dedupe:
+        result['duplicates'] = _duplicates_report(duplicates)
+    return result
+
+
+def detect_chapter_regex(input_path: Path, encoding: str | None, fallback: str, log: logging.Logger) -> str:
+    """采样识别章节标题格式并输出结果，识别不出时返回 `fallback`"""
+    choice = discover_chapter_pattern(input_path, encoding)
+    if choice is None:
+        log.info("未识别出章节标题格式，使用默认规则")
+        return fallback
+    log.info("识别到章节标题格式: %s（样本中 %d 处，估计全书约 %d 章，得分 %.2f），例如: %s",
+             choice.name, choice.hits, choice.estimated_chapters, choice.score, "、".join(choice.examples[:3]))
+    log.info("固定使用该格式: --chapter-regex '%s'", choice.regex)
+    return choice.regex
+
+
+def find_boilerplate(input_path: Path, encoding: str | None, chapter_regex: str,
+                     log: logging.Logger) -> List[BoilerplateLine]:
+    """扫描重复出现的模板行并输出结果"""
+    log.info("扫描重复出现的模板行……")
+    boilerplate = scan_boilerplate(input_path, encoding, chapter_regex=chapter_regex)
+    if not boilerplate:
+        log.info("没有发现重复出现的模板行")
+        return boilerplate
+    log.info("发现 %d 种重复出现的模板行，将从正文中删除:", len(boilerplate))
+    for line in boilerplate:
+        log.info("  约 %d 章: %s", line.chapters, line.text)
+    return boilerplate
+
+
+def _boilerplate_report(boilerplate: List[BoilerplateLine]) -> List[dict]:
+    return [{'text': line.text, 'chapters': line.chapters} for line in boilerplate]
+
+
+def _duplicates_report(duplicates: List[Duplicate]) -> List[dict]:
+    return [{'title': d.title, 'duplicate_of': d.original_title, 'similarity': d.similarity} for d in duplicates]
+
+
+def log_duplicates(duplicates: List[Duplicate], log: logging.Logger) -> None:
+    """输出略去的重复章节（序号从 1 开始，按原始章节序列计）"""
+    if not duplicates:
+        return
+    log.info("略去 %d 个重复章节:", len(duplicates))
+    for d in duplicates:
+        how = "完全相同" if d.similarity == 1.0 else f"相似度 {d.similarity:.0%}"
+        log.info("  第 %d 项「%s」与第 %d 项「%s」%s", d.index + 1, d.title, d.original + 1, d.original_title, how)
+
+
+def _update_sidecar(
+        input_path: Path,
+        output_path: Path,
+        encoding: str | None,
+        chapter_regex: str,
+        chapter_options: dict,
+        plan: RebuildPlan | None,
+        titles: List[str],
+        decode_report: List[DecodedSegment],
+        log: logging.Logger,
+) -> None:
+    """记录本次各章节的字节区间，供下一次增量重建；无法可靠切分时删除侧车文件"""
+    resume = plan.resume if plan else 0
+    segments = [DecodedSegment(0, input_path.stat().st_size, encoding)] if encoding else decode_report
+    headings = scan_headings(input_path, resume, encoding, segments, chapter_regex,
+                             chapter_options['clean_rules'])
+    ranges = chapter_ranges(input_path, resume, headings, titles) if headings is not None else None
+    if ranges is None:
+        log.debug("无法按字节区间切分章节，下次将完整重建")
+        drop_sidecar(output_path)
+        return
+    save_sidecar(output_path, chapter_options, [*(plan.reused if plan else []), *ranges], segments)
+
+
+def _result(input_path: Path, volumes: List[Path], chapters: int, start: float,
+            decode_report: list, cached: bool) -> dict:
+    return {
+        'input': str(input_path),
+        'output': str(volumes[0]),
+        'volumes': [str(p) for p in volumes],
+        'chapters': chapters,
+        'input_bytes': input_path.stat().st_size,
+        'output_bytes': sum(p.stat().st_size for p in volumes),
+        'seconds': round(time.perf_counter() - start, 3),
+        'cached': cached,
+        'decode_report': decode_report,
+    }
+
+
+class _ProgressReport:
+    """向 `progress` 回调报告进度，并在阶段之间、章节之间检查是否已取消"""
+
+    def __init__(self, progress: Optional[Callable[[ConversionProgress], None]],
+                 cancel: Optional[threading.Event], input_bytes: int):
+        self._progress = progress
+        self._cancel = cancel
+        self.input_bytes = input_bytes
+        self.current = 'chapters'
+        self.chapters = 0
+        self.read_bytes = 0
+
+    def check(self) -> None:
+        if self._cancel is not None and self._cancel.is_set():
+            raise ConversionCancelled("转换已取消")
+
+    def stage(self, name: str) -> None:
+        self.check()
+        self.current = name
+        self._emit()
+
+    def chapter(self, title: str, body: str) -> None:
+        self.chapters += 1
+        self._emit()
+
+    def read(self, offset: int) -> None:
+        """`iter_chapters` 的 `read_progress` 回调：记下读到的字节偏移"""
+        self.read_bytes = offset
+
+    def _emit(self) -> None:
+        if self._progress is not None:
+            self._progress(ConversionProgress(self.current, self.chapters, self.read_bytes, self.input_bytes))
+
+
+class _ChapterTally:
+    """包装章节迭代器，边产出边记录标题；交出下一章之前报告进度、检查是否已取消"""
+
+    def __init__(self, chapters: Iterator[Tuple[str, str]], report: Optional[_ProgressReport] = None):
+        self._chapters = chapters
+        self._report = report
+        self.titles: List[str] = []
+
+    def __iter__(self):
+        for chapter in self._chapters:
+            if self._report is not None:
+                self._report.check()
+            self.titles.append(chapter[0])
+            yield chapter
+            if self._report is not None:
+                self._report.chapter(*chapter)
+
+
+def log_decode_report(decode_report: list, log: logging.Logger) -> None:
+    """输出自动解码时各字节区间使用的编码"""
+    if len(decode_report) == 1:
+        log.info("检测到的文件编码: %s", decode_report[0].encoding)
+    elif decode_report:
+        log.info("文件混有多种编码，共 %d 段:", len(decode_report))
+        for seg in decode_report:
+            log.info("  字节 %d-%d: %s", seg.start, seg.end, seg.encoding)
@@ -0,0 +1,184 @@
+# utils/cover.py
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+from utils.cache import default_cache_dir
+from utils.profiler import stage
+
+# Pillow 缺失时封面原样嵌入，GUI 不显示预览
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# 封面的最大分辨率（宽, 高）：常见阅读器推荐的 1600×2560，更大的图缩小到这个范围内
+COVER_MAX_SIZE = (1600, 2560)
+COVER_QUALITY = 85
+
+# GUI 封面预览的尺寸
+PREVIEW_SIZE = (300, 200)
+
+# 封面缓存的容量上限
+COVER_CACHE_SIZE = 64 * 1024 * 1024
+
+# EPUB 核心媒体类型中的位图及其扩展名
+COVER_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+
+
+class Cover(NamedTuple):
+    """要嵌入 EPUB 的封面"""
+    data: bytes
+    media_type: str
+
+    @property
+    def file_name(self) -> str:
+        return f"cover.{COVER_EXTENSIONS[self.media_type]}"
+
+
+def sniff_media_type(data: bytes) -> str:
+    """按文件头判断图片类型，认不出时按 JPEG 处理"""
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+def load_cover(
+        image_path: Optional[Path],
+        max_size: Optional[Tuple[int, int]] = COVER_MAX_SIZE,
+        *,
+        cache_dir: Optional[Path] = None,
+        cache: bool = True,
+) -> Optional[Cover]:
+    """
+    读取封面：按 EXIF 方向摆正，缩小到 `max_size` 以内，透明部分铺白底，
+    重新编码为 JPEG；结果按图片内容的哈希和目标尺寸缓存在 `cache_dir`
+    （默认见 `cover_cache_dir`），批量转换共用同一张封面、GUI 反复预览时都
+    不再解码原图。`cache` 为 False 时不读也不写缓存。
+
+    文件不存在时返回 None。`max_size` 为 None、没有 Pillow 或图片无法解码时
+    原样嵌入，按文件头确定媒体类型；原图已是不超过 `max_size` 的 JPEG 且
+    重新编码后不会更小时，也保留原图。
+    """
+    if not image_path or not Path(image_path).is_file():
+        return None
+    data = Path(image_path).read_bytes()
+    if max_size is None or not PIL_AVAILABLE:
+        return Cover(data, sniff_media_type(data))
+
+    width, height = max_size
+    key = f"{hashlib.sha256(data).hexdigest()}-{width}x{height}-q{COVER_QUALITY}.jpg"
+    covers = _CoverCache(cache_dir) if cache else None
+    cached = covers.get(key) if covers else None
+    if cached is not None:
+        return Cover(cached, 'image/jpeg')
+
+    with stage('cover', len(data)) as st:
+        encoded = _encode_jpeg(data, max_size)
+        st.add_output(len(encoded or data))
+    if encoded is None:
+        return Cover(data, sniff_media_type(data))
+    if covers:
+        covers.put(key, encoded)
+    return Cover(encoded, 'image/jpeg')
+
+
+def cover_cache_dir(cache_dir: Optional[Path] = None) -> Path:
+    """转换缓存目录（默认见 `utils.cache.default_cache_dir`）下存放封面的子目录"""
+    return Path(cache_dir or default_cache_dir()) / 'covers'
+
+
+def cover_thumbnail(image_path: Path, size: Tuple[int, int] = PREVIEW_SIZE,
+                    *, cache_dir: Optional[Path] = None) -> 'Image.Image':
+    """GUI 预览用的缩略图，与封面共用缓存；图片无法解码时抛出 OSError"""
+    cover = load_cover(image_path, size, cache_dir=cache_dir)
+    if cover is None:
+        raise OSError(f"封面文件不存在: {image_path}")
+    return Image.open(io.BytesIO(cover.data))
+
+
+def _encode_jpeg(data: bytes, max_size: Tuple[int, int]) -> Optional[bytes]:
+    """缩小并编码为 JPEG；无法解码时返回 None，不值得重新编码时原样返回 `data`"""
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            source_format = original.format
+            image = ImageOps.exif_transpose(original)
+            fits = image.width <= max_size[0] and image.height <= max_size[1]
+            image.thumbnail(max_size, Image.Resampling.LANCZOS)
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                rgba = image.convert('RGBA')
+                image = Image.new('RGB', rgba.size, 'white')
+                image.paste(rgba, mask=rgba.getchannel('A'))
+            elif image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            out = io.BytesIO()
+            image.save(out, 'JPEG', quality=COVER_QUALITY, optimize=True, progressive=True)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    encoded = out.getvalue()
+    if source_format == 'JPEG' and fits and len(encoded) >= len(data):
+        return data
+    return encoded
+
+
+class _CoverCache:
+    """
+    处理过的封面：`<图片哈希>-<宽>x<高>-q<质量>.jpg`，放在转换缓存目录下的
+    covers 子目录。读写失败只是不用缓存；超过 `COVER_CACHE_SIZE` 时按修改
+    时间淘汰最久未用的
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        self.cache_dir = Path(cache_dir) if cache_dir else cover_cache_dir()
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.cache_dir / key
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, self.cache_dir / key)
+            except BaseException:
+                Path(tmp).unlink(missing_ok=True)
+                raise
+            self._evict()
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        entries = []
+        for path in self.cache_dir.glob('*.jpg'):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= COVER_CACHE_SIZE:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,140 @@
+# utils/dedupe.py
+import hashlib
+import re
+import zlib
+from collections import defaultdict, deque
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from utils.profiler import stage
+
+# 字符 shingle 的长度
+SHINGLE_CHARS = 5
+
+# 只取以码位为 8 的倍数的字符开头的 shingle（约占八分之一）。取不取只由 shingle
+# 本身决定，两章各自取出的子集的 Jaccard 相似度仍能代表全部 shingle 的
+# 相似度，而哈希的次数少了许多
+_SHINGLES = re.compile('(?=([%s].{%d}))' % (
+    ''.join(re.escape(chr(c)) for c in range(0, 0x10000, 8) if not 0xD800 <= c < 0xE000),
+    SHINGLE_CHARS - 1), re.DOTALL)
+
+# bottom-k MinHash 签名的长度：保留 shingle 哈希值中最小的这么多个
+SIGNATURE_SIZE = 64
+
+# 签名中最小的这几个值作为 LSH 的桶键：相似度为 J 的两章，最小值相同的概率就是 J，
+# 几个键里至少有一个相同的概率接近 1
+LSH_KEYS = 4
+
+# 每个桶只与最近放入的这么多章比较，常见片段把很多章落到同一个桶里时，
+# 比较次数仍有上限
+BUCKET_SIZE = 32
+
+# 估计的 Jaccard 相似度不低于这个值时视为同一章的重复
+NEAR_DUPLICATE_SIMILARITY = 0.8
+
+# 正文（去掉空白后）短于这个长度时只做完全相同的比较：签名太短，相似度不可靠
+MIN_NEAR_DUPLICATE_CHARS = 200
+
+
+class Duplicate(NamedTuple):
+    """一个被略去的重复章节"""
+    index: int          # 在原始章节序列中的位置（从 0 开始）
+    title: str
+    original: int       # 保留下来的那一章在原始序列中的位置
+    original_title: str
+    similarity: float   # 1.0 为去掉空白后完全相同，否则为估计的 Jaccard 相似度
+
+
+class ChapterDeduper:
+    """
+    识别重复章节：完全相同的用正文哈希，"修订"过的近似重复用 bottom-k
+    MinHash 签名
+
+    正文去掉空白后切成 `SHINGLE_CHARS` 个字符的 shingle（按内容取样），用
+    CRC32 哈希（与进程无关，结果可复现），保留最小的 `SIGNATURE_SIZE` 个作为
+    签名。
+    签名里最小的 `LSH_KEYS` 个值作为桶键，新章节只与同桶的章节比较，
+    不做两两比较，一万章以上也只需线性时间；内存占用为每章一个签名。
+    """
+
+    def __init__(self, similarity: float = NEAR_DUPLICATE_SIMILARITY):
+        self.similarity = similarity
+        self._exact: Dict[bytes, int] = {}
+        self._signatures: Dict[int, frozenset] = {}
+        self._buckets: Dict[int, deque] = defaultdict(lambda: deque(maxlen=BUCKET_SIZE))
+        self._titles: List[str] = []
+
+    def check(self, title: str, body: str) -> Optional[Duplicate]:
+        """登记一章；它与之前某一章重复时返回 `Duplicate`（此时不登记）"""
+        index = len(self._titles)
+        self._titles.append(title)
+        text = ''.join(body.split())
+        if not text:
+            return None
+
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        original = self._exact.get(digest)
+        if original is not None:
+            return Duplicate(index, title, original, self._titles[original], 1.0)
+
+        signature = _signature(text) if len(text) >= MIN_NEAR_DUPLICATE_CHARS else None
+        if signature:
+            members = frozenset(signature)
+            best, best_similarity = None, 0.0
+            seen = set()
+            for key in signature[:LSH_KEYS]:
+                for other in self._buckets.get(key, ()):
+                    if other in seen:
+                        continue
+                    seen.add(other)
+                    similarity = _similarity(members, self._signatures[other], self.similarity)
+                    if similarity > best_similarity:
+                        best, best_similarity = other, similarity
+            if best is not None and best_similarity >= self.similarity:
+                return Duplicate(index, title, best, self._titles[best], round(best_similarity, 3))
+
+        self._exact[digest] = index
+        if signature:
+            self._signatures[index] = members
+            for key in signature[:LSH_KEYS]:
+                self._buckets[key].append(index)
+        return None
+
+
+def dedupe_chapters(
+        chapters: Iterable[Tuple[str, str]],
+        duplicates: Optional[list] = None,
+        similarity: float = NEAR_DUPLICATE_SIMILARITY,
+) -> Iterator[Tuple[str, str]]:
+    """
+    流式去重：原样产出章节，略去与之前某一章重复的（保留第一次出现的版本，
+    章节可能已经写入 EPUB，无法再替换）。略去的章节追加到 `duplicates`
+    """
+    deduper = ChapterDeduper(similarity)
+    for title, body in chapters:
+        with stage('dedupe', len(body)):
+            duplicate = deduper.check(title, body)
+        if duplicate is None:
+            yield title, body
+        elif duplicates is not None:
+            duplicates.append(duplicate)
+
+
+def _signature(text: str) -> List[int]:
+    """bottom-k MinHash 签名：取样的 shingle 的 CRC32 中最小的 `SIGNATURE_SIZE` 个，升序"""
+    shingles = map(str.encode, _SHINGLES.findall(text))
+    return sorted(set(map(zlib.crc32, shingles)))[:SIGNATURE_SIZE]
+
+
+def _similarity(a: frozenset, b: frozenset, minimum: float = 0.0) -> float:
+    """
+    由两个 bottom-k 签名估计 Jaccard 相似度：并集的最小 k 个值中两边都有的比例
+
+    这个比例不会超过两个签名的交集占并集最小 k 个值的比例，据此先排除
+    不可能达到 `minimum` 的（多数候选只是共有几个常见片段），省去排序
+    """
+    common = a & b
+    size = min(SIGNATURE_SIZE, len(a) + len(b) - len(common))
+    if not common or len(common) < minimum * size:
+        return 0.0
+    union = sorted(a | b)[:SIGNATURE_SIZE]
+    return len(common.intersection(union)) / len(union)
@@ -1,63 +1,310 @@
 # utils/epub_builder.py
+import glob
 import os
+import re
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 from ebooklib import epub
 
+from utils.epub_writer import (DEFAULT_COMPRESSION, CompressedMember, Compression, StreamingEpubWriter,
+                               compress_member, compression_profile, iter_compressed_documents, render_chapter_body,
+                               render_document_xhtml)
+from utils.cover import COVER_MAX_SIZE, Cover, load_cover
+from utils.profiler import stage
+from utils.spine import Section, SpinePacking, pack_chapters
+from utils.toc import TOC_GROUP_SIZE, build_toc, is_volume_heading
+
+# 可选的 EPUB 生成后端
+BACKENDS = ('stream', 'ebooklib')
+
+
+class VolumeSplit(NamedTuple):
+    """
+    分卷规则，三者可以组合；全部为默认值时不分卷
+
+    by_heading:   遇到"第X卷""第X部""第X篇""Book N"这样的标题时另起一册，该标题为新册第一章
+    max_chapters: 每册最多的章节数，0 表示不限
+    max_bytes:    每册 EPUB 的大致上限（按已压缩的章节累计，不含目录），0 表示不限；
+                  单章超过上限时独占一册
+    """
+    by_heading: bool = False
+    max_chapters: int = 0
+    max_bytes: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.by_heading or self.max_chapters > 0 or self.max_bytes > 0
+
+
+def volume_path(output_path: Path, number: int, count: int) -> Path:
+    """第 number 册的文件名：book.epub → book.vol01.epub，序号位数随总册数增加"""
+    width = max(2, len(str(count)))
+    return output_path.with_name(f"{output_path.stem}.vol{number:0{width}d}{output_path.suffix}")
+
+
 def build_epub(
         title: str,
         author: str,
-        chapters: List[str],
+        chapters: Iterable[str | Tuple[str, str]],
         output_path: Path,
         cover_img: Path | None = None,
+        *,
+        backend: str = 'stream',
+        workers: int = 1,
+        reused_chapters: Iterable[Tuple[str, CompressedMember]] = (),
+        split: Optional[VolumeSplit] = None,
+        toc_group_size: int = TOC_GROUP_SIZE,
+        packing: Optional[SpinePacking] = None,
+        compression: str = 'default',
+        cover_max_size: Optional[Tuple[int, int]] = COVER_MAX_SIZE,
+        cover_cache_dir: Optional[Path] = None,
+) -> List[Path]:
+    """生成简易 EPUB 文件，返回写出的文件列表
+
+    `chapters` 可以是列表，也可以是 `iter_chapters` 这样的生成器，逐个消费
+
+    backend:
+        * 'stream'   → `StreamingEpubWriter`，每章到达即写入 ZIP，内存占用平稳
+        * 'ebooklib' → 先在 ebooklib 的 `EpubBook` 里组装整本书再一次性写出，
+                       作为参考实现保留，便于对比
+    workers:
+        大于 1 时（仅 stream 后端）把章节 XHTML 的生成和压缩交给进程池，
+        由主进程按书脊顺序写入；输出与单进程完全一致
+    reused_chapters:
+        （仅 stream 后端）排在 `chapters` 之前、已经压缩好的章节 `(标题, 成员)`，
+        原样写入 ZIP，供增量重建复用上一次的输出（见 `utils.incremental`）
+    split:
+        （仅 stream 后端）按 `VolumeSplit` 把章节依次分成多册，分别写成
+        book.vol01.epub、book.vol02.epub……；章节只识别一遍，边产出边分册，
+        `workers` 的进程池为所有分册共用
+    toc_group_size:
+        章节很多时目录按卷或每这么多章分成两层（见 `utils.toc.build_toc`），
+        0 表示始终只有一层
+    packing:
+        （仅 stream 后端）按 `SpinePacking` 把相邻的短章节合并成一个 XHTML 文件、
+        把过长的章节拆成几个文件（见 `utils.spine.pack_chapters`），目录仍指向
+        各章开头；不能与 `reused_chapters` 同时使用
+    compression:
+        （仅 stream 后端）压缩档位（见 `utils.epub_writer.COMPRESSION_PROFILES`）：
+        'store' 不压缩、最快；'fast' 用最低的 deflate 级别，压不动的成员直接
+        存储；'default' 为级别 6；'max' 体积最小。`mimetype` 总是原样存储
+    cover_max_size:
+        封面缩小到这个分辨率（宽, 高）以内并重新编码为 JPEG（见
+        `utils.cover.load_cover`），None 时原样嵌入
+    cover_cache_dir:
+        处理过的封面缓存在这个目录（见 `utils.cover.cover_cache_dir`），None 时不缓存
+    """
+    profile = compression_profile(compression)
+    if backend != 'stream' and compression != 'default':
+        raise ValueError("压缩档位仅支持 stream 后端")
+    packing = packing or SpinePacking()
+    if packing.enabled:
+        if backend != 'stream':
+            raise ValueError("合并、拆分章节文件仅支持 stream 后端")
+        if reused_chapters:
+            raise ValueError("合并、拆分章节文件不支持复用已压缩的章节")
+    cover = load_cover(cover_img, cover_max_size, cache_dir=cover_cache_dir, cache=cover_cache_dir is not None)
+    if split is not None and split.enabled:
+        if backend != 'stream':
+            raise ValueError("分卷输出仅支持 stream 后端")
+        if reused_chapters:
+            raise ValueError("分卷输出不支持复用已压缩的章节")
+        return _build_volumes(title, author, chapters, output_path, cover, workers,
+                              split, toc_group_size, packing, profile)
+    if backend == 'stream':
+        _build_streaming(title, author, chapters, output_path, cover, workers,
+                         reused_chapters, toc_group_size, packing, profile)
+    elif workers > 1:
+        raise ValueError("ebooklib 后端不支持多进程生成")
+    elif reused_chapters:
+        raise ValueError("ebooklib 后端不支持复用已压缩的章节")
+    elif backend == 'ebooklib':
+        _build_with_ebooklib(title, author, chapters, output_path, cover, toc_group_size)
+    else:
+        raise ValueError(f"未知的 EPUB 生成后端: {backend}（可选: {', '.join(BACKENDS)}）")
+    return [output_path]
+
+
+def _iter_titled(chapters: Iterable[str | Tuple[str, str]]) -> Iterable[Tuple[str, str]]:
+    """把章节统一成 (标题, 正文)；只有正文时按序号生成标题"""
+    for idx, content in enumerate(chapters, start=1):
+        if isinstance(content, tuple):
+            yield content[0], content[1]
+        else:
+            yield f"第{idx}章", content
+
+
+def _build_streaming(
+        title: str,
+        author: str,
+        chapters: Iterable[str | Tuple[str, str]],
+        output_path: Path,
+        cover: Cover | None = None,
+        workers: int = 1,
+        reused_chapters: Iterable[Tuple[str, CompressedMember]] = (),
+        toc_group_size: int = TOC_GROUP_SIZE,
+        packing: SpinePacking = SpinePacking(),
+        compression: Compression = DEFAULT_COMPRESSION,
 ) -> None:
-    """生成简易 EPUB 文件"""
+    with StreamingEpubWriter(output_path, title, author, css=NAV_CSS, cover=cover,
+                             toc_group_size=toc_group_size, compression=compression) as writer:
+        for chapter_title, member in reused_chapters:
+            writer.add_compressed_chapter(chapter_title, member)
+        documents = pack_chapters(_iter_titled(chapters), packing)
+        if workers > 1:
+            for sections, member in iter_compressed_documents(documents, workers, language=writer.language,
+                                                              compression=compression):
+                writer.add_compressed_document(sections, member)
+        else:
+            for sections in documents:
+                writer.add_document(sections)
+
+
+def _iter_members(
+        chapters: Iterable[str | Tuple[str, str]],
+        workers: int,
+        packing: SpinePacking,
+        compression: Compression,
+) -> Iterator[Tuple[List[Section], CompressedMember]]:
+    """按书脊顺序产出渲染、压缩好的文件；多进程时交给进程池"""
+    documents = pack_chapters(_iter_titled(chapters), packing)
+    if workers > 1:
+        yield from iter_compressed_documents(documents, workers, compression=compression)
+        return
+    for sections in documents:
+        with stage('render', sum(len(section.body) for section in sections)) as st:
+            xhtml = render_document_xhtml(sections).encode('utf-8')
+            st.add_output(len(xhtml))
+        yield sections, compress_member(xhtml, *compression)
+
+
+def _build_volumes(
+        title: str,
+        author: str,
+        chapters: Iterable[str | Tuple[str, str]],
+        output_path: Path,
+        cover: Cover | None,
+        workers: int,
+        split: VolumeSplit,
+        toc_group_size: int = TOC_GROUP_SIZE,
+        packing: SpinePacking = SpinePacking(),
+        compression: Compression = DEFAULT_COMPRESSION,
+) -> List[Path]:
+    """
+    边产出章节边分册：当前册写满就关闭，再开下一册
 
+    按文件分册：合并在一个文件里的章节总在同一册，拆开的长章节也不会被
+    分到两册（续接部分不另起一册，`max_bytes` 可能因此略微超出）。
+    各册先写成 `.part` 临时文件，全部成功后才按总册数改成最终文件名；
+    书名为"书名 · 第N册"，所在卷的标题已知时再附上卷标题。
+    """
+    parts: List[Path] = []
+    writer: Optional[StreamingEpubWriter] = None
+    volume_title = None   # 最近一个卷标题
+    try:
+        for sections, member in _iter_members(chapters, workers, packing, compression):
+            # 卷标题总在文件开头（见 `pack_chapters`）
+            starts_volume = split.by_heading and sections[0].part == 0 and is_volume_heading(sections[0].title)
+            if starts_volume:
+                volume_title = sections[0].title
+            entries = sum(1 for section in sections if section.part == 0)
+            if writer is not None and writer.files and entries and (
+                    starts_volume
+                    or 0 < split.max_chapters < len(writer.chapters) + entries
+                    or 0 < split.max_bytes < writer.size + len(member[0])):
+                writer.close()
+                writer = None
+            if writer is None:
+                parts.append(output_path.with_name(f"{output_path.name}.vol{len(parts) + 1}.part"))
+                label = f"{title} · 第{len(parts)}册" + (f" {volume_title}" if volume_title else "")
+                writer = StreamingEpubWriter(parts[-1], label, author, css=NAV_CSS, cover=cover,
+                                             toc_group_size=toc_group_size, compression=compression)
+            writer.add_compressed_document(sections, member)
+        if writer is None:
+            # 没有任何章节时也输出一册空书，与不分卷时一致
+            parts.append(output_path.with_name(f"{output_path.name}.vol1.part"))
+            writer = StreamingEpubWriter(parts[-1], f"{title} · 第1册", author, css=NAV_CSS, cover=cover,
+                                         toc_group_size=toc_group_size, compression=compression)
+        writer.close()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        for part in parts:
+            part.unlink(missing_ok=True)
+        raise
+
+    volumes = [volume_path(output_path, i, len(parts)) for i in range(1, len(parts) + 1)]
+    for part, volume in zip(parts, volumes):
+        os.replace(part, volume)
+    # 上次分出的册数更多时，删掉多出来的旧分册
+    for old in existing_volumes(output_path):
+        if old not in volumes:
+            old.unlink(missing_ok=True)
+    return volumes
+
+
+def existing_volumes(output_path: Path) -> List[Path]:
+    """磁盘上已有的 book.volNN.epub 分册（按文件名排序）"""
+    pattern = re.compile(re.escape(output_path.stem) + r"\.vol\d+" + re.escape(output_path.suffix))
+    return sorted(path for path in
+                  output_path.parent.glob(f"{glob.escape(output_path.stem)}.vol*{glob.escape(output_path.suffix)}")
+                  if pattern.fullmatch(path.name))
+
+
+def _build_with_ebooklib(
+        title: str,
+        author: str,
+        chapters: Iterable[str | Tuple[str, str]],
+        output_path: Path,
+        cover: Cover | None = None,
+        toc_group_size: int = TOC_GROUP_SIZE,
+) -> None:
     book = epub.EpubBook()
     book.set_title(title)
     book.set_language('zh')
     book.add_author(author)
 
-    if cover_img and cover_img.is_file():
-        with cover_img.open('rb') as f:
-            book.set_cover("cover.jpg", f.read())
+    if cover is not None:
+        book.set_cover(cover.file_name, cover.data)
 
     epub_chapters = []
 
-    for idx, content in enumerate(chapters, start=1):
-
-        if isinstance(content, tuple):
-            body = content[1]
-            title = content[0]
-        else:
-            body = content
-            title = f"第{idx}章"
+    for idx, (chapter_title, body) in enumerate(_iter_titled(chapters), start=1):
         c = epub.EpubHtml(
-            title=title,
+            title=chapter_title,
             file_name=f"chap_{idx}.xhtml",
             lang='zh',
         )
-        ## 第一行是章节标题。
-
-        # 检查content是否为元组，如果是则取第二个元素（正文内容）
-
-            
-        c.content = f"<p>{body.replace('　　','').replace(chr(10), '<p>')}</p>"
+        with stage('render', len(body)):
+            c.content = render_chapter_body(chapter_title, body)
         c.add_link(rel="stylesheet", href="style/nav.css", type="text/css")
         book.add_item(c)
         epub_chapters.append(c)
 
-    # Table of Contents & Spine
-    book.toc = tuple(epub_chapters)
+    # Table of Contents & Spine：分组用 Section 指向组内第一章（按卷分组时为卷标题所在章）
+    book.toc = tuple(
+        (epub.Section(node.label, epub_chapters[node.index].file_name),
+         tuple(epub_chapters[idx] for idx in node.children))
+        if node.children else epub_chapters[node.index]
+        for node in build_toc([c.title for c in epub_chapters], toc_group_size)
+    )
     book.spine = ['nav'] + epub_chapters
 
     # nav
     book.add_item(epub.EpubNcx())
     book.add_item(epub.EpubNav())
 
-    # Optional CSS
-    style = """
+    nav_css = epub.EpubItem(uid="style_nav", file_name="style/nav.css", media_type="text/css", content=NAV_CSS)
+    book.add_item(nav_css)
+
+    # ebooklib 在写出时才统一序列化、压缩，整体记为 zip_write
+    with stage('zip_write'):
+        epub.write_epub(str(output_path), book, {})
+
+
+# 章节样式表（两个后端共用）
+NAV_CSS = """
         /* ===== 基础文本样式 ===== */
 body {
   font-family: "Noto Serif SC", "Source Han Serif CN", serif, "Apple Color Emoji";
@@ -256,8 +503,4 @@ a:hover {
     color: #bbdefb;
   }
 }
-    """
-    nav_css = epub.EpubItem(uid="style_nav", file_name="style/nav.css", media_type="text/css", content=style)
-    book.add_item(nav_css)
-
-    epub.write_epub(str(output_path), book, {})
+"""
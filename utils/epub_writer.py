@@ -0,0 +1,512 @@
+# utils/epub_writer.py
+import re
+import struct
+import time
+import uuid
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from utils.cover import Cover, sniff_media_type
+from utils.profiler import stage
+from utils.toc import TOC_GROUP_SIZE, TocNode, build_toc
+from utils.spine import Section
+
+
+CONTAINER_XML = """<?xml version="1.0" encoding="utf-8"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles>
+    <rootfile media-type="application/oebps-package+xml" full-path="EPUB/content.opf"/>
+  </rootfiles>
+</container>
+"""
+
+# 章节 XHTML 标记的版本：渲染结果改变时加一，旧的转换缓存和增量重建复用的章节随之失效
+MARKUP_VERSION = 3
+
+CHAPTER_XHTML = """<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="{lang}" xml:lang="{lang}">
+<head>
+  <title>{title}</title>
+  <link href="style/nav.css" rel="stylesheet" type="text/css"/>
+</head>
+<body>{body}</body>
+</html>
+"""
+
+COVER_XHTML = """<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="{lang}" xml:lang="{lang}">
+<head>
+  <title>Cover</title>
+  <style>
+    body {{ margin: 0em; padding: 0em; }}
+    img {{ max-width: 100%; max-height: 100%; }}
+  </style>
+</head>
+<body><img src="{src}" alt="Cover"/></body>
+</html>
+"""
+
+
+class Compression(NamedTuple):
+    """
+    ZIP 成员的压缩方式
+
+    level:      deflate 级别（1~9），0 表示原样存储
+    min_saving: 压缩省下的比例不到这个值时改为存储；大于 0 时先用开头
+                `_PROBE_BYTES` 字节以级别 1 试压，明显压不动（封面等已压缩的
+                数据）的成员直接存储，不再整体压缩
+    """
+    level: int = 6
+    min_saving: float = 0.0
+
+
+# 可选的压缩档位：store 最快、体积最大，max 体积最小、最慢
+COMPRESSION_PROFILES = {
+    'store': Compression(0),
+    'fast': Compression(1, 0.1),
+    'default': Compression(6),
+    'max': Compression(9),
+}
+DEFAULT_COMPRESSION = COMPRESSION_PROFILES['default']
+
+# 试压的长度
+_PROBE_BYTES = 16 * 1024
+
+
+def compression_profile(name: str) -> Compression:
+    """按名称取压缩档位，未知的名称抛出 ValueError"""
+    try:
+        return COMPRESSION_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"未知的压缩档位: {name}（可选: {', '.join(COMPRESSION_PROFILES)}）") from None
+
+
+class _ZipStream:
+    """
+    只追加写入的最小 ZIP 写入器
+
+    每个成员写入时就已知 CRC 与大小，直接写本地文件头和数据，不需要回填，
+    也不需要在内存里保留成员内容；中央目录在 `close()` 时一次写出。
+    不支持 ZIP64，单个 EPUB 超过 4 GB 时抛出 ValueError。
+    """
+
+    def __init__(self, fp: BinaryIO, date_time: Tuple[int, int, int, int, int, int]):
+        self.fp = fp
+        self.offset = 0
+        year, month, day, hour, minute, second = date_time
+        self._dos_time = (hour << 11) | (minute << 5) | (second // 2)
+        self._dos_date = ((year - 1980) << 9) | (month << 5) | day
+        # (文件名, 压缩方式, CRC, 压缩后大小, 原始大小, 本地文件头偏移)
+        self._entries: List[Tuple[bytes, int, int, int, int, int]] = []
+
+    def write(self, name: str, data: bytes, *, compress: bool = True,
+              compression: Compression = DEFAULT_COMPRESSION) -> None:
+        """写入一个成员；`compress=False` 时原样存储"""
+        if compress:
+            self.write_raw(name, *compress_member(data, *compression))
+        else:
+            self.write_raw(name, data, 0, zlib.crc32(data), len(data))
+
+    def write_raw(self, name: str, payload: bytes, method: int, crc: int, size: int) -> None:
+        """写入已经压缩好的成员数据"""
+        encoded = name.encode('utf-8')
+        if self.offset + len(payload) > 0xFFFFFFFF or size > 0xFFFFFFFF:
+            raise ValueError("EPUB 超过 4 GB，不支持 ZIP64")
+        header = struct.pack(
+            '<IHHHHHIIIHH', 0x04034B50, 20, 0, method, self._dos_time, self._dos_date,
+            crc, len(payload), size, len(encoded), 0,
+        )
+        self._entries.append((encoded, method, crc, len(payload), size, self.offset))
+        with stage('zip_write', len(payload)) as st:
+            self.fp.write(header)
+            self.fp.write(encoded)
+            self.fp.write(payload)
+            st.add_output(len(header) + len(encoded) + len(payload))
+        self.offset += len(header) + len(encoded) + len(payload)
+
+    def close(self) -> None:
+        """写出中央目录和目录结束记录"""
+        start = self.offset
+        for encoded, method, crc, compressed, size, offset in self._entries:
+            record = struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014B50, 20, 20, 0, method, self._dos_time, self._dos_date,
+                crc, compressed, size, len(encoded), 0, 0, 0, 0, 0o644 << 16, offset,
+            )
+            self.fp.write(record)
+            self.fp.write(encoded)
+            self.offset += len(record) + len(encoded)
+        count = len(self._entries)
+        self.fp.write(struct.pack('<IHHHHIIH', 0x06054B50, 0, 0, count, count, self.offset - start, start, 0))
+
+
+# 压缩好的成员：(数据, 压缩方式, CRC, 原始大小)
+CompressedMember = Tuple[bytes, int, int, int]
+
+
+def compress_member(data: bytes, level: int = 6, min_saving: float = 0.0) -> CompressedMember:
+    """
+    按 ZIP 的 deflate 格式压缩一个成员（见 `Compression`）；`level` 为 0、
+    或压缩后省下的比例不到 `min_saving`（压缩后不比原来小）时原样存储
+    """
+    crc = zlib.crc32(data)
+    if level and min_saving and len(data) > _PROBE_BYTES:
+        with stage('compress', _PROBE_BYTES):
+            probe = len(zlib.compress(data[:_PROBE_BYTES], 1))
+        if probe > _PROBE_BYTES * (1 - min_saving):
+            level = 0
+    if level:
+        with stage('compress', len(data)) as st:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 9 if level == 9 else 8)
+            payload = compressor.compress(data) + compressor.flush()
+            st.add_output(len(payload))
+        if len(payload) < len(data) * (1 - min_saving):
+            return payload, 8, crc, len(data)
+    return data, 0, crc, len(data)
+
+
+def read_compressed_member(fp: BinaryIO, info: zipfile.ZipInfo) -> CompressedMember:
+    """从已有的 ZIP 中原样取出一个成员的压缩数据，不解压、不重新压缩
+
+    `info` 取自 `zipfile.ZipFile.getinfo`，`fp` 是同一文件以二进制方式打开的句柄
+    """
+    fp.seek(info.header_offset)
+    header = fp.read(30)
+    signature, name_len, extra_len = struct.unpack('<I22xHH', header)
+    if signature != 0x04034B50:
+        raise zipfile.BadZipFile(f"成员 {info.filename} 的本地文件头损坏")
+    fp.seek(name_len + extra_len, 1)
+    payload = fp.read(info.compress_size)
+    if len(payload) != info.compress_size:
+        raise zipfile.BadZipFile(f"成员 {info.filename} 的数据不完整")
+    return payload, info.compress_type, info.CRC, info.file_size
+
+
+# XML 文本中需要转义的字符，`&` 必须最先替换
+_XML_ESCAPES = (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'))
+
+# XML 1.0 不允许出现的字符（除制表符、换行、回车外的 C0 控制字符，如旧 TXT 末尾的 \x1a），直接删掉
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def escape_text(text: str) -> str:
+    """
+    转义 XML 文本中的 `&`、`<`、`>` 并删掉 XML 不允许的控制字符；先用 `in`
+    查找（比没有命中的 `str.replace` 快得多），没有时不复制
+    """
+    for char, entity in _XML_ESCAPES:
+        if char in text:
+            text = text.replace(char, entity)
+    if _XML_ILLEGAL.search(text):
+        text = _XML_ILLEGAL.sub('', text)
+    return text
+
+
+def render_chapter_body(title: Optional[str], body: str, anchor: str = '') -> str:
+    """
+    一章的正文标记：标题为 `<h2>`（`anchor` 非空时带 id），正文每行一个闭合的
+    `<p>` 段落；`title` 为 None 时只有段落（拆开的长章节的后续部分）
+
+    整章一次性处理：转义和去掉全角缩进各扫描一遍全文，换行直接替换成
+    `</p><p>`，不逐行切分、拼接，几 MB 的章节也只复制几次
+    """
+    if '　　' in body:
+        body = body.replace('　　', '')
+    heading = ''
+    if title is not None:
+        heading = f'<h2 id="{anchor}">' if anchor else '<h2>'
+        heading += f'{escape_text(title)}</h2>'
+    if not body:
+        return heading
+    return f"{heading}<p>{escape_text(body).replace(chr(10), '</p><p>')}</p>"
+
+
+def render_chapter_xhtml(title: str, body: str, language: str = 'zh') -> str:
+    """生成一章完整的 XHTML 文档"""
+    return CHAPTER_XHTML.format(lang=language, title=escape_text(title), body=render_chapter_body(title, body))
+
+
+def section_anchor(index: int) -> str:
+    """文件中第 index 段（从 0 开始）开头的锚点；第一段直接指向文件本身"""
+    return f"c{index}"
+
+
+def render_document_xhtml(sections: List[Section], language: str = 'zh') -> str:
+    """生成装有一段或几段（见 `utils.spine.pack_chapters`）的 XHTML 文档，各章标题带锚点"""
+    if len(sections) == 1 and sections[0].part == 0:
+        return render_chapter_xhtml(sections[0].title, sections[0].body, language)
+    body = ''.join(render_chapter_body(section.title if section.part == 0 else None, section.body,
+                                       section_anchor(idx) if idx else '')
+                   for idx, section in enumerate(sections))
+    return CHAPTER_XHTML.format(lang=language, title=escape_text(sections[0].title), body=body)
+
+
+def _render_document_batch(batch: List[List[Section]], language: str,
+                           compression: Compression) -> List[CompressedMember]:
+    """进程池任务：渲染并压缩一批文件"""
+    return [compress_member(render_document_xhtml(sections, language).encode('utf-8'), *compression)
+            for sections in batch]
+
+
+def iter_compressed_documents(
+        documents: Iterable[List[Section]],
+        workers: int,
+        *,
+        language: str = 'zh',
+        compression: Compression = DEFAULT_COMPRESSION,
+        batch_chars: int = 1024 * 1024,
+) -> Iterator[Tuple[List[Section], CompressedMember]]:
+    """
+    用进程池并行渲染、压缩各个文件，按输入顺序产出 `(各段, 压缩好的成员)`
+
+    文件按正文长度攒成约 `batch_chars` 字符一批提交，最多同时有
+    `2 * workers` 批在途，读入端不会一次性把整本书塞进队列。每个文件的压缩
+    结果只取决于内容和压缩级别，与进程数无关，因此输出是确定的。
+
+    性能分析只覆盖主进程：子进程里的渲染、压缩不单独计时，主进程等待
+    结果的时间记为 `pool_wait` 阶段。
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        batch: List[List[Section]] = []
+        size = 0
+        for sections in documents:
+            batch.append(sections)
+            size += sum(len(section.body) for section in sections)
+            if size < batch_chars and len(batch) < 256:
+                continue
+            in_flight.append((batch, pool.submit(_render_document_batch, batch, language, compression)))
+            batch, size = [], 0
+            if len(in_flight) >= 2 * workers:
+                done, future = in_flight.popleft()
+                yield from zip(done, _wait(future))
+        if batch:
+            in_flight.append((batch, pool.submit(_render_document_batch, batch, language, compression)))
+        while in_flight:
+            done, future = in_flight.popleft()
+            yield from zip(done, _wait(future))
+
+
+def _wait(future) -> List[CompressedMember]:
+    with stage('pool_wait'):
+        return future.result()
+
+
+class StreamingEpubWriter:
+    """
+    边生成边写入的 EPUB 写入器，不经过 ebooklib 的内存模型
+
+    打开时立即写入 `mimetype`、`container.xml`、样式表和封面；每调用一次
+    `add_chapter` 就把该章 XHTML 压缩写进 ZIP，内存里只留下
+    `(文件名, 标题)` 这样的紧凑清单；`close()` 时再根据清单生成 OPF、NCX
+    和导航页。几个短章节可以装进同一个文件、长章节可以拆成几个文件
+    （`add_document`，见 `utils.spine`），目录指向各章开头的锚点。
+    章节很多时目录分成两层（见 `utils.toc.build_toc`），
+    `toc_group_size` 为 0 时始终只有一层。除 `mimetype` 总是原样存储外，
+    各成员按 `compression` 压缩。配合 `iter_chapters` 使用时，整本书的
+    内存占用与章节数成正比，与正文总量无关。
+
+    用法::
+
+        with StreamingEpubWriter(path, "书名", "作者", css=css) as writer:
+            for title, body in iter_chapters(txt_path):
+                writer.add_chapter(title, body)
+    """
+
+    def __init__(
+            self,
+            output_path: Path,
+            title: str,
+            author: str,
+            *,
+            language: str = 'zh',
+            css: str = '',
+            cover: Optional[Cover | bytes] = None,
+            modified: Optional[datetime] = None,
+            toc_group_size: int = TOC_GROUP_SIZE,
+            compression: Compression = DEFAULT_COMPRESSION,
+    ):
+        self.title = title
+        self.author = author
+        self.language = language
+        self.modified = (modified or datetime.now(timezone.utc)).replace(microsecond=0)
+        self.identifier = f"urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, f'txt2epub:{title}:{author}')}"
+        self.chapters: List[Tuple[str, str]] = []  # 目录：(链接, 标题)，链接为文件名或"文件名#锚点"
+        self.files: List[str] = []  # 书脊上的章节文件
+        if isinstance(cover, bytes):
+            cover = Cover(cover, sniff_media_type(cover))
+        self.cover = cover
+        self.toc_group_size = toc_group_size
+        self.compression = compression
+
+        self._fp = open(output_path, 'wb')
+        try:
+            self._zip = _ZipStream(self._fp, time.localtime(self.modified.timestamp())[:6])
+            # mimetype 必须是第一个成员，且不压缩
+            self._zip.write('mimetype', b'application/epub+zip', compress=False)
+            self._write('META-INF/container.xml', CONTAINER_XML.encode('utf-8'))
+            self._write('EPUB/style/nav.css', css.encode('utf-8'))
+            if cover is not None:
+                self._write(f'EPUB/{cover.file_name}', cover.data)
+                self._write('EPUB/cover.xhtml',
+                            COVER_XHTML.format(lang=language, src=cover.file_name).encode('utf-8'))
+        except BaseException:
+            self._fp.close()
+            raise
+
+    @property
+    def size(self) -> int:
+        """目前已写入的字节数（不含 `close()` 时写出的目录和导航）"""
+        return self._zip.offset
+
+    def add_chapter(self, title: str, body: str) -> None:
+        """渲染并写入一章"""
+        with stage('render', len(body)) as st:
+            xhtml = render_chapter_xhtml(title, body, self.language).encode('utf-8')
+            st.add_output(len(xhtml))
+        self.add_compressed_chapter(title, compress_member(xhtml, *self.compression))
+
+    def add_compressed_chapter(self, title: str, member: CompressedMember) -> None:
+        """写入一章已经渲染、压缩好的 XHTML（见 `compress_member`）"""
+        self.add_compressed_document([Section(title, '')], member)
+
+    def add_document(self, sections: List[Section]) -> None:
+        """渲染并写入一个装有一段或几段的文件"""
+        with stage('render', sum(len(section.body) for section in sections)) as st:
+            xhtml = render_document_xhtml(sections, self.language).encode('utf-8')
+            st.add_output(len(xhtml))
+        self.add_compressed_document(sections, compress_member(xhtml, *self.compression))
+
+    def add_compressed_document(self, sections: List[Section], member: CompressedMember) -> None:
+        """写入一个已经渲染、压缩好的文件；各章开头登记到目录，拆开的后续部分不登记"""
+        file_name = f"chap_{len(self.files) + 1}.xhtml"
+        self._zip.write_raw(f'EPUB/{file_name}', *member)
+        self.files.append(file_name)
+        for idx, section in enumerate(sections):
+            if section.part == 0:
+                self.chapters.append((f"{file_name}#{section_anchor(idx)}" if idx else file_name, section.title))
+
+    def close(self) -> None:
+        """写出 OPF、NCX、导航页和 ZIP 中央目录"""
+        if self._fp.closed:
+            return
+        try:
+            toc = build_toc([title for _, title in self.chapters], self.toc_group_size)
+            self._write('EPUB/nav.xhtml', self._nav_xhtml(toc).encode('utf-8'))
+            self._write('EPUB/toc.ncx', self._toc_ncx(toc).encode('utf-8'))
+            self._write('EPUB/content.opf', self._content_opf().encode('utf-8'))
+            self._zip.close()
+        finally:
+            self._fp.close()
+
+    def abort(self) -> None:
+        """出错时直接关闭文件，不写目录"""
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write(self, name: str, data: bytes) -> None:
+        self._zip.write(name, data, compression=self.compression)
+
+    def _content_opf(self) -> str:
+        title = escape_text(self.title)
+        author = escape_text(self.author)
+        modified = self.modified.strftime('%Y-%m-%dT%H:%M:%SZ')
+        cover_meta = '\n    <meta name="cover" content="cover-img"/>' if self.cover else ''
+        manifest = [
+            '<item href="nav.xhtml" id="nav" media-type="application/xhtml+xml" properties="nav"/>',
+            '<item href="toc.ncx" id="ncx" media-type="application/x-dtbncx+xml"/>',
+            '<item href="style/nav.css" id="style_nav" media-type="text/css"/>',
+        ]
+        spine = []
+        if self.cover:
+            manifest.append(f'<item href="{self.cover.file_name}" id="cover-img" media-type="{self.cover.media_type}"'
+                            ' properties="cover-image"/>')
+            manifest.append('<item href="cover.xhtml" id="cover" media-type="application/xhtml+xml"/>')
+            spine.append('<itemref idref="cover" linear="no"/>')
+        spine.append('<itemref idref="nav"/>')
+        for idx, file_name in enumerate(self.files, start=1):
+            manifest.append(f'<item href="{file_name}" id="chapter_{idx}" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="chapter_{idx}"/>')
+        return (
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            '<package xmlns="http://www.idpf.org/2007/opf" unique-identifier="id" version="3.0">\n'
+            '  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">\n'
+            f'    <meta property="dcterms:modified">{modified}</meta>\n'
+            f'    <dc:identifier id="id">{self.identifier}</dc:identifier>\n'
+            f'    <dc:title>{title}</dc:title>\n'
+            f'    <dc:language>{self.language}</dc:language>\n'
+            f'    <dc:creator id="creator">{author}</dc:creator>{cover_meta}\n'
+            '  </metadata>\n'
+            '  <manifest>\n    ' + '\n    '.join(manifest) + '\n  </manifest>\n'
+            '  <spine toc="ncx">\n    ' + '\n    '.join(spine) + '\n  </spine>\n'
+            '</package>\n'
+        )
+
+    def _toc_ncx(self, toc: List[TocNode]) -> str:
+        # 每个 navPoint 一行、不缩进；playOrder 取所指章节的序号，分组与它的
+        # 第一章指向同一文件时序号相同
+        points = []
+        for node in toc:
+            points.append(self._nav_point(len(points) + 1, node.label, node.index, close=not node.children))
+            if node.children:
+                for idx in node.children:
+                    points.append(self._nav_point(len(points) + 1, self.chapters[idx][1], idx, close=True))
+                points.append('</navPoint>')
+        depth = 2 if any(node.children for node in toc) else 1
+        return (
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">\n'
+            '<head>\n'
+            f'<meta name="dtb:uid" content="{self.identifier}"/>\n'
+            f'<meta name="dtb:depth" content="{depth}"/>\n'
+            '<meta name="dtb:totalPageCount" content="0"/>\n'
+            '<meta name="dtb:maxPageNumber" content="0"/>\n'
+            '</head>\n'
+            f'<docTitle><text>{escape_text(self.title)}</text></docTitle>\n'
+            '<navMap>\n' + '\n'.join(points) + '\n</navMap>\n'
+            '</ncx>\n'
+        )
+
+    def _nav_point(self, number: int, label: str, index: int, close: bool) -> str:
+        return (f'<navPoint id="p{number}" playOrder="{index + 1}"><navLabel><text>{escape_text(label)}'
+                f'</text></navLabel><content src="{self.chapters[index][0]}"/>' + ('</navPoint>' if close else ''))
+
+    def _nav_xhtml(self, toc: List[TocNode]) -> str:
+        # 每个 <li> 一行、不缩进，分组的下一层嵌套在它的 <li> 里
+        items = []
+        for node in toc:
+            link = f'<a href="{self.chapters[node.index][0]}">{escape_text(node.label)}</a>'
+            if not node.children:
+                items.append(f'<li>{link}</li>')
+                continue
+            items.append(f'<li>{link}<ol>')
+            items.extend(f'<li><a href="{self.chapters[idx][0]}">{escape_text(self.chapters[idx][1])}</a></li>'
+                         for idx in node.children)
+            items.append('</ol></li>')
+        title = escape_text(self.title)
+        return (
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            '<!DOCTYPE html>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" '
+            f'lang="{self.language}" xml:lang="{self.language}">\n'
+            f'<head><title>{title}</title></head>\n'
+            '<body>\n'
+            f'<nav epub:type="toc" id="id" role="doc-toc">\n<h2>{title}</h2>\n'
+            '<ol>\n' + '\n'.join(items) + '\n</ol>\n</nav>\n'
+            '</body>\n'
+            '</html>\n'
+        )
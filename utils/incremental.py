@@ -0,0 +1,208 @@
+# utils/incremental.py
+import bisect
+import codecs
+import json
+import mmap
+import os
+import zipfile
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from utils import __version__
+from utils.txt_reader import CHAPTER_REGEX, DecodedSegment, chapter_pattern, merge_heading_pattern
+from utils.epub_writer import CompressedMember, read_compressed_member
+from utils.chapter_index import HeadingScanner, iter_line_blocks, range_digest, splits_on_newline
+
+# 侧车文件后缀：book.epub → book.epub.chapters.json
+SIDECAR_SUFFIX = '.chapters.json'
+
+
+class ChapterRange(NamedTuple):
+    """源文件中的一段字节区间，以及由它生成的章节标题"""
+    offset: int
+    length: int
+    digest: str
+    heading: bool       # 区间是否从章节标题行开始（否则是第一个标题之前的内容）
+    titles: List[str]   # 这段区间产出的章节标题：标题区间恰好一个，开头区间 0 或 1 个
+
+
+class RebuildPlan(NamedTuple):
+    """增量重建计划：复用 `reused` 的章节，从 `resume` 字节处继续解析"""
+    resume: int
+    reused: List[ChapterRange]
+    segments: List[DecodedSegment]   # `resume` 之前各字节区间的编码
+
+
+def sidecar_path(output_path: Path) -> Path:
+    return output_path.with_name(output_path.name + SIDECAR_SUFFIX)
+
+
+def plan_rebuild(input_path: Path, output_path: Path, options: dict) -> Optional[RebuildPlan]:
+    """
+    对照上一次的侧车文件，找出新文件中从开头起连续未变的章节
+
+    侧车文件缺失、选项或版本不同、上次的 EPUB 已被替换、或者没有可复用的
+    章节时返回 None，调用方应完整重建。最后一个未变的章节总会重新解析：
+    新追加的正文可能接在它的末尾。
+    """
+    try:
+        state = json.loads(sidecar_path(output_path).read_text(encoding='utf-8'))
+        st = output_path.stat()
+    except (OSError, ValueError):
+        return None
+    # 选项经过一次 JSON 往返再比较（元组在侧车文件里存成了列表）
+    options = json.loads(json.dumps(options, ensure_ascii=False))
+    if state.get('version') != __version__ or state.get('options') != options \
+            or state.get('epub') != [st.st_size, st.st_mtime_ns]:
+        return None
+    ranges = [ChapterRange(*r) for r in state['ranges']]
+    segments = [DecodedSegment(*seg) for seg in state['segments']]
+
+    with open(input_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            unchanged = 0
+            for r in ranges:
+                end = r.offset + r.length
+                if end > size or range_digest(mm[r.offset:end]) != r.digest:
+                    break
+                unchanged += 1
+
+            # 从最后一个未变的标题区间续读；续读点必须仍是一个标题行
+            resume_at = min(unchanged, len(ranges) - 1)
+            while resume_at > 0 and not ranges[resume_at].heading:
+                resume_at -= 1
+            if resume_at == 0:
+                return None
+            resume = ranges[resume_at].offset
+            line_end = mm.find(b'\n', resume)
+            first_line = mm[resume:line_end if line_end >= 0 else size]
+
+    i = bisect.bisect_right([seg.start for seg in segments], resume) - 1
+    line_pat = merge_heading_pattern(options['chapter_regex'])
+    if i < 0 or not line_pat.match(first_line.decode(segments[i].encoding, 'replace').rstrip()):
+        return None
+    return RebuildPlan(resume, ranges[:resume_at],
+                       [seg._replace(end=min(seg.end, resume)) for seg in segments if seg.start < resume])
+
+
+def iter_reused_chapters(output_path: Path, reused: List[ChapterRange]) -> Iterator[Tuple[str, CompressedMember]]:
+    """按书脊顺序读出上一次 EPUB 中可复用章节的压缩数据"""
+    with zipfile.ZipFile(output_path) as zf, open(output_path, 'rb') as fp:
+        index = 0
+        for r in reused:
+            for title in r.titles:
+                index += 1
+                info = zf.getinfo(f'EPUB/chap_{index}.xhtml')
+                yield title, read_compressed_member(fp, info)
+
+
+def scan_headings(
+        input_path: Path,
+        start: int,
+        encoding: Optional[str],
+        decode_report: List[DecodedSegment],
+        chapter_regex: str = CHAPTER_REGEX,
+        clean_rules: Optional[list] = None,
+) -> Optional[List[int]]:
+    """
+    找出 `start` 之后每个会被 `iter_chapters` 当作章节开头的标题行的字节偏移
+
+    逐块解码（不整体载入内存），在文本上定位候选标题行，再把字符位置换算回
+    字节偏移（见 `utils.chapter_index.HeadingScanner`）。各字节区间使用的编码取自 `encoding`，未指定时取自解码报告。
+    `clean_rules` 与解析时相同，含有净化会删改的内容的标题行按净化后的行判断。
+    编码不能按 b'\\n' 切行（UTF-16/32）时返回 None。
+    """
+    chapter_pat = chapter_pattern(chapter_regex)
+
+    with open(input_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if encoding:
+            regions = [(start, size, encoding)]
+        else:
+            regions = [(max(seg.start, start), seg.end, seg.encoding)
+                       for seg in decode_report if seg.end > start]
+        if not all(splits_on_newline(codec) for _, _, codec in regions):
+            return None
+        if size == 0:
+            return []
+
+        offsets = []
+        # 从中间续读时 `start` 必是标题行，之前的状态不影响结果
+        scanner = HeadingScanner(chapter_pat, merge_heading_pattern(chapter_regex), clean_rules)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for begin, end, codec in regions:
+                if begin == 0 and mm[:3] == codecs.BOM_UTF8:
+                    begin = 3
+                for pos, cut in iter_line_blocks(mm, begin, end):
+                    text = mm[pos:cut].decode(codec, 'surrogateescape')
+                    offsets.extend(offset for offset, _, _ in scanner.scan([(pos, codec, text)]))
+            offsets.extend(offset for offset, _, _ in scanner.finish())
+    return offsets
+
+
+def chapter_ranges(
+        input_path: Path,
+        start: int,
+        headings: List[int],
+        titles: List[str],
+) -> Optional[List[ChapterRange]]:
+    """
+    把 `start` 之后的标题行偏移与解析得到的章节标题对应起来，切成 `ChapterRange`
+
+    每个标题行恰好产出一章；`start == 0` 时第一个标题之前的内容可能产出
+    一个"前言"。数量对不上（例如净化或特殊换行符改变了切分）时返回 None，
+    这种文件不做增量重建。
+    """
+    with open(input_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        bounds = list(headings)
+        has_prefix = start == 0 and (not headings or headings[0] > 0)
+        if has_prefix:
+            bounds.insert(0, 0)
+        prefix_titles = len(titles) - len(headings)
+        if size == 0 or prefix_titles not in ((0, 1) if has_prefix else (0,)):
+            return None
+        # 从中间续读时，第一行必须就是标题行
+        if not bounds or bounds[0] != start or bounds != sorted(set(bounds)):
+            return None
+
+        ranges = []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            title_iter = iter(titles)
+            for i, offset in enumerate(bounds):
+                end = bounds[i + 1] if i + 1 < len(bounds) else size
+                heading = not (has_prefix and i == 0)
+                count = 1 if heading else prefix_titles
+                ranges.append(ChapterRange(
+                    offset, end - offset, range_digest(mm[offset:end]), heading,
+                    [next(title_iter) for _ in range(count)],
+                ))
+    return ranges
+
+
+def save_sidecar(
+        output_path: Path,
+        options: dict,
+        ranges: List[ChapterRange],
+        segments: List[DecodedSegment],
+) -> None:
+    """EPUB 写好之后记录本次的章节区间和各字节区间的编码，连同 EPUB 的大小和修改时间"""
+    st = output_path.stat()
+    state = {
+        'version': __version__,
+        'options': options,
+        'epub': [st.st_size, st.st_mtime_ns],
+        'segments': [list(seg) for seg in segments],
+        'ranges': [list(r) for r in ranges],
+    }
+    path = sidecar_path(output_path)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(state, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+def drop_sidecar(output_path: Path) -> None:
+    sidecar_path(output_path).unlink(missing_ok=True)
@@ -0,0 +1,266 @@
+# utils/profiler.py
+import cProfile
+import json
+import time
+import tracemalloc
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 当前生效的 Profiler；None 时 `stage()` 返回空操作对象，几乎没有开销
+_active: Optional['Profiler'] = None
+
+
+class StageStats:
+    """单个阶段的累计数据；耗时不含嵌套在其中的子阶段"""
+
+    __slots__ = ('name', 'calls', 'wall', 'cpu', 'bytes_in', 'bytes_out', 'peak')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.peak = 0
+
+    def as_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'wall': round(self.wall, 6),
+            'cpu': round(self.cpu, 6),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'mb_per_s': round(self.bytes_in / 1024 / 1024 / self.wall, 2) if self.bytes_in and self.wall > 0 else None,
+            'peak_bytes': self.peak,
+        }
+
+
+class _Stage:
+    """`stage()` 返回的上下文：进入时暂停外层阶段，退出时恢复"""
+
+    __slots__ = ('profiler', 'stats', 'bytes_in', 'resumed_wall', 'resumed_cpu', 'peak')
+
+    def __init__(self, profiler: 'Profiler', stats: StageStats, bytes_in: int):
+        self.profiler = profiler
+        self.stats = stats
+        self.bytes_in = bytes_in
+
+    def add_input(self, size: int) -> None:
+        self.stats.bytes_in += size
+
+    def add_output(self, size: int) -> None:
+        self.stats.bytes_out += size
+
+    def __enter__(self):
+        self.profiler._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler._pop(self)
+
+
+class _NullStage:
+    """未开启性能分析时的空操作阶段"""
+
+    __slots__ = ()
+
+    def add_input(self, size: int) -> None:
+        pass
+
+    def add_output(self, size: int) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str, bytes_in: int = 0):
+    """
+    标记一段属于某个处理阶段的代码::
+
+        with stage('clean_text', len(text)) as st:
+            text = rule_set.clean(text)
+            st.add_output(len(text))
+
+    阶段可以嵌套，外层阶段的耗时自动扣除内层阶段。文本的输入输出按字符数计。
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _Stage(_active, _active.stats_for(name), bytes_in)
+
+
+def profiling() -> bool:
+    """当前是否有 Profiler 生效；额外的统计（如字符数）只在生效时计算"""
+    return _active is not None
+
+
+class Profiler:
+    """
+    记录流水线各阶段的墙钟时间、CPU 时间、输入输出量、吞吐量和 tracemalloc 峰值
+
+    用作上下文管理器，期间代码里的 `stage()` 都会计入本对象::
+
+        with Profiler() as profiler:
+            convert_txt(...)
+        print(profiler.format_table())
+
+    阶段在流式处理中交替执行（解码一块、合并、切分、净化一章、写入 ZIP……），
+    这里按"独占时间"统计：进入子阶段时暂停外层阶段，所以各阶段耗时之和加上
+    "其他"即为总耗时。
+
+    :param memory: 是否用 tracemalloc 记录各阶段的内存峰值（会拖慢运行）
+    :param cprofile_stage: 只在该阶段执行时开启 cProfile；'all' 表示整个运行过程
+    """
+
+    def __init__(self, *, memory: bool = True, cprofile_stage: Optional[str] = None):
+        self.memory = memory
+        self.cprofile_stage = cprofile_stage
+        self.stats: Dict[str, StageStats] = {}
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+        self._stack: List[_Stage] = []
+        self._cprofile = cProfile.Profile() if cprofile_stage else None
+        self._cprofile_on = False
+        self._started_memory = False
+
+    def stats_for(self, name: str) -> StageStats:
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = StageStats(name)
+        return stats
+
+    def __enter__(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError("同一时间只能有一个 Profiler 生效")
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_memory = True
+        _active = self
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._set_cprofile(self.cprofile_stage == 'all')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        self._set_cprofile(False)
+        self.wall += time.perf_counter() - self._start_wall
+        self.cpu += time.process_time() - self._start_cpu
+        if self.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            if self._started_memory:
+                tracemalloc.stop()
+        _active = None
+
+    def _push(self, entry: _Stage) -> None:
+        now_wall, now_cpu = time.perf_counter(), time.process_time()
+        if self._stack:
+            self._pause(self._stack[-1], now_wall, now_cpu)
+        entry.stats.calls += 1
+        entry.stats.bytes_in += entry.bytes_in
+        entry.resumed_wall, entry.resumed_cpu, entry.peak = now_wall, now_cpu, 0
+        self._stack.append(entry)
+        if self.memory:
+            tracemalloc.reset_peak()
+        self._sync_cprofile()
+
+    def _pop(self, entry: _Stage) -> None:
+        now_wall, now_cpu = time.perf_counter(), time.process_time()
+        self._pause(entry, now_wall, now_cpu)
+        self._stack.pop()
+        if self.memory:
+            # 外层阶段的峰值也要覆盖子阶段运行期间的峰值
+            entry.stats.peak = max(entry.stats.peak, entry.peak)
+            self.peak = max(self.peak, entry.peak)
+            if self._stack:
+                self._stack[-1].peak = max(self._stack[-1].peak, entry.peak)
+            tracemalloc.reset_peak()
+        if self._stack:
+            self._stack[-1].resumed_wall, self._stack[-1].resumed_cpu = time.perf_counter(), time.process_time()
+        self._sync_cprofile()
+
+    def _pause(self, entry: _Stage, now_wall: float, now_cpu: float) -> None:
+        entry.stats.wall += now_wall - entry.resumed_wall
+        entry.stats.cpu += now_cpu - entry.resumed_cpu
+        if self.memory:
+            entry.peak = max(entry.peak, tracemalloc.get_traced_memory()[1])
+
+    def _sync_cprofile(self) -> None:
+        if self._cprofile is not None and self.cprofile_stage != 'all':
+            self._set_cprofile(bool(self._stack) and self._stack[-1].stats.name == self.cprofile_stage)
+
+    def _set_cprofile(self, on: bool) -> None:
+        if self._cprofile is None or on == self._cprofile_on:
+            return
+        if on:
+            self._cprofile.enable()
+        else:
+            self._cprofile.disable()
+        self._cprofile_on = on
+
+    def report(self) -> dict:
+        """JSON 可序列化的结果；"其他"为不属于任何阶段的耗时"""
+        stages = [s.as_dict() for s in self.stats.values()]
+        other_wall = self.wall - sum(s.wall for s in self.stats.values())
+        other_cpu = self.cpu - sum(s.cpu for s in self.stats.values())
+        return {
+            'total': {'wall': round(self.wall, 6), 'cpu': round(self.cpu, 6),
+                      'peak_bytes': self.peak if self.memory else None},
+            'other': {'wall': round(max(other_wall, 0.0), 6), 'cpu': round(max(other_cpu, 0.0), 6)},
+            'memory_traced': self.memory,
+            'stages': stages,
+        }
+
+    def write_json(self, path: Path) -> None:
+        Path(path).write_text(json.dumps(self.report(), ensure_ascii=False, indent=2), encoding='utf-8')
+
+    def write_pstats(self, path: Path) -> None:
+        """写出 cProfile 结果，可用 `python -m pstats` 或 snakeviz 查看"""
+        if self._cprofile is None:
+            raise ValueError("未指定 cprofile_stage，没有 cProfile 结果")
+        self._cprofile.dump_stats(str(path))
+
+    def format_table(self) -> str:
+        """便于阅读的表格；文本阶段的输入输出按字符数计"""
+        report = self.report()
+        total = report['total']['wall'] or 1e-9
+        rows = [('阶段', '次数', '墙钟(s)', 'CPU(s)', '占比', '输入', '输出', 'MB/s', '内存峰值')]
+        for s in sorted(report['stages'], key=lambda s: -s['wall']):
+            rows.append((s['name'], s['calls'], f"{s['wall']:.3f}", f"{s['cpu']:.3f}", f"{s['wall'] / total:.1%}",
+                         _size(s['bytes_in']), _size(s['bytes_out']),
+                         '-' if s['mb_per_s'] is None else s['mb_per_s'],
+                         _size(s['peak_bytes']) if self.memory else '-'))
+        other = report['other']
+        rows.append(('其他', '', f"{other['wall']:.3f}", f"{other['cpu']:.3f}", f"{other['wall'] / total:.1%}",
+                     '', '', '', ''))
+        rows.append(('合计', '', f"{report['total']['wall']:.3f}", f"{report['total']['cpu']:.3f}", '',
+                     '', '', '', _size(report['total']['peak_bytes']) if self.memory else '-'))
+        return "\n".join(_pad(row[0], 18, left=True) + ''.join(_pad(cell, 10) for cell in row[1:]) for row in rows)
+
+
+def _pad(cell, width: int, left: bool = False) -> str:
+    """按显示宽度补齐（中文字符占两列）"""
+    text = str(cell)
+    fill = ' ' * max(width - sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1 for c in text), 0)
+    return text + fill if left else fill + text
+
+
+def _size(n: int) -> str:
+    if not n:
+        return "0"
+    for unit in ('', 'K', 'M', 'G'):
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == '' else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}T"
@@ -0,0 +1,83 @@
+# utils/spine.py
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
+
+from utils.toc import is_volume_heading
+
+
+class SpinePacking(NamedTuple):
+    """
+    书脊上每个 XHTML 文件的大小，按正文的 UTF-8 字节数计；全部为默认值时
+    每章一个文件
+
+    target_bytes: 相邻的短章节合并成约这么大的文件，0 表示不合并
+    max_bytes:    单个文件的上限，更长的章节在段落边界拆成几个文件，0 表示不拆
+    """
+    target_bytes: int = 0
+    max_bytes: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.target_bytes > 0 or self.max_bytes > 0
+
+
+class Section(NamedTuple):
+    """XHTML 文件中的一段：`part` 为 0 时是一章的开头，目录指向这里；拆开的长章节后续部分依次为 1、2……"""
+    title: str
+    body: str
+    part: int = 0
+
+
+def pack_chapters(
+        chapters: Iterable[Tuple[str, str]],
+        packing: SpinePacking = SpinePacking(),
+) -> Iterator[List[Section]]:
+    """
+    把 `(标题, 正文)` 流式地装成一个个 XHTML 文件，每次产出一个文件的各段
+
+    相邻的短章节依次装进同一个文件，直到再装一章就会超过 `target_bytes`；
+    卷标题（见 `utils.toc.is_volume_heading`）总是另起一个文件，分卷输出
+    可以按文件判断。超过 `max_bytes` 的章节单独拆成几个文件。不启用时每章
+    恰好一个文件。
+    """
+    target, limit = packing
+    if limit and target > limit:
+        target = limit
+    pending: List[Section] = []
+    size = 0
+    for title, body in chapters:
+        length = len(body.encode('utf-8'))
+        if limit and length > limit:
+            if pending:
+                yield pending
+                pending, size = [], 0
+            for part, text in enumerate(_split_body(body, limit)):
+                yield [Section(title, text, part)]
+            continue
+        if pending and (not target or size + length > target or is_volume_heading(title)):
+            yield pending
+            pending, size = [], 0
+        pending.append(Section(title, body))
+        size += length
+    if pending:
+        yield pending
+
+
+def _split_body(body: str, limit: int) -> Iterator[str]:
+    """在段落（行）边界把正文拆成不超过 `limit` 字节的几段；单个段落超长时按字符数硬切"""
+    lines: List[str] = []
+    size = 0
+    for line in body.split('\n'):
+        length = len(line.encode('utf-8')) + 1
+        if lines and size + length > limit:
+            yield '\n'.join(lines)
+            lines, size = [], 0
+        if length > limit:
+            # 按最坏情况每字符 4 字节估算，切出的每段都不超过上限
+            step = max(limit // 4, 1)
+            pieces = [line[i:i + step] for i in range(0, len(line), step)]
+            yield from pieces[:-1]
+            line, length = pieces[-1], len(pieces[-1].encode('utf-8')) + 1
+        lines.append(line)
+        size += length
+    if lines:
+        yield '\n'.join(lines)
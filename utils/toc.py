@@ -0,0 +1,52 @@
+# utils/toc.py
+import re
+from typing import List, NamedTuple, Sequence
+
+# 视为"卷"的章节标题：分卷输出、分层目录共用
+VOLUME_HEADING_REGEX = r"^\s*(?:第[零〇一二三四五六七八九十百千万\d]+\s*[卷部篇]|Book\s+(?:[IVXLCM]+|\d+)\b)"
+_VOLUME_HEADING_PAT = re.compile(VOLUME_HEADING_REGEX, re.IGNORECASE)
+
+# 章节数不超过这个值时目录保持一层
+TOC_FLAT_LIMIT = 300
+
+# 没有卷标题时，按这么多章一组生成"第1–100章"这样的分组
+TOC_GROUP_SIZE = 100
+
+
+class TocNode(NamedTuple):
+    """目录的一项：指向第 `index` 章（从 0 开始），`children` 为下一层的章节下标"""
+    label: str
+    index: int
+    children: range
+
+
+def is_volume_heading(title: str) -> bool:
+    return _VOLUME_HEADING_PAT.match(title) is not None
+
+
+def build_toc(titles: Sequence[str], group_size: int = TOC_GROUP_SIZE,
+              flat_limit: int = TOC_FLAT_LIMIT) -> List[TocNode]:
+    """
+    生成两层目录
+
+    章节数不超过 `flat_limit`（或 `group_size` 为 0）时只有一层。否则有两个
+    以上卷标题（"第X卷""第X部""第X篇""Book N"）时按卷分组：卷标题本身是分组的
+    链接，其后到下一卷之前的章节是它的下一层，第一卷之前的章节留在第一层；
+    没有卷标题时每 `group_size` 章一组，标签为"第1–100章"（按章节顺序计数），
+    链接指向组内第一章。阅读器打开目录时只需展示几十个分组。
+    """
+    count = len(titles)
+    if group_size <= 0 or count <= flat_limit:
+        return [TocNode(title, idx, range(0)) for idx, title in enumerate(titles)]
+
+    volumes = [idx for idx, title in enumerate(titles) if is_volume_heading(title)]
+    # 卷太多（比如每章都叫"第X篇"）时分卷起不到收拢作用，退回按章数分组
+    if len(volumes) >= 2 and volumes[0] + len(volumes) <= flat_limit:
+        toc = [TocNode(titles[idx], idx, range(0)) for idx in range(volumes[0])]
+        for start, end in zip(volumes, [*volumes[1:], count]):
+            toc.append(TocNode(titles[start], start, range(start + 1, end)))
+        return toc
+
+    return [TocNode(f"第{start + 1}–{min(start + group_size, count)}章", start,
+                    range(start, min(start + group_size, count)))
+            for start in range(0, count, group_size)]
@@ -1,20 +1,94 @@
 # utils/txt_reader.py
+import codecs
+import functools
+import io
+import mmap
+import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import charset_normalizer
 
 from pathlib import Path
-from typing import List, Tuple, Optional, Any
+from typing import List, Tuple, Optional, Any, Callable, Iterable, Iterator, NamedTuple, BinaryIO
 
+from utils.text_cleaner import CleanRuleSet, get_rule_set
+from utils.profiler import profiling, stage
 
-def detect_encoding(file_path: Path) -> tuple[Any, Any]:
-    """通过读取文件来推断编码，优先考虑中文编码"""
+
+# 默认正则各分支标题的首字符。正则开头先用这个字符集做前瞻检查，绝大多数
+# 正文行在这一步就被排除，不必逐个尝试后面的长分支；IGNORECASE 时字符集
+# 同样忽略大小写
+HEADING_FIRST_CHARS = "第序前引楔尾后终CSPBIEFA"
+
+# 默认章节标题正则（read_txt / iter_chapters / merge_lines 共用）
+CHAPTER_REGEX = r"^(?=\s*[" + HEADING_FIRST_CHARS + r"])\s*(?P<title>(?:第([零〇一二三四五六七八九十百千万\d]+|[IVXLCM]+)\s*[章节回卷部篇]|(?:Chapter|Section|Part|Book)\s+([IVXLCM]+|\d+)|(?:Prologue|Epilogue|Introduction|Preface|Foreword|Afterword|Appendix|Interlude|Prelude|Conclusion|Summary|Postscript)\b|序[章言]|前[言章]|引[言子]|楔子|尾声|后记|终章)[^\n]{0,50})"
+
+# read_txt / iter_chapters 匹配章节标题时的正则标志
+CHAPTER_FLAGS = re.IGNORECASE | re.VERBOSE | re.MULTILINE
+
+
+@functools.lru_cache(maxsize=32)
+def chapter_pattern(chapter_regex: str = CHAPTER_REGEX) -> re.Pattern:
+    """按 `CHAPTER_FLAGS` 编译章节正则；同一正则只编译一次，切分、建索引、增量重建共用"""
+    return re.compile(chapter_regex, CHAPTER_FLAGS)
+
+
+class HeadingMatcher:
+    """
+    判断一行是否章节标题，结果与"先净化全文、再匹配标题"（`read_txt`）一致
+
+    逐章读取时标题要在净化之前识别。行内有净化规则会改写的内容（如行首
+    的 □、私有区字符）时，先用 `CleanRuleSet.clean_line` 净化这一行再匹配，
+    否则直接匹配；绝大多数行只多一次查找。
+    """
+
+    __slots__ = ('_match', '_changes', '_clean')
+
+    def __init__(self, chapter_pat: re.Pattern, rule_set: CleanRuleSet):
+        self._match = chapter_pat.match
+        self._changes = rule_set.changes_line
+        self._clean = rule_set.clean_line
+
+    def match(self, line: str) -> Optional[re.Match]:
+        """匹配时返回 Match（行被净化过时对应净化后的行），否则返回 None"""
+        if self._changes(line):
+            return self._match(self._clean(line))
+        return self._match(line)
+
+
+# 编码检测的采样预算（字节）与窗口数
+DETECT_SAMPLE_BUDGET = 1024 * 1024
+DETECT_SAMPLE_WINDOWS = 8
+
+
+def detect_encoding(
+        file_path: Path,
+        *,
+        sample_budget: Optional[int] = DETECT_SAMPLE_BUDGET,
+        sample_windows: int = DETECT_SAMPLE_WINDOWS
+) -> tuple[Any, Any]:
+    """
+    通过读取文件来推断编码，优先考虑中文编码
+
+    文件不超过 `sample_budget` 字节时读取全文；更大的文件通过 mmap 只采样
+    `sample_windows` 个窗口（开头、均匀分布的中段、结尾），采样总量不超过
+    `sample_budget`，检测耗时不随文件增大而增长。`sample_budget=None`
+    表示始终读取全文。
+    """
     try:
-        raw = open(file_path, 'rb').read()
+        raw = _read_detection_sample(file_path, sample_budget, sample_windows)
     except Exception as e:
         # 如果无法读取文件，返回默认编码
         return 'utf-8', 0.0
 
+    with stage('detect_encoding', len(raw)):
+        return _detect_bytes(raw)
+
+
+def _detect_bytes(raw: bytes) -> tuple[Any, Any]:
+    """对一段字节推断编码（`detect_encoding` 与分段解码共用）"""
     # 使用 charset_normalizer 检测编码
     try:
         res = charset_normalizer.detect(raw)
@@ -68,13 +142,323 @@ def detect_encoding(file_path: Path) -> tuple[Any, Any]:
     return detected_encoding or 'utf-8', confidence or 0.0
 
 
+def _read_detection_sample(
+        file_path: Path,
+        sample_budget: Optional[int],
+        sample_windows: int
+) -> bytes:
+    """读取用于编码检测的字节：小文件读全文，大文件用 mmap 按窗口采样"""
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if sample_budget is None or size <= sample_budget:
+            return f.read()
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # UTF-16 按换行对齐没有意义，开头窗口带 BOM 已足够判断
+            if mm[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+                return mm[:sample_budget]
+
+            windows = max(sample_windows, 2)
+            window = max(sample_budget // windows, 1)
+            step = (size - window) / (windows - 1)
+
+            chunks = []
+            for i in range(windows):
+                start = int(i * step)
+                chunks.append(_aligned_window(mm, start, min(start + window, size)))
+            return b''.join(chunks)
+
+
+def _aligned_window(mm: mmap.mmap, start: int, end: int) -> bytes:
+    """
+    把 [start, end) 收缩到字符边界上
+
+    优先对齐到换行符（在 UTF-8/GBK/GB2312/Big5 中 0x0A 都不会出现在多字节
+    字符内部）；窗口内没有换行时，跳过 UTF-8 的续字节。
+    """
+    size = len(mm)
+    if start > 0:
+        nl = mm.find(b'\n', start, end)
+        if nl != -1:
+            start = nl + 1
+        else:
+            while start < end and 0x80 <= mm[start] < 0xC0:
+                start += 1
+    if end < size:
+        nl = mm.rfind(b'\n', start, end)
+        if nl != -1:
+            end = nl + 1
+        else:
+            while end > start and 0x80 <= mm[end] < 0xC0:
+                end -= 1
+    return mm[start:end]
+
+
+# 自动解码时每次读取的块大小（字节），块边界对齐到换行符
+DECODE_BLOCK_SIZE = 1024 * 1024
+
+# 分段检测编码时交给 charset_normalizer 的最大字节数
+DECODE_DETECT_WINDOW = 64 * 1024
+
+# 字节 -> 高 4 位分组（ASCII 字节映射为 0，不参与段特征）
+_NIBBLE_TABLE = bytes((b >> 4) if b >= 0x80 else 0 for b in range(256))
+_BIG5_TRAIL = re.compile(rb'[\x81-\xfe][\x40-\x7e]')
+
+
+class DecodedSegment(NamedTuple):
+    """解码报告中的一项：字节区间 [start, end) 使用的编码"""
+    start: int
+    end: int
+    encoding: str
+
+
+def decode_bytes(raw: bytes, decode_report: Optional[list] = None) -> str:
+    """
+    把整段字节解码为文本，不要求全文使用同一种编码
+
+    先做一次严格 UTF-8 解码，成功时完全跳过 charset_normalizer；失败时
+    在换行处分段，逐段检测并解码（见 `_SegmentDecoder`）。
+    `decode_report` 不为 None 时，追加 `DecodedSegment` 记录每个字节区间
+    所用的编码。
+    """
+    for bom, encoding in _UNICODE_BOMS:
+        if raw.startswith(bom):
+            _record_segment(decode_report, 0, len(raw), encoding)
+            return raw.decode(encoding, errors="replace")
+
+    start = len(codecs.BOM_UTF8) if raw.startswith(codecs.BOM_UTF8) else 0
+    try:
+        text = str(memoryview(raw)[start:], 'utf-8')
+    except UnicodeDecodeError:
+        pass
+    else:
+        _record_segment(decode_report, start, len(raw), 'utf-8')
+        return text
+
+    decoder = _SegmentDecoder(decode_report)
+    with io.BytesIO(raw) as f:
+        f.seek(start)
+        return ''.join(decoder.decode(block, start + offset) for offset, block in _iter_raw_blocks(f))
+
+
+# 带 BOM 的 UTF-16/32 整体按 BOM 解码，不做分段
+_UNICODE_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def _record_segment(decode_report: Optional[list], start: int, end: int, encoding: str) -> None:
+    """向解码报告追加一段，与前一段相邻且编码相同时直接合并"""
+    if decode_report is None or start >= end:
+        return
+    if decode_report and decode_report[-1].encoding == encoding and decode_report[-1].end == start:
+        decode_report[-1] = decode_report[-1]._replace(end=end)
+    else:
+        decode_report.append(DecodedSegment(start, end, encoding))
+
+
+class _SegmentDecoder:
+    """
+    逐段解码可能混有多种编码的字节流
+
+    每段先尝试严格 UTF-8；失败时在出错位置之前的换行处切开，已能解码的
+    部分照常输出。剩余部分是一段非 UTF-8 文本，到其后第一个能按严格 UTF-8
+    解码、且含有非 ASCII 字符的行为止（纯 ASCII 行两种编码都一样，归入
+    这一段），旧编码不会越过这个边界把后面的 UTF-8 解成乱码。这段依次尝试：
+    只对这段字节检测（按段特征缓存，未命中才调用 charset_normalizer）的
+    编码、上一次成功的非 UTF-8 编码、gb18030、big5。所有编码都无法严格
+    解码的行，用检测到的编码以 `errors="replace"` 解码。
+    """
+
+    def __init__(self, decode_report: Optional[list] = None):
+        self.decode_report = decode_report
+        self._fallback: Optional[str] = None  # 上一次成功的非 UTF-8 编码
+        self._cache: dict = {}                # 段特征 -> 检测到的编码
+
+    def decode(self, data: bytes, offset: int = 0) -> str:
+        """解码 `data`（位于原始字节流的 `offset` 处），返回文本"""
+        view = memoryview(data)
+        parts = []
+        pos, n = 0, len(data)
+        while pos < n:
+            end, encoding, text = self._decode_utf8(data, view, pos)
+            if end == pos:
+                limit = _legacy_run_end(data, pos)
+                end, encoding, text = self._decode_legacy(data, view, pos, limit)
+            if end == pos:
+                # 没有编码能严格解码当前行：退回到检测结果并替换坏字节
+                end = data.find(b'\n', pos) + 1 or n
+                encoding = self._detect(data, pos, end)
+                text = str(view[pos:end], encoding, 'replace')
+            parts.append(text)
+            _record_segment(self.decode_report, offset + pos, offset + end, encoding)
+            pos = end
+        return ''.join(parts)
+
+    @staticmethod
+    def _decode_utf8(data: bytes, view: memoryview, pos: int) -> Tuple[int, str, str]:
+        """从 `pos` 起按严格 UTF-8 解码尽量多的整行，返回 (结束位置, 编码, 文本)"""
+        try:
+            return len(data), 'utf-8', str(view[pos:], 'utf-8')
+        except UnicodeDecodeError as e:
+            end = data.rfind(b'\n', pos, pos + e.start) + 1
+            if end <= pos:
+                return pos, '', ''
+            return end, 'utf-8', str(view[pos:end], 'utf-8')
+
+    def _decode_legacy(self, data: bytes, view: memoryview, pos: int, limit: int) -> Tuple[int, str, str]:
+        """在 [pos, limit) 内找一个至少能严格解码一整行的非 UTF-8 编码，返回 (结束位置, 编码, 文本)"""
+        tried = {'utf-8'}
+        for encoding in (self._detect(data, pos, limit), self._fallback, 'gb18030', 'big5'):
+            if encoding is None or encoding in tried:
+                continue
+            tried.add(encoding)
+            try:
+                end, text = limit, str(view[pos:limit], encoding)
+            except UnicodeDecodeError as e:
+                end = data.rfind(b'\n', pos, pos + e.start) + 1
+                if end <= pos:
+                    continue
+                text = str(view[pos:end], encoding)
+            except LookupError:
+                continue
+            self._fallback = encoding
+            return end, encoding, text
+        return pos, '', ''
+
+    def _detect(self, data: bytes, pos: int, limit: int) -> str:
+        """检测 [pos, limit) 开头一个窗口的编码；特征相同的窗口复用之前的检测结果"""
+        limit = min(limit, pos + DECODE_DETECT_WINDOW)
+        end = data.rfind(b'\n', pos, limit) + 1 or limit
+        window = data[pos:end]
+        signature = (frozenset(window.translate(_NIBBLE_TABLE)), _BIG5_TRAIL.search(window) is not None)
+        encoding = self._cache.get(signature)
+        if encoding is None:
+            with stage('detect_encoding', len(window)):
+                encoding = _detect_bytes(window)[0]
+            try:
+                encoding = codecs.lookup(encoding).name
+            except LookupError:
+                encoding = self._fallback or 'gb18030'
+            self._cache[signature] = encoding
+        return encoding
+
+
+# 一整行严格 UTF-8 且至少有一个多字节字符（不跨过 '\n'）
+_UTF8_MULTIBYTE = (rb'(?:[\xc2-\xdf][\x80-\xbf]|\xe0[\xa0-\xbf][\x80-\xbf]|[\xe1-\xec\xee\xef][\x80-\xbf]{2}'
+                   rb'|\xed[\x80-\x9f][\x80-\xbf]|\xf0[\x90-\xbf][\x80-\xbf]{2}|[\xf1-\xf3][\x80-\xbf]{3}'
+                   rb'|\xf4[\x80-\x8f][\x80-\xbf]{2})')
+_UTF8_LINE = re.compile(rb'(?m)^[\x00-\x09\x0b-\x7f]*' + _UTF8_MULTIBYTE
+                        + rb'(?:[\x00-\x09\x0b-\x7f]|' + _UTF8_MULTIBYTE + rb')*$')
+
+
+def _legacy_run_end(data: bytes, pos: int) -> int:
+    """`pos` 所在行（不是 UTF-8）之后，第一个严格 UTF-8 且含非 ASCII 字符的行的行首；没有时为末尾"""
+    line_end = data.find(b'\n', pos) + 1
+    if not line_end:
+        return len(data)
+    m = _UTF8_LINE.search(data, line_end)
+    return m.start() if m else len(data)
+
+
+def _iter_raw_blocks(f: BinaryIO, block_size: int = DECODE_BLOCK_SIZE) -> Iterator[Tuple[int, bytes]]:
+    """按块读取字节流，每块都在换行符之后切开，产出 (偏移, 块)"""
+    offset = 0
+    rest = b''
+    while True:
+        chunk = f.read(block_size)
+        if not chunk:
+            break
+        data = rest + chunk if rest else chunk
+        cut = data.rfind(b'\n') + 1
+        if cut == 0:
+            # 整块没有 \n：退而在 \r 处切开（不切在末尾，避免拆开 \r\n）
+            cut = data.rfind(b'\r', 0, len(data) - 1) + 1
+            if cut == 0:
+                rest = data
+                continue
+        rest = data[cut:]
+        yield offset, data[:cut]
+        offset += cut
+    if rest:
+        yield offset, rest
+
+
+def _iter_text_blocks(
+        file_path: Path,
+        encoding: Optional[str],
+        decode_report: Optional[list],
+        start: int = 0,
+        read_progress: Optional[Callable[[int], None]] = None
+) -> Iterator[List[str]]:
+    """增量解码文件，按块产出行列表（与 read_text + splitlines 的切行方式一致）
+
+    每块约 `DECODE_BLOCK_SIZE`，只在完整的行之后切开。`start` 为开始读取的
+    字节偏移，须位于行首；解码报告中的偏移和报给 `read_progress` 的位置仍
+    相对整个文件
+    """
+    if encoding is not None:
+        with open(file_path, 'rb') as raw:
+            raw.seek(start)
+            with io.TextIOWrapper(raw, encoding=encoding, errors="replace") as f:
+                # 换行符已统一成 \n；在最后一个 \n 之后切开，余下的接到下一块
+                rest = ''
+                while True:
+                    with stage('decode') as st:
+                        consumed = raw.tell()
+                        chunk = f.read(DECODE_BLOCK_SIZE)
+                        st.add_input(raw.tell() - consumed)
+                        data = rest + chunk if rest else chunk
+                        cut = data.rfind('\n') + 1 if chunk else len(data)
+                        rest = data[cut:]
+                        lines = data[:cut].splitlines()
+                        st.add_output(cut)
+                    if read_progress is not None:
+                        read_progress(raw.tell())
+                    if lines:
+                        yield lines
+                    if not chunk:
+                        return
+
+    with open(file_path, 'rb') as f:
+        head = f.read(4)
+        for bom, bom_encoding in _UNICODE_BOMS:
+            if head.startswith(bom):
+                _record_segment(decode_report, 0, os.fstat(f.fileno()).st_size, bom_encoding)
+                yield from _iter_text_blocks(file_path, bom_encoding, None, start, read_progress)
+                return
+        f.seek(start)
+
+        decoder = _SegmentDecoder(decode_report)
+        blocks = _iter_raw_blocks(f)
+        while True:
+            with stage('decode') as st:
+                offset, block = next(blocks, (None, None))
+                if block is None:
+                    return
+                st.add_input(len(block))
+                offset += start
+                if offset == 0 and block.startswith(codecs.BOM_UTF8):
+                    block, offset = block[len(codecs.BOM_UTF8):], len(codecs.BOM_UTF8)
+                text = decoder.decode(block, offset)
+                st.add_output(len(text))
+                lines = text.splitlines()
+            if read_progress is not None:
+                read_progress(offset + len(block))
+            yield lines
+
+
 def read_txt(
         file_path: Path,
         encoding: Optional[str] = None,
         *,
-        chapter_regex: str = r"^\s*(?P<title>(?:第([零〇一二三四五六七八九十百千万\d]+|[IVXLCM]+)\s*[章节回卷部篇]|(?:Chapter|Section|Part|Book)\s+([IVXLCM]+|\d+)|(?:Prologue|Epilogue|Introduction|Preface|Foreword|Afterword|Appendix|Interlude|Prelude|Conclusion|Summary|Postscript)\b|序[章言]|前[言章]|引[言子]|楔子|尾声|后记|终章)[^\n]{0,50})",
+        chapter_regex: str = CHAPTER_REGEX,
         split_include_title: bool = False,
-        clean_rules: list = None
+        clean_rules: list | CleanRuleSet = None,
+        decode_report: Optional[list] = None
 ) -> List[str] | List[Tuple[str, str]]:
     """
     读取 TXT 并以 **章节** 列表形式返回。
@@ -87,12 +471,14 @@ def read_txt(
     参数
     ----
     file_path: Path        文件完整路径
-    encoding:  str | None  指定字符编码；若为 None 则用 `detect_encoding`
+    encoding:  str | None  指定字符编码；若为 None 则先尝试严格 UTF-8，失败时
+                           逐段检测编码（见 `decode_bytes`）
     chapter_regex: str     章节标题正则（可覆盖为其它书写习惯）
     split_include_title:  bool
         * False   → 仅返回章节正文（`List[str]`）
         * True    → 返回 `List[(title, body)]`，每个元素包含标题和正文
-    clean_rules: list      文本净化规则列表，默认为None使用默认规则
+    clean_rules: list      文本净化规则列表或 `CleanRuleSet`，默认为None使用默认规则
+    decode_report: list    自动解码时追加 `DecodedSegment`，记录各字节区间的编码
 
     返回
     ----
@@ -101,26 +487,38 @@ def read_txt(
     * **如果 `split_include_title==True`**: `List[Tuple[str, str]]`
       例如 `[("第1章", "正文…"), ("第2章", "正文…")]`
     """
+    # ① 一次性把整个文件读进来；未指定编码时走 UTF-8 快速路径 / 分段解码
     if encoding is None:
-        encoding = detect_encoding(file_path)[0]
-
-    # ① 一次性把整个文件读进来
-    text = file_path.read_text(encoding=encoding, errors="replace")
-    text = merge_lines(text)
+        text = decode_bytes(file_path.read_bytes(), decode_report)
+    else:
+        text = file_path.read_text(encoding=encoding, errors="replace")
+    text = merge_lines(text, chapter_regex)
     
     # ② 文本净化
     text = clean_text(text, clean_rules)
 
-    # ③ 编译正则 - 添加多行匹配模式
-    chapter_pat = re.compile(chapter_regex, re.IGNORECASE | re.VERBOSE | re.MULTILINE)
+    # ③ 按标题切分
+    return split_chapters(text, chapter_regex, split_include_title)
+
 
-    # ③ 找到所有标题的位置信息
+def split_chapters(
+        text: str,
+        chapter_regex: str = CHAPTER_REGEX,
+        split_include_title: bool = False
+) -> List[str] | List[Tuple[str, str]]:
+    """
+    在已合并、净化的全文上按章节标题切分，返回值同 `read_txt`
+    """
+    # ① 编译正则 - 添加多行匹配模式
+    chapter_pat = chapter_pattern(chapter_regex)
+
+    # ② 找到所有标题的位置信息
     matches = list(chapter_pat.finditer(text))
     if not matches:
         # 如果没有任何标题——把完整文本当作"一个章节"返回
         return [text.strip()] if not split_include_title else [("", text.strip())]
 
-    # ④ 逐一切分正文
+    # ③ 逐一切分正文
     result: List[str] | List[Tuple[str, str]] = []
 
     # 处理第一个章节之前的内容（如果有）
@@ -150,85 +548,487 @@ def read_txt(
         else:
             result.append(body)
 
-    # ⑤ 返回最终列表
+    # ④ 返回最终列表
     return result
 
 
-def merge_lines(text):
+def iter_chapters(
+        file_path: Path,
+        encoding: Optional[str] = None,
+        *,
+        chapter_regex: str = CHAPTER_REGEX,
+        clean_rules: list | CleanRuleSet = None,
+        decode_report: Optional[list] = None,
+        start: int = 0,
+        workers: int = 1,
+        read_progress: Optional[Callable[[int], None]] = None
+) -> Iterator[Tuple[str, str]]:
+    """
+    以生成器形式逐章读取 TXT，每次产出一个 `(title, body)`。
+
+    与 `read_txt(..., split_include_title=True)` 的切分结果一致，但不会把
+    整个文件读入内存：
+
+    1. 按块增量解码文件，送入 `merge_lines` 的流式版本
+    2. 在合并后的行上识别章节标题，标题之间的行即为当前章节的窗口；行内
+       有净化规则会删改的内容时按净化后的行判断（见 `HeadingMatcher`），
+       与先净化全文再匹配一致
+    3. 遇到下一个标题时，对窗口做文本净化并产出该章节
+
+    自定义净化规则跨行生效（匹配换行符、带锚点）时，标题识别只考虑规则在
+    单行内的效果，切分可能与 `read_txt` 不同。
+
+    峰值内存取决于最大的单个章节，而不是文件大小。
+
+    参数
+    ----
+    file_path: Path        文件完整路径
+    encoding:  str | None  指定字符编码；若为 None 则按块先尝试严格 UTF-8，
+                           失败时逐段检测编码
+    chapter_regex: str     章节标题正则
+    clean_rules: list      文本净化规则列表或 `CleanRuleSet`，默认为None使用默认规则
+    decode_report: list    自动解码时追加 `DecodedSegment`，记录各字节区间的编码
+    start: int             从该字节偏移开始读取（须是章节标题行的行首），
+                           用于增量重建时只解析变化之后的部分
+    workers: int           大于 1 时把文件按章节边界切成多个字节区间，用进程池
+                           并行解码、合并、净化、切分（见 `_plan_parse_ranges`），
+                           结果与顺序解析完全相同；文件较小或无法安全切分时仍顺序解析
+    read_progress: callable  每读完一块（并行时每解析完一个区间）调用一次，参数为
+                           源文件中已读到的字节偏移，用于按源文件大小显示进度
+
+    产出
+    ----
+    `(title, body)`；第一个标题之前的内容以 `("前言", …)` 产出，
+    全文没有任何标题时以 `("", 全文)` 产出。空文件不产出任何章节。
+    """
+    if workers > 1:
+        plan = _plan_parse_ranges(file_path, encoding, start, chapter_regex, clean_rules)
+        if plan is not None:
+            ranges, segments = plan
+            if decode_report is not None and encoding is None:
+                decode_report.extend(segments)
+            yield from _iter_parallel_chapters(file_path, ranges, workers, chapter_regex, clean_rules,
+                                               read_progress)
+            return
+
+    blocks = _iter_text_blocks(file_path, encoding, decode_report, start, read_progress)
+    try:
+        yield from iter_block_chapters(blocks, chapter_regex=chapter_regex, clean_rules=clean_rules)
+    finally:
+        blocks.close()
+
+
+def iter_block_chapters(
+        blocks: Iterable[List[str]],
+        *,
+        chapter_regex: str = CHAPTER_REGEX,
+        clean_rules: list | CleanRuleSet = None,
+        lookahead: Optional[str] = None
+) -> Iterator[Tuple[str, str]]:
+    """
+    `iter_chapters` 的切分部分：输入按块分组的物理行，逐章产出 `(title, body)`
+
+    块的划分不影响结果，只须每块都是完整的行。`utils.chapter_index` 用它
+    解析按索引取出的字节区间。
+
+    `lookahead` 为紧接在这段文本之后的标题行：并行解析时每个区间都在标题行
+    之前切开，给出下一区间的第一行，区间末尾就按读到该行的方式收尾，与整篇
+    顺序解析的结果一致。
+    """
+    chapter_pat = chapter_pattern(chapter_regex)
+    clean_rules = get_rule_set(clean_rules)  # 只编译一次，逐章复用
+    match_heading = HeadingMatcher(chapter_pat, clean_rules).match
+
+    blocks = iter(blocks)
+    heading_line_pat = merge_heading_pattern(chapter_regex)
+    merger = _LineMerger(heading_line_pat)
+    heading = None          # 当前章节的标题行；None 表示还未遇到任何标题
+    window: List[str] = []  # 当前章节的正文行
+    while True:
+        lines = next(blocks, None)
+        # 字符数只在性能分析时统计，放在计时区之外
+        chars = sum(map(len, lines)) if lines and profiling() else 0
+        with stage('merge_lines', chars) as st:
+            if lines is not None:
+                merged = merger.feed(lines)
+            elif lookahead is None:
+                merged = merger.flush()
+            else:
+                # 送入下一区间的第一行，待定行随之确定；该行本身属于下一区间
+                merged = merger.feed([lookahead])
+                if heading_line_pat.match(lookahead.rstrip()):
+                    merged.pop()
+        chars = sum(map(len, merged)) if profiling() else 0
+        st.add_output(chars)
+
+        # 先在整块上找出已结束的章节，离开计时区再逐章净化、产出
+        finished = []
+        with stage('split_chapters', chars):
+            for line in merged:
+                if match_heading(line) is None:
+                    window.append(line)
+                    continue
+                finished.append((heading, window))
+                heading = line
+                window = []
+
+        for prev_heading, prev_window in finished:
+            if prev_heading is None:
+                preface = clean_text("\n".join(prev_window), clean_rules)
+                if preface:
+                    yield "前言", preface
+            else:
+                yield _split_chapter(prev_heading, prev_window, chapter_pat, clean_rules)
+        if lines is None:
+            break
+
+    if heading is None:
+        text = clean_text("\n".join(window), clean_rules)
+        if text:
+            # 后面还有标题时，这段就是前言
+            yield "前言" if lookahead is not None else "", text
+    else:
+        yield _split_chapter(heading, window, chapter_pat, clean_rules)
+
+
+def _split_chapter(
+        heading: str,
+        window: List[str],
+        chapter_pat: re.Pattern,
+        clean_rules: list | CleanRuleSet = None
+) -> Tuple[str, str]:
+    """把"标题行 + 正文行"净化后拆成 `(title, body)`"""
+    text = clean_text("\n".join([heading, *window]), clean_rules)
+    m = chapter_pat.match(text)
+    if m is None:
+        # 净化规则改写了标题行，退回到标题行本身（需要时先做单行净化）取标题
+        m = chapter_pat.match(heading)
+        if m is None:
+            heading = get_rule_set(clean_rules).clean_line(heading)
+            m = chapter_pat.match(heading)
+        body = clean_text("\n".join([heading[m.end():], *window]), clean_rules)
+        return m.group("title").strip(), body
+    return m.group("title").strip(), text[m.end():].strip()
+
+
+def splits_on_newline(codec: str) -> bool:
+    """该编码能否直接按 b'\\n' 切行（UTF-16/32 不能）"""
+    try:
+        return '\n'.encode(codec) == b'\n' and b'\x00' not in 'a'.encode(codec)
+    except LookupError:
+        return False
+
+
+# 并行解析时每个区间的目标大小（字节）；不足两个区间的文件顺序解析
+PARSE_RANGE_SIZE = 16 * 1024 * 1024
+
+# 从目标切点往后寻找标题行的最大距离（字节），找不到就不在这里切
+PARSE_SNAP_WINDOW = 4 * 1024 * 1024
+
+# 带状态的编码（转义序列跨行生效），不能从任意行首开始解码
+_STATEFUL_CODECS = ('iso2022', 'hz', 'utf-7')
+
+
+class _ParseRange(NamedTuple):
+    """并行解析的一个区间：字节 [start, end)，所用的编码区间，以及下一区间的第一行"""
+    start: int
+    end: int
+    segments: List[DecodedSegment]
+    lookahead: Optional[str]
+
+
+def _line_independent(codec: str) -> bool:
+    """该编码的文本能否在任意 b'\\n' 之后切开、分别解码"""
+    return splits_on_newline(codec) and not codecs.lookup(codec).name.startswith(_STATEFUL_CODECS)
+
+
+def _plan_parse_ranges(
+        file_path: Path,
+        encoding: Optional[str],
+        start: int,
+        chapter_regex: str,
+        clean_rules: list | CleanRuleSet = None
+) -> Optional[Tuple[List[_ParseRange], List[DecodedSegment]]]:
+    """
+    把 [start, 文件末尾) 切成约 `PARSE_RANGE_SIZE` 的区间，返回 (区间, 编码区间)
+
+    切点从目标位置往后移到下一个标题行的行首。只选 merge_lines 单独成行
+    （见 `merge_heading_pattern`）且能被 `chapter_regex` 匹配（见
+    `HeadingMatcher`）的行：它一定是
+    新章节的开头，与前文怎么合并无关，从这里重新开始合并、切分，结果与
+    顺序解析一致。b'\\n' 不会出现在 GBK、Big5、UTF-8 等编码
+    的多字节字符中间，在它之后切开不会拆坏字符。
+
+    未指定编码时先按顺序解析的方式（同样的分块、同样的 `_SegmentDecoder`）
+    跑一遍解码，得到与之相同的编码区间，各区间再按这些编码解码。文件太小、
+    带 UTF-16/32 BOM、含带状态的编码或找不到切点时返回 None。
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size - start < 2 * PARSE_RANGE_SIZE:
+            return None
+        begin = start
+        if encoding is None:
+            head = f.read(4)
+            if any(head.startswith(bom) for bom, _ in _UNICODE_BOMS):
+                return None
+            if start == 0 and head.startswith(codecs.BOM_UTF8):
+                begin = len(codecs.BOM_UTF8)
+            segments = _scan_segments(f, start)
+        else:
+            segments = [DecodedSegment(begin, size, encoding)]
+        if not all(_line_independent(seg.encoding) for seg in segments):
+            return None
+
+        matcher = HeadingMatcher(chapter_pattern(chapter_regex), get_rule_set(clean_rules))
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            cuts = [(begin, None)]
+            for target in range(begin + PARSE_RANGE_SIZE, size - PARSE_RANGE_SIZE // 2, PARSE_RANGE_SIZE):
+                if target <= cuts[-1][0]:
+                    continue
+                cut = _next_heading_line(mm, segments, target, min(target + PARSE_SNAP_WINDOW, size),
+                                         matcher, merge_heading_pattern(chapter_regex))
+                if cut is not None:
+                    cuts.append(cut)
+    if len(cuts) < 2:
+        return None
+
+    ranges = []
+    for (cut_start, _), (cut_end, lookahead) in zip(cuts, [*cuts[1:], (size, None)]):
+        ranges.append(_ParseRange(cut_start, cut_end, _segments_between(segments, cut_start, cut_end), lookahead))
+    return ranges, segments
+
+
+def _scan_segments(f: BinaryIO, start: int) -> List[DecodedSegment]:
+    """与 `_iter_text_blocks` 的自动检测路径相同地分块解码，只保留编码区间"""
+    segments: List[DecodedSegment] = []
+    decoder = _SegmentDecoder(segments)
+    f.seek(start)
+    for offset, block in _iter_raw_blocks(f):
+        with stage('decode', len(block)):
+            offset += start
+            if offset == 0 and block.startswith(codecs.BOM_UTF8):
+                block, offset = block[len(codecs.BOM_UTF8):], len(codecs.BOM_UTF8)
+            decoder.decode(block, offset)
+    return segments
+
+
+def _segments_between(segments: List[DecodedSegment], start: int, end: int) -> List[DecodedSegment]:
+    """与 [start, end) 相交的编码区间，裁剪到区间之内"""
+    return [DecodedSegment(max(seg.start, start), min(seg.end, end), seg.encoding)
+            for seg in segments if seg.start < end and seg.end > start]
+
+
+def _decode_between(mm, segments: List[DecodedSegment], start: int, end: int) -> str:
+    return ''.join(str(mm[seg.start:seg.end], seg.encoding, 'replace')
+                   for seg in _segments_between(segments, start, end))
+
+
+def _next_heading_line(
+        mm,
+        segments: List[DecodedSegment],
+        pos: int,
+        limit: int,
+        matcher: HeadingMatcher,
+        heading_line_pat
+) -> Optional[Tuple[int, str]]:
+    """从 `pos` 之后的第一个行首起逐行查找可作切点的标题行，返回 (字节偏移, 该行)"""
+    pos = mm.find(b'\n', pos - 1, limit) + 1
+    while 0 < pos < limit:
+        line_end = mm.find(b'\n', pos, len(mm)) + 1 or len(mm)
+        lines = _decode_between(mm, segments, pos, line_end).splitlines()
+        line = lines[0] if lines else ''
+        if heading_line_pat.match(line.rstrip()) and matcher.match(line.rstrip()):
+            return pos, line
+        pos = line_end
+    return None
+
+
+def _parse_range(
+        file_path: str,
+        parse_range: _ParseRange,
+        chapter_regex: str,
+        clean_rules: Optional[list]
+) -> List[Tuple[str, str]]:
+    """进程池任务：通过 mmap 读取一个区间，解码、合并、净化、切分"""
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = _decode_between(mm, parse_range.segments, parse_range.start, parse_range.end)
+    return list(iter_block_chapters([text.splitlines()], chapter_regex=chapter_regex,
+                                    clean_rules=clean_rules, lookahead=parse_range.lookahead))
+
+
+def _iter_parallel_chapters(
+        file_path: Path,
+        ranges: List[_ParseRange],
+        workers: int,
+        chapter_regex: str,
+        clean_rules: list | CleanRuleSet = None,
+        read_progress: Optional[Callable[[int], None]] = None
+) -> Iterator[Tuple[str, str]]:
+    """
+    用进程池解析各区间，按顺序拼接产出章节
+
+    子进程各自 mmap 源文件，只传递区间描述，不传字节内容；最多同时有
+    `2 * workers` 个区间在途，内存占用与文件大小无关。净化规则在子进程中
+    重新编译，调试模式下的规则命中统计不包含这些子进程。
+    """
+    rules = None if clean_rules is None else get_rule_set(clean_rules).rules
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        try:
+            for parse_range in ranges:
+                future = pool.submit(_parse_range, str(file_path), parse_range, chapter_regex, rules)
+                in_flight.append((parse_range.end, future))
+                if len(in_flight) >= 2 * workers:
+                    yield from _finished_range(in_flight.popleft(), read_progress)
+            while in_flight:
+                yield from _finished_range(in_flight.popleft(), read_progress)
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+
+def _finished_range(
+        item: Tuple[int, Any],
+        read_progress: Optional[Callable[[int], None]]
+) -> List[Tuple[str, str]]:
+    """等待一个区间解析完成，报告读到的位置，返回其中的章节"""
+    end, future = item
+    with stage('pool_wait'):
+        chapters = future.result()
+    if read_progress is not None:
+        read_progress(end)
+    return chapters
+
+
+def merge_lines(text, chapter_regex=CHAPTER_REGEX):
     """
     将不以标点符号结尾的行与下一行合并，保留段落结构
     但保留章节标题的独立性
 
     参数:
         text (str): 输入的文本字符串
+        chapter_regex (str): 章节正则，自定义时它匹配的行也保持独立
 
     返回:
         str: 处理后的文本
     """
-    # 定义中英文标点符号集合
-    punctuation = r'[。！？.?!…」*”)）]'
-    
-    # 定义章节标题模式
-    chapter_pattern = r"^\s*(?P<title>(?:第([零〇一二三四五六七八九十百千万\d]+|[IVXLCM]+)\s*[章节回卷部篇]|(?:Chapter|Section|Part|Book)\s+([IVXLCM]+|\d+)|(?:Prologue|Epilogue|Introduction|Preface|Foreword|Afterword|Appendix|Interlude|Prelude|Conclusion|Summary|Postscript)\b|序[章言]|前[言章]|引[言子]|楔子|尾声|后记|终章)[^\n]{0,50})"
-    
-    # 将文本按行分割
-    lines = text.splitlines()
-    merged_lines = []
-    i = 0
-    n = len(lines)
-
-    while i < n:
-        current_line = lines[i].rstrip()  # 移除行尾空白字符
-        
-        # 如果当前行是章节标题，单独保留
-        if re.match(chapter_pattern, current_line):
-            if merged_lines and merged_lines[-1]:  # 如果前一行不为空，添加一个空行
-                merged_lines.append("")
-            merged_lines.append(current_line)
-            merged_lines.append("")  # 章节标题后添加空行
-            i += 1
-            continue
-
-        # 如果是第一行
-        if len(merged_lines) == 0:
-            merged_lines.append(current_line)
-            i += 1
-            continue
-            
-        # 检查前一行是否以标点符号结尾
-        previous_line = merged_lines[-1].rstrip()
-        previous_ends_with_punctuation = re.search(punctuation + r'\s*$', previous_line) is not None
-        
-        # 如果前一行不以标点符号结尾，且当前行不为空，合并两行
-        if not previous_ends_with_punctuation and current_line:
-            # 但不要合并章节标题
-            if not re.match(chapter_pattern, current_line):
-                merged_lines[-1] += current_line
-                i += 1
+    merger = _LineMerger(merge_heading_pattern(chapter_regex))
+    return '\n'.join(merger.feed(text.splitlines()) + merger.flush())
+
+
+# 合并行时视为句末的中英文标点
+_SENTENCE_END = frozenset('。！？.?!…」*”)）')
+
+# merge_lines 识别标题时沿用原来的写法：不带任何正则标志；模块加载时编译一次，
+# `utils.chapter_index` 也直接使用它
+_MERGE_CHAPTER_PAT = re.compile(CHAPTER_REGEX)
+
+
+class _HeadingLinePattern:
+    """默认标题行之外，自定义章节正则匹配的行也单独成行"""
+
+    __slots__ = ('_match',)
+
+    def __init__(self, chapter_pat: re.Pattern):
+        self._match = chapter_pat.match
+
+    def match(self, line: str):
+        return _MERGE_CHAPTER_PAT.match(line) or self._match(line)
+
+
+@functools.lru_cache(maxsize=32)
+def merge_heading_pattern(chapter_regex: str = CHAPTER_REGEX):
+    """
+    合并行时单独成行的标题行：匹配默认正则（不带标志）的行，以及使用自定义
+    章节正则时能被它匹配的行（如 `【001】`），否则这类标题会和前后的正文
+    拼成一行。返回带 `match()` 的对象
+    """
+    if chapter_regex == CHAPTER_REGEX:
+        return _MERGE_CHAPTER_PAT
+    return _HeadingLinePattern(chapter_pattern(chapter_regex))
+
+
+class _LineMerger:
+    """
+    `merge_lines` 的流式实现：按块送入物理行，返回已确定的合并结果
+
+    合并结果的最后一行可能还会与后续行拼接，因此始终保留一行待定，
+    以片段列表的形式累积，确认不再变化后才 `join` 输出，全部送完后用
+    `flush()` 取出；句末标点通过字符集合判断。每个输入字符只被复制常数次，
+    总耗时与输入长度成线性。
+    """
+
+    def __init__(self, heading_pat=_MERGE_CHAPTER_PAT):
+        self._match_heading = heading_pat.match  # 单独成行的标题行，见 `merge_heading_pattern`
+        self._parts: Optional[List[str]] = None  # 待定行（相当于 merged_lines[-1]）的片段；[] 表示空行
+        self._ends_with_punctuation = False
+
+    def feed(self, lines: Iterable[str]) -> List[str]:
+        match_heading = self._match_heading
+        sentence_end = _SENTENCE_END
+        merged: List[str] = []
+        emit = merged.append
+        parts = self._parts
+        ends_with_punctuation = self._ends_with_punctuation
+
+        for line in lines:
+            current_line = line.rstrip()  # 移除行尾空白字符
+
+            # 如果当前行是章节标题，单独保留
+            if match_heading(current_line):
+                if parts is not None:
+                    emit(''.join(parts))
+                    if parts:  # 如果前一行不为空，添加一个空行
+                        emit("")
+                emit(current_line)
+                parts = []  # 章节标题后添加空行
+                ends_with_punctuation = False
                 continue
 
-        # 如果是空行，直接保留
-        if not current_line:
-            # 只有当前一行以标点结尾时才添加空行
-            if previous_ends_with_punctuation or not merged_lines[-1]:
-                merged_lines.append(current_line)
-            i += 1
-            continue
-        else:
-            merged_lines.append(current_line)
-            i += 1
-            
-    # 重新构建文本，保留原有段落结构
-    return '\n'.join(merged_lines)
+            # 如果是第一行
+            if parts is None:
+                parts = [current_line] if current_line else []
+                ends_with_punctuation = bool(current_line) and current_line[-1] in sentence_end
+                continue
+
+            # 如果前一行不以标点符号结尾，且当前行不为空，合并两行
+            if not ends_with_punctuation and current_line:
+                parts.append(current_line)
+                ends_with_punctuation = current_line[-1] in sentence_end
+                continue
+
+            # 如果是空行，只有当前一行以标点结尾（或前一行本身为空）时才保留
+            if not current_line:
+                if ends_with_punctuation or not parts:
+                    emit(''.join(parts))
+                    parts = []
+                    ends_with_punctuation = False
+                continue
+
+            emit(''.join(parts))
+            parts = [current_line]
+            ends_with_punctuation = current_line[-1] in sentence_end
 
+        self._parts = parts
+        self._ends_with_punctuation = ends_with_punctuation
+        return merged
 
-def clean_text(text: str, clean_rules: list = None) -> str:
+    def flush(self) -> List[str]:
+        """取出最后一行待定结果"""
+        parts, self._parts = self._parts, None
+        self._ends_with_punctuation = False
+        return [''.join(parts)] if parts is not None else []
+
+
+def clean_text(text: str, clean_rules: list | CleanRuleSet = None) -> str:
     """
     清理文本内容，移除不需要的字符和格式
     
     参数:
         text (str): 原始文本
-        clean_rules (list): 清理规则列表，默认为None使用默认规则
+        clean_rules (list | CleanRuleSet): 清理规则列表或预编译的规则集，
+            默认为None使用默认规则（见 `utils.text_cleaner.DEFAULT_CLEAN_RULES`）
         
     返回:
         str: 清理后的文本
@@ -239,42 +1039,14 @@ def clean_text(text: str, clean_rules: list = None) -> str:
         3. 移除常见的广告文本
         4. 移除乱码字符
         5. 标准化换行符
+
+    传入列表时每次调用都要重新编译；需要反复清理时请先用 `get_rule_set`
+    得到 `CleanRuleSet` 再传入。
     """
-    if clean_rules is None:
-        # 默认清理规则
-        clean_rules = [
-            # 移除行首行尾空白字符
-            (r'^\s+', '', '行首空白字符'),
-            (r'\s+$', '', '行尾空白字符'),
-            # 移除多余的空白字符（保留单个空格）
-            (r'[ \t]{2,}', ' ', '多余空白字符'),
-            # 移除常见的广告文本模式
-            (r'本书由.*?txt小说电子书下载', '', '广告文本1'),
-            (r'小说天堂.*?免费下载', '', '广告文本2'),
-            (r'请记住本书首发域名.*?。第一时间更新', '', '广告文本3'),
-            (r'电脑站.*?手机站.*?最新最快', '', '广告文本4'),
-            (r'【推荐下，.*?追书真的好用', '', '广告文本5'),
-            (r'天才一秒记住.*?，精彩小说无弹窗免费阅读！', '', '广告文本6'),
-            # 移除乱码字符（常见的乱码模式）
-            (r'□', '', '乱码字符1'),
-            (r'', '', '乱码字符2'),
-            (r'[-\uF8FF]', '', '私有区字符'),
-            # 标准化换行符
-            (r'\r\n', '\n', 'Windows换行符'),
-            (r'\r', '\n', 'Mac换行符'),
-            # 移除多余的空行（保留最多2个连续换行）
-            (r'\n{3,}', '\n\n', '多余空行'),
-        ]
-    
-    cleaned_text = text
-    for pattern, replacement, description in clean_rules:
-        try:
-            cleaned_text = re.sub(pattern, replacement, cleaned_text)
-        except re.error as e:
-            # 如果正则表达式有错误，跳过该规则
-            pass
-    
-    return cleaned_text.strip()
+    with stage('clean_text', len(text)) as st:
+        text = get_rule_set(clean_rules).clean(text)
+        st.add_output(len(text))
+    return text
 
 # -------------------------------------------------------------
 # 用法示例